@@ -3,18 +3,42 @@ import re
 import pickle
 import os
 import base64
+import functools
+import hashlib
 import pickle
+import random
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from email import message_from_bytes, policy
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from flask import session
+from api.spam_lexicon import SPAM_LEXICON
+from api.gmail_pool import SCOPES, build_gmail_service, get_gmail_pool
+from api import text_features
+from api.features import FEATURES  # Defined by the feature registry, kept importable from here
+from api.metrics import FEATURE_SECONDS, MESSAGE_BYTES, record_stage, submit_in_context, timed
+from api.text_features import (
+    LinkScan, ScanBudget, DOMAIN_RE, WHOLE_EMAIL,
+    get_feature_config, sender_domain, strip_tags, header_block
+)
 
 
 def load_model(filename):
+    digest = hashlib.sha256()
     with open(filename, 'rb') as file:
-        model = pickle.load(file)
-    print(f"Model loaded from {filename}")
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    if filename.endswith(".joblib"):
+        import joblib
+        # Arrays stay read-only pages of the file, shared by every process that loads it
+        model = joblib.load(filename, mmap_mode="r")
+    else:
+        with open(filename, 'rb') as file:
+            model = pickle.load(file)
+    # Cached classifications are keyed by this, so a different artifact never reads another model's rows
+    model.fingerprint = digest.hexdigest()[:16]
     return model
 
 
@@ -28,210 +52,493 @@ def extract_headers(email_text):
     Returns:
         dict: Extracted email headers
     '''
-    msg = message_from_string(email_text)
-    
-    # Extracting headers
-    email_data = {
-        "from": msg["From"],
-        "to": msg["To"],
-        "subject": msg["Subject"],
-        "date": msg["Date"],
-        "body": None  # Default to None if body extraction fails
-    }
-    
-    # Extract email body (handling different content types)
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-            
-            # Select only text/plain (ignore attachments)
-            if content_type == "text/plain" and "attachment" not in content_disposition:
-                charset = part.get_content_charset() or "utf-8"  # Default to utf-8 if None
-                email_data["body"] = part.get_payload(decode=True).decode(charset, errors="ignore")
-                break  # Stop at first valid body
-    else:
-        charset = msg.get_content_charset() or "utf-8"  # Default encoding
-        email_data["body"] = msg.get_payload(decode=True).decode(charset, errors="ignore")
-    
-    return email_data
+    return ParsedEmail(email_text).headers()
 
 def count_words(text):
     '''Counts the number of words in a text'''
-    words = re.findall(r"\b\w+\b", text)  # Extracts words correctly
-    return len(words)
+    return text_features.count_words(text)
 
 def count_links_and_domains(text):
     """Counts both full URLs and plain domain mentions."""
-    url_pattern = r"https?://[^\s<>\"']+"  # Full URLs
-    domain_pattern = r"\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,6}\b"  # Plain domains
-
-    urls = re.findall(url_pattern, text)
-    domains = re.findall(domain_pattern, text)
-
-    return len(set(urls + domains))  # Using `set()` to remove duplicates
+    return LinkScan(text, links=False).num_links(text)
 
 def has_html(email_text):
     """Check if an email contains an HTML part."""
-    msg = message_from_string(email_text)
-    return any(part.get_content_type() == "text/html" for part in msg.walk())
+    return ParsedEmail(email_text).has_html
 
 def count_attachments(email_text):
     """Count the number of attachments in an email."""
-    msg = message_from_string(email_text)
-    return sum(1 for part in msg.walk() if part.get_filename())  # Count parts that have a filename
+    return ParsedEmail(email_text).num_attachments
 
 def spam_score(text):
     """Calculate the spam score based on predefined spam words."""
-    SPAM_WORDS = [
-        "free", "win", "winner", "winnings", "money", "cash", "earn", "easy money",
-        "make money", "fast cash", "quick cash", "extra cash", "double your income",
-        "get rich", "financial freedom", "increase sales", "investment", 
-        "passive income", "work from home", "no experience needed", "limited time",
-        "instant cash", "credit", "debt relief", "bank transfer", "wire transfer", 
-        "fast loan", "no credit check", "lowest rate", "instant approval",
-        "offer", "discount", "prize", "reward", "bonus", "gift", "apply now",
-        "special deal", "hot deal", "lowest price", "save big", "best deal", 
-        "bargain", "buy now", "order now", "cheap", "affordable", "best price", 
-        "exclusive", "promo", "promotion", "limited offer", "free trial", 
-        "new customer", "subscription", "membership", "act fast", "expires soon",
-        "urgent", "hurry", "act now", "last chance", "final notice", "important", 
-        "as soon as possible", "time-sensitive", "one-time", "today only", 
-        "do it now", "limited stock", "this won’t last", "once in a lifetime",
-        "click", "click here", "click below", "open now", "access now",
-        "view online", "sign up", "register now", "confirm your details",
-        "log in", "update your account", "verify your identity", 
-        "secure your account", "your account is at risk", "security alert", 
-        "reset password", "your payment failed", "billing issue", "invoice attached",
-        "guarantee", "risk-free", "no risk", "100% free", "money-back", 
-        "satisfaction guaranteed", "no obligation", "hidden charges", 
-        "secret formula", "miracle", "exclusive deal", "instant cure", 
-        "congratulations", "you have been selected", "you are a winner",
-        "unsubscribe", "remove me", "opt-out", "this is not spam",
-        "why are you receiving this", "you received this email because",
-        "not interested?", "spam-free guarantee", "no more emails",
-        "bitcoin", "crypto", "blockchain", "ethereum", "trading", "forex", 
-        "broker", "binary options", "wallet", "crypto exchange", "payout", 
-        "account verification", "account update", "account locked", "secure login",
-        "miracle cure", "cure", "no prescription", "pharmacy", "drugs", 
-        "weight loss", "diet pill", "anti-aging", "instant results", "clinically proven",
-        "lottery", "jackpot", "lucky draw", "winning ticket", "unclaimed prize", 
-        "claim your reward", "sweepstakes", "mega millions", "powerball", 
-        "your lucky number", "your check is waiting",
-        "earn at home", "home-based business", "be your own boss", "online income",
-        "startup funding", "government grant", "high-paying job", "no skills required",
-        "mortgage rates", "real estate", "home loan", "house for sale", 
-        "foreclosure", "cheap property", "investment property", "flipping houses",
-        "identity verification", "social security number", "ssn", "bank account", 
-        "routing number", "password reset", "security question", "personal details",
-        "your computer is infected", "tech support", "fix your pc", "remote access",
-        "download now", "install this update", "your system is at risk", 
-        "trojan detected", "virus warning", "malware detected", "spyware removal",
-        "help us", "donate now", "urgent donation needed", "support our cause", 
-        "charity request", "nonprofit", "disaster relief", "emergency appeal",
-        "as seen on tv", "elon musk recommends", "warren buffet’s secret", 
-        "celebrity approved", "doctor recommended", "scientifically proven"
-    ]
-
-    text_lower = text.lower()
-    return sum(len(re.findall(rf"\b{word}\b", text_lower)) for word in SPAM_WORDS)
+    return SPAM_LEXICON.count(text)
+
+def spam_hits(text):
+    """Count how often each spam phrase occurs, so analysts can see which terms fired."""
+    return SPAM_LEXICON.hits(text)
 
 def count_suspicious_attachments(email_text):
     """Count the number of suspicious attachments in an email."""
-    msg = message_from_string(email_text)
-    dangerous_exts = {".exe", ".zip", ".rar", ".scr", ".iso", ".js", ".bat"}
-    
-    return sum(
-        1 for part in msg.walk()
-        if part.get_filename() and any(part.get_filename().lower().endswith(ext) for ext in dangerous_exts)
-    )
+    return ParsedEmail(email_text).num_suspicious_attachments
 
 def is_fake_domain(email_text):
     """Check if the email sender's domain is suspicious."""
-    msg = message_from_string(email_text)
-    email_from = msg["From"]
-    
-    fake_keywords = ["free", "money", "offer", "lottery", "deal", "promo", "cheap"]
-    
-    if email_from:
-        match = re.search(r'@([\w.-]+)', email_from)
-        if match:
-            domain = match.group(1).lower()
-            return any(keyword in domain for keyword in fake_keywords)
-    
-    return False
+    return ParsedEmail(email_text).is_fake_domain
 
 def count_suspicious_links(text):
     """Count the number of suspicious links in an email."""
-    suspicious_domains = {"bit.ly", "tinyurl.com", "t.co", "goo.gl", "ow.ly", "is.gd", "buff.ly"}
-    
-    links = re.findall(r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+", text)
-    
-    return sum(1 for link in links if any(domain in link for domain in suspicious_domains))
+    return LinkScan(text, urls=False).num_suspicious_links()
 
 def is_missing_to(email_text):
     """Check if the email is missing the 'To' field."""
-    msg = message_from_string(email_text)
-    return 1 if not msg["To"] else 0
+    return ParsedEmail(email_text).is_missing_to
 
 def count_recipients(email_text):
     """Count the number of recipients in the email."""
-    msg = message_from_string(email_text)
-    return len(msg["To"].split(",")) if msg["To"] else 0
+    return ParsedEmail(email_text).num_recipients
 
 def count_subject_words(email_text):
     """Count the number of words in the email subject."""
-    msg = message_from_string(email_text)
-    return len(msg["Subject"].split()) if msg["Subject"] else 0
+    return ParsedEmail(email_text).num_subject_words
 
 
-# Define the scope for reading Gmail messages
-SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+class ParsedEmail:
+    """
+    Parses a raw email once and derives every model feature from that parse.
 
-def authenticate_gmail():
-    """Authenticate and return Gmail API service per user."""
-    creds = None
-    token_folder = 'tokens'
-    os.makedirs(token_folder, exist_ok=True)
+    The MIME tree is walked a single time, on first use, to collect the HTML
+    flag, the attachment filenames and the first plain text and html body
+    parts; header-only features never walk it. The per-feature functions
+    above are thin wrappers around this class, so they give the same numbers
+    as before. The text features scan the regions and budgets set in the
+    feature config (see `api.text_features`), the whole email by default.
+
+    Parameters:
+        email_text (str): Raw email text
+    """
+
+    def __init__(self, email_text):
+        self.text = email_text
+        self.msg = message_from_string(email_text)
+        self._walked = False
+        self.scan_truncated = False  # Set when the scan time budget ran out
+        self._regions = {}
+
+    def _walk(self):
+        self._walked = True
+        self._has_html = False
+        self._attachment_filenames = []
+        self._body_part = None
+        self._html_part = None
+
+        if self.msg.is_multipart():
+            for part in self.msg.walk():
+                content_type = part.get_content_type()
+                if content_type == "text/html":
+                    self._has_html = True
+                    if self._html_part is None and "attachment" not in str(part.get("Content-Disposition")):
+                        self._html_part = part
 
+                filename = part.get_filename()
+                if filename:
+                    self._attachment_filenames.append(filename)
+
+                # First text/plain part that is not an attachment is the body
+                if self._body_part is None and content_type == "text/plain":
+                    if "attachment" not in str(part.get("Content-Disposition")):
+                        self._body_part = part
+        else:
+            self._has_html = self.msg.get_content_type() == "text/html"
+            self._html_part = self.msg if self._has_html else None
+            filename = self.msg.get_filename()
+            if filename:
+                self._attachment_filenames.append(filename)
+            self._body_part = self.msg
+
+    @property
+    def has_html(self):
+        if not self._walked:
+            self._walk()
+        return self._has_html
+
+    @property
+    def attachment_filenames(self):
+        if not self._walked:
+            self._walk()
+        return self._attachment_filenames
+
+    @property
+    def body(self):
+        """Decoded plain text body, or None if the email has none."""
+        if not self._walked:
+            self._walk()
+        if self._body_part is None:
+            return None
+        charset = self._body_part.get_content_charset() or "utf-8"  # Default to utf-8 if None
+        return self._body_part.get_payload(decode=True).decode(charset, errors="ignore")
+
+    def html(self):
+        """Decoded html body, or None if the email has none."""
+        if not self._walked:
+            self._walk()
+        if self._html_part is None:
+            return None
+        charset = self._html_part.get_content_charset() or "utf-8"
+        return (self._html_part.get_payload(decode=True) or b"").decode(charset, errors="ignore")
+
+    def region(self, name, max_chars=None):
+        """
+        Text of one scan region: raw, headers, text or html.
+
+        With `max_chars` the region is cut to that length, and an html body
+        is cut to it before its tags are stripped, which keeps the work
+        bounded on huge documents.
+        """
+        key = (name, max_chars)
+        if key not in self._regions:
+            self._regions[key] = self._region(name, max_chars)[:max_chars]
+        return self._regions[key]
+
+    def _region(self, name, max_chars):
+        if name == "raw":
+            return self.text
+        if name == "headers":
+            return header_block(self.text)
+        if name == "text":
+            if not self._walked:
+                self._walk()
+            if self._body_part is not None and self._body_part.get_content_type() == "text/plain":
+                return self.body
+        html = self.html()
+        return strip_tags(html[:max_chars]) if html else ""
+
+    def scan(self, feature, config, budget):
+        """Pieces of text a text feature scans under the config's plan and the message's budget."""
+        regions, max_chars = config.scan_plan(feature)
+        if regions == ("raw",):
+            return budget.chunks(self.text, max_chars)
+        return budget.chunks("\n".join(self.region(name, max_chars) for name in regions), max_chars)
+
+    def headers(self):
+        """Returns the display headers and body, same as `extract_headers`."""
+        return {
+            "from": self.msg["From"],
+            "to": self.msg["To"],
+            "subject": self.msg["Subject"],
+            "date": self.msg["Date"],
+            "body": self.body
+        }
+
+    @property
+    def num_attachments(self):
+        return len(self.attachment_filenames)
+
+    @property
+    def num_suspicious_attachments(self):
+        config = get_feature_config()
+        return sum(1 for filename in self.attachment_filenames if config.is_dangerous_filename(filename))
+
+    @property
+    def is_fake_domain(self):
+        email_from = self.msg["From"]
+        if email_from:
+            domain = sender_domain(email_from)
+            if domain:
+                return get_feature_config().is_fake_sender_domain(domain)
+        return False
+
+    @property
+    def is_missing_to(self):
+        return 1 if not self.msg["To"] else 0
+
+    @property
+    def num_recipients(self):
+        return len(self.msg["To"].split(",")) if self.msg["To"] else 0
+
+    @property
+    def num_subject_words(self):
+        return len(self.msg["Subject"].split()) if self.msg["Subject"] else 0
+
+    def features(self):
+        """
+        Returns all model features as a dict keyed by feature name.
+
+        Each feature's time goes to the feature histogram (see `api.metrics`).
+        Both link features are timed as num_links when they share one pass,
+        and the MIME walk is timed on its own as mime_walk.
+        """
+        clock = time.perf_counter
+        timings = {}
+        config = get_feature_config()
+        budget = ScanBudget(config.scan_time_budget)
+        start = clock()
+        num_words = sum(count_words(chunk) for chunk in self.scan("num_words", config, budget))
+        timings["num_words"], start = clock() - start, clock()
+        spam = sum(spam_score(chunk) for chunk in self.scan("spam_score", config, budget))
+        timings["spam_score"], start = clock() - start, clock()
+
+        # One pass over the URLs for both link features when they scan the same text
+        shared = config.scan_plan("num_links") == config.scan_plan("num_suspicious_links")
+        links, num_suspicious_links = set(), 0
+        for chunk in self.scan("num_links", config, budget):
+            scan = LinkScan(chunk, links=shared)
+            links.update(scan.urls)
+            links.update(DOMAIN_RE.findall(chunk))
+            num_suspicious_links += scan.num_suspicious_links(config)
+        timings["num_links"], start = clock() - start, clock()
+        if not shared:
+            num_suspicious_links = sum(
+                LinkScan(chunk, urls=False).num_suspicious_links(config)
+                for chunk in self.scan("num_suspicious_links", config, budget)
+            )
+            timings["num_suspicious_links"], start = clock() - start, clock()
+        self.scan_truncated = budget.exhausted
+        if not self._walked:
+            self._walk()
+            timings["mime_walk"] = clock() - start
+
+        features = {
+            "num_words": num_words,
+            "num_links": len(links),
+            "spam_score": spam,
+            "num_suspicious_links": num_suspicious_links,
+        }
+        for name in ("num_attachments", "num_suspicious_attachments", "has_html", "is_fake_domain",
+                     "is_missing_to", "num_recipients", "num_subject_words"):
+            start = clock()
+            features[name] = getattr(self, name)
+            timings[name] = clock() - start
+        FEATURE_SECONDS.observe_many(timings)
+        return features
+
+    def feature_vector(self):
+        """Returns the model features as a list of ints in `FEATURES` order."""
+        features = self.features()
+        return [int(features[name]) for name in FEATURES]
+
+
+# Concurrency and retry settings for message downloads
+GMAIL_FETCH_WORKERS = int(os.environ.get("GMAIL_FETCH_WORKERS", 8))
+GMAIL_MAX_RETRIES = int(os.environ.get("GMAIL_MAX_RETRIES", 4))
+GMAIL_RETRY_BACKOFF = float(os.environ.get("GMAIL_RETRY_BACKOFF", 0.5))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Transient transport failures of httplib2: timeouts, dropped connections and TLS errors
+RETRY_ERRORS = (socket.timeout, ConnectionError, ssl.SSLError)
+
+def get_gmail_credentials():
+    """Load, refresh or create the Gmail credentials of the user in the session."""
     email = session.get('user_email')
     if not email:
         raise Exception("User email not found in session.")
 
-    token_path = os.path.join(token_folder, f"{email}.pickle")
+    creds = get_gmail_pool().credentials(email)
+    if creds is None:
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+        creds = flow.run_local_server(port=0)
 
-    if os.path.exists(token_path):
-        with open(token_path, "rb") as token_file:
-            creds = pickle.load(token_file)
+        # Get actual verified email
+        service = build_gmail_service(creds)
+        profile = service.users().getProfile(userId='me').execute()
+        real_email = profile['emailAddress'].lower()
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
+        # Save updated verified token
+        get_gmail_pool().store(real_email, creds)
 
-            # Get actual verified email
-            service = build('gmail', 'v1', credentials=creds)
-            profile = service.users().getProfile(userId='me').execute()
-            real_email = profile['emailAddress'].lower()
+        # Update session to real email
+        session['user_email'] = real_email
 
-            # Save updated verified token
-            token_path = os.path.join(token_folder, f"{real_email}.pickle")
-            with open(token_path, "wb") as token_file:
-                pickle.dump(creds, token_file)
+    return creds
 
-            # Update session to real email
-            session['user_email'] = real_email
-
-    return build('gmail', 'v1', credentials=creds)
+def authenticate_gmail():
+    """Authenticate and return Gmail API service per user."""
+    return gmail_service_factory()()
+
+def gmail_service_factory():
+    """
+    Returns a callable that gives the Gmail service of the user in the session.
+
+    The service comes from the process-wide pool: it is built once per user
+    and each thread that uses it gets its own keep-alive connection. The
+    credentials are checked here because the Flask session is not available
+    inside worker threads.
+    """
+    get_gmail_credentials()
+    email = session['user_email']
+    pool = get_gmail_pool()
+    return lambda: pool.service(email)
+
+def execute_with_retry(request, max_retries=GMAIL_MAX_RETRIES, backoff=GMAIL_RETRY_BACKOFF):
+    """
+    Execute a Gmail API request, retrying 429 and 5xx responses and transport
+    errors (`RETRY_ERRORS`) with exponential backoff.
+    """
+    from googleapiclient.errors import HttpError
+    for attempt in range(max_retries + 1):
+        try:
+            return request.execute()
+        except HttpError as error:
+            if error.resp.status not in RETRY_STATUSES or attempt == max_retries:
+                raise
+        except RETRY_ERRORS:
+            if attempt == max_retries:
+                raise
+        time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
 
 
 
 def extract_raw_email(email_bytes):
     """Reconstructs a raw email with human-readable plain text body and attachments."""
     msg = message_from_bytes(email_bytes, policy=policy.default)
+    raw_email, _ = _reconstruct_email(msg, _encode_attachment)
+    return raw_email
+
+
+def _encode_attachment(part):
+    """Decodes an attachment and base64-encodes it on one line, or returns None if it is empty."""
+    payload = part.get_payload(decode=True)
+    return base64.b64encode(payload).decode("utf-8") if payload else None
+
+
+BASE64_CHARS_RE = re.compile(r"[A-Za-z0-9+/]*")
+# Last quad of a canonical payload: padding only with zero bits after the last full byte
+BASE64_LAST_QUAD_RE = re.compile(r"[A-Za-z0-9+/]{4}|[A-Za-z0-9+/][AQgw]==|[A-Za-z0-9+/]{2}[AEIMQUYcgkosw048]=")
+
+# A body that starts with lines of base64 characters only, right after a blank line
+BASE64_BLOB_RE = re.compile(rb"\n\r?\n([A-Za-z0-9+/=\r\n]*[A-Za-z0-9+/=])(?=\r?\n)")
+BASE64_LAST_QUAD_BYTES_RE = re.compile(BASE64_LAST_QUAD_RE.pattern.encode())
+BASE64_BLOB_MIN_BYTES = 4096  # Smaller bodies are cheaper to parse than to set aside
+BLOB_MARKER = b"\x00blob"
+BLOB_TOKEN_RE = re.compile("\x00blob(\\d+)\x00")
+BASE64_SEPARATORS = bytes.maketrans(b"+/=", b"   ")
+
+
+def _is_canonical_base64(encoded):
+    """True if `b64encode(b64decode(encoded)) == encoded`."""
+    if len(encoded) % 4:
+        return False
+    return not encoded or bool(
+        BASE64_CHARS_RE.fullmatch(encoded, 0, len(encoded) - 4)
+        and BASE64_LAST_QUAD_RE.fullmatch(encoded, len(encoded) - 4)
+    )
+
 
+def _is_canonical_base64_span(email_bytes, start, end):
+    """`_is_canonical_base64` for a run of base64 characters and line breaks in `email_bytes`."""
+    line_breaks = email_bytes.count(b"\r", start, end) + email_bytes.count(b"\n", start, end)
+    padding = email_bytes.count(b"=", start, end)
+    last_quad = email_bytes[max(start, end - 16):end].translate(None, b"\r\n")[-4:]
+    return (
+        (end - start - line_breaks) % 4 == 0
+        and last_quad.count(b"=") == padding
+        and BASE64_LAST_QUAD_BYTES_RE.fullmatch(last_quad) is not None
+    )
+
+
+def _base64_tokens(encoded_attachment):
+    """Lowercased letter and digit runs of a base64 payload, the words `count_words` finds in it."""
+    if isinstance(encoded_attachment, str):
+        encoded_attachment = encoded_attachment.encode("ascii")
+    return bytes(encoded_attachment).lower().translate(BASE64_SEPARATORS, b"\r\n").decode("ascii").split()
+
+
+def _attachment_base64(part):
+    """
+    Same string as `_encode_attachment`, taken from the transfer-encoded payload when possible.
+
+    A canonical base64 attachment only has its line breaks removed; anything
+    else (other encodings, stray characters, odd padding) is decoded and
+    re-encoded like before.
+    """
+    if _is_base64_part(part):
+        encoded = "".join(part.get_payload().split())
+        if _is_canonical_base64(encoded):
+            return encoded or None
+    return _encode_attachment(part)
+
+
+def _is_base64_part(part):
+    return part.get("Content-Transfer-Encoding", "").strip().lower() == "base64" and not part.is_multipart()
+
+
+class _MemoizedHeaderPolicy(policy.EmailPolicy):
+    """`policy.default`, except that a header value is parsed once instead of on every access."""
+
+    def header_fetch_parse(self, name, value):
+        return _parse_header(name, value)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_header(name, value):
+    # Parsed headers are immutable strings, so messages can share them
+    return policy.default.header_fetch_parse(name, value)
+
+
+GMAIL_POLICY = _MemoizedHeaderPolicy()
+
+
+def _parse_gmail_message(email_bytes):
+    """
+    Parses raw email bytes, keeping large base64 attachment bodies out of the parser.
+
+    Every body of at least BASE64_BLOB_MIN_BYTES base64 lines is swapped for a
+    short placeholder before parsing, and stays a memoryview of the original
+    bytes that is checked with byte counts instead of being joined. Base64 lines never look like a boundary, so the MIME tree is the
+    same. If a set-aside body turns out to be needed in decoded form (a
+    plain text body, or an attachment that is not canonical base64), the
+    message is parsed again in full.
+
+    Returns:
+        tuple: (message, dict of id(part) -> base64 payload of the set-aside attachments)
+    """
+    view = memoryview(email_bytes)
+    spans, pieces, position = [], [], 0
+    if BLOB_MARKER not in email_bytes:
+        for match in BASE64_BLOB_RE.finditer(email_bytes):
+            start, end = match.span(1)
+            if end - start >= BASE64_BLOB_MIN_BYTES:
+                pieces += [view[position:start], BLOB_MARKER + b"%d\x00" % len(spans)]
+                spans.append((start, end))
+                position = end
+    if not spans:
+        return message_from_bytes(email_bytes, policy=GMAIL_POLICY), {}
+
+    msg = message_from_bytes(b"".join(pieces + [view[position:]]), policy=GMAIL_POLICY)
+    payloads = {}
+    for part in msg.walk():
+        if part.is_multipart():
+            continue  # Preambles and epilogues are never read
+        payload = part.get_payload()
+        if "\x00blob" not in payload:
+            continue
+        is_attachment = "attachment" in str(part.get("Content-Disposition"))
+        if is_attachment and _is_base64_part(part):
+            # The whole body is one set-aside run, give or take surrounding line breaks
+            segments = BLOB_TOKEN_RE.split(payload)
+            if len(segments) == 3 and not segments[0].strip() and not segments[2].strip():
+                start, end = spans[int(segments[1])]
+                if _is_canonical_base64_span(email_bytes, start, end):
+                    payloads[id(part)] = view[start:end]
+                    continue
+        elif not is_attachment and part.get_content_type() != "text/plain":
+            continue  # Inline images and html parts are never decoded
+        return message_from_bytes(email_bytes, policy=GMAIL_POLICY), {}
+    return msg, payloads
+
+
+def _reconstruct_email(msg, encode_attachment, inline_attachments=True):
+    """
+    Builds the `extract_raw_email` text of a parsed message.
+
+    Parameters:
+        msg (EmailMessage): Message parsed with `policy.default`
+        encode_attachment (callable): part -> base64 payload, or None to leave the attachment out
+        inline_attachments (bool): Write the base64 payloads into the text, or leave their lines empty
+
+    Returns:
+        tuple: (raw email text, base64 payload of every attachment)
+    """
     # Extract headers
     email_headers = {
         "Message-ID": msg["Message-ID"],
@@ -274,10 +581,10 @@ def extract_raw_email(email_bytes):
             elif content_disposition and "attachment" in content_disposition:
                 # Extract attachment
                 filename = part.get_filename()
-                payload = part.get_payload(decode=True)
+                encoded_attachment = encode_attachment(part) if filename else None
 
-                if filename and payload:
-                    attachments.append((filename, payload))
+                if filename and encoded_attachment:
+                    attachments.append((filename, encoded_attachment))
 
     else:
         # Handle single-part email (non-multipart)
@@ -293,19 +600,84 @@ def extract_raw_email(email_bytes):
         raw_email.append(plain_text_body + "\n")  # Ensuring plain text is inserted directly
 
     # Attachments (if any)
-    for filename, payload in attachments:
-        encoded_attachment = base64.b64encode(payload).decode("utf-8")
+    for filename, encoded_attachment in attachments:
         raw_email.append(f"--{boundary}")
         raw_email.append(f"Content-Type: application/octet-stream")
         raw_email.append(f"Content-Disposition: attachment; filename=\"{filename}\"")
         raw_email.append("Content-Transfer-Encoding: base64\n")
-        raw_email.append(encoded_attachment + "\n")
+        raw_email.append((encoded_attachment if inline_attachments else "") + "\n")
 
     # End boundary
     raw_email.append(f"--{boundary}--\n")
 
     # Convert list to full email string
-    return "\n".join(raw_email)
+    return "\n".join(raw_email), [encoded_attachment for _, encoded_attachment in attachments]
+
+
+def _html_part(msg):
+    for part in msg.walk():
+        if part.get_content_type() == "text/html" and "attachment" not in str(part.get("Content-Disposition")):
+            return part
+    return None
+
+
+class ParsedGmailMessage(ParsedEmail):
+    """
+    Features and headers of a raw Gmail message, without going through `extract_raw_email`.
+
+    The message is parsed from its original bytes once, with large base64
+    attachment bodies kept out of the parser. Attachments are never decoded:
+    canonical base64 payloads are reused as they are and only the word and
+    spam phrase counts are taken from them, since those are the only features
+    base64 text can contribute to. Everything else is read from the
+    reconstructed email with its attachment lines left empty, so the feature
+    vector is the same as `ParsedEmail(extract_raw_email(raw).strip())`.
+
+    Parameters:
+        email_bytes (bytes): Raw RFC 822 message as downloaded from Gmail
+    """
+
+    def __init__(self, email_bytes):
+        msg, set_aside = _parse_gmail_message(email_bytes)
+        self.source = msg
+        self.email_bytes = email_bytes
+
+        def encode_attachment(part):
+            if id(part) in set_aside:
+                return set_aside[id(part)]
+            return _attachment_base64(part)
+
+        email_text, self.attachment_payloads = _reconstruct_email(msg, encode_attachment, inline_attachments=False)
+        super().__init__(email_text.strip())
+
+    def html(self):
+        # The reconstruction has no html part, so it comes from the original message
+        part = _html_part(self.source)
+        if part is not None and "\x00blob" in part.get_payload():
+            # Set aside while parsing, so it is read from a full parse
+            part = _html_part(message_from_bytes(self.email_bytes, policy=GMAIL_POLICY))
+        if part is None:
+            return None
+        charset = part.get_content_charset() or "utf-8"
+        return (part.get_payload(decode=True) or b"").decode(charset, errors="ignore")
+
+    def features(self):
+        features = super().features()
+        # Base64 attachments only count towards features that scan the whole email.
+        # Each payload sits on its own line, so its counts simply add up.
+        config = get_feature_config()
+        count_words_in = config.scan_plan("num_words") == WHOLE_EMAIL
+        count_spam_in = config.scan_plan("spam_score") == WHOLE_EMAIL
+        if self.scan_truncated or not (count_words_in or count_spam_in):
+            return features
+        for encoded_attachment in self.attachment_payloads:
+            tokens = _base64_tokens(encoded_attachment)
+            if count_words_in:
+                features["num_words"] += len(tokens)
+            if count_spam_in:
+                features["spam_score"] += SPAM_LEXICON.count_tokens(tokens)
+        return features
+
 
 # def fetch_and_format_emails(label='INBOX'):
 #     """Fetch and reconstruct the latest Gmail inbox messages in proper raw format."""
@@ -337,10 +709,8 @@ def extract_raw_email(email_bytes):
 #         # print("=" * 100)
 #     return raw_emails
 
-def fetch_and_format_emails(label='INBOX', max_results=30, page_token=None):
-    """Fetch Gmail inbox messages with pagination support."""
-    service = authenticate_gmail()
-    
+def list_message_ids(service, label='INBOX', max_results=30, page_token=None):
+    """List one page of message IDs for a label. Returns (message_ids, next_page_token)."""
     request_kwargs = {
         'userId': 'me',
         'labelIds': [label],
@@ -349,23 +719,91 @@ def fetch_and_format_emails(label='INBOX', max_results=30, page_token=None):
     if page_token:
         request_kwargs['pageToken'] = page_token
 
-    results = service.users().messages().list(**request_kwargs).execute()
-    messages = results.get('messages', [])
-    next_page_token = results.get('nextPageToken')
-    
-    if not messages:
+    with timed("gmail_list"):
+        results = execute_with_retry(service.users().messages().list(**request_kwargs))
+    message_ids = [msg['id'] for msg in results.get('messages', [])]
+    return message_ids, results.get('nextPageToken')
+
+def fetch_raw_messages(message_ids, service_factory, max_workers=GMAIL_FETCH_WORKERS):
+    """
+    Download messages in raw format, several at a time.
+
+    Parameters:
+        message_ids (list): Gmail message IDs
+        service_factory (callable): Returns a Gmail service, called once per worker thread and call
+        max_workers (int): Maximum number of concurrent downloads
+
+    Returns:
+        list: Raw email bytes in the same order as message_ids, None where Gmail sent no content
+    """
+    fetch = raw_message_fetcher(service_factory)
+    with timed("gmail_fetch"):
+        if max_workers <= 1 or len(message_ids) <= 1:
+            return [fetch(msg_id) for msg_id in message_ids]
+
+        executor = fetch_executor(max_workers)
+        return [future.result() for future in [submit_in_context(executor, fetch, msg_id) for msg_id in message_ids]]
+
+def iter_raw_messages(message_ids, service_factory, max_workers=GMAIL_FETCH_WORKERS):
+    """
+    Same downloads as `fetch_raw_messages`, yielded as each one finishes.
+
+    Downloads that have not started are cancelled when the caller stops iterating.
+
+    Yields:
+        tuple: (message_id, raw email bytes or None)
+    """
+    fetch = raw_message_fetcher(service_factory)
+    if max_workers <= 1 or len(message_ids) <= 1:
+        for msg_id in message_ids:
+            yield msg_id, fetch(msg_id)
+        return
+
+    executor = fetch_executor(max_workers)
+    futures = {submit_in_context(executor, fetch, msg_id): msg_id for msg_id in message_ids}
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def raw_message_fetcher(service_factory):
+    """Returns fetch(msg_id) -> raw email bytes, using one Gmail service per calling thread."""
+    thread_state = threading.local()
+
+    def fetch(msg_id):
+        start = time.perf_counter()
+        if not hasattr(thread_state, 'service'):
+            thread_state.service = service_factory()
+        request = thread_state.service.users().messages().get(userId='me', id=msg_id, format='raw')
+        raw_email_b64 = execute_with_retry(request).get('raw')
+        raw_email_bytes = base64.urlsafe_b64decode(raw_email_b64) if raw_email_b64 else None
+        record_stage("gmail_get", time.perf_counter() - start)
+        MESSAGE_BYTES.inc(len(raw_email_bytes or b""), "gmail")
+        return raw_email_bytes
+
+    return fetch
+
+@functools.lru_cache(maxsize=None)
+def fetch_executor(max_workers):
+    """Download threads live as long as the process, so their Gmail connections are reused across pages."""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmail-fetch")
+
+def fetch_and_format_emails(label='INBOX', max_results=30, page_token=None,
+                            service_factory=None, max_workers=GMAIL_FETCH_WORKERS):
+    """Fetch Gmail inbox messages with pagination support."""
+    if service_factory is None:
+        service_factory = gmail_service_factory()
+
+    message_ids, next_page_token = list_message_ids(service_factory(), label, max_results, page_token)
+    if not message_ids:
         return [], None
 
     raw_emails = []
-    for msg in messages:
-        msg_id = msg['id']
-        msg_data = service.users().messages().get(userId='me', id=msg_id, format='raw').execute()
-
-        raw_email_b64 = msg_data.get('raw')
-        if raw_email_b64:
-            raw_email_bytes = base64.urlsafe_b64decode(raw_email_b64)
-            formatted_email = extract_raw_email(raw_email_bytes)
-            raw_emails.append(formatted_email)
+    for raw_email_bytes in fetch_raw_messages(message_ids, service_factory, max_workers):
+        if raw_email_bytes:
+            raw_emails.append(extract_raw_email(raw_email_bytes))
 
     return raw_emails, next_page_token
 
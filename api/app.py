@@ -1,124 +1,491 @@
 # create a flask app
-from flask import Flask, request, jsonify, render_template, redirect, session
+from flask import Flask, Response, request, jsonify, render_template, stream_template, redirect, session, abort
 from flask_cors import CORS
-import random
-from uuid import uuid4
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import FunctionTransformer
-import pickle
-import pandas as pd
-import re
-from email import message_from_string
+import numpy as np
+import os
+import json
+import base64
+import binascii
+import logging
+import asyncio
+import contextvars
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException, ServiceUnavailable
 from api.all_functions import (
-    extract_headers, count_words, count_links_and_domains, has_html,
-    count_attachments, count_suspicious_attachments, spam_score, count_suspicious_links,
-    is_fake_domain, is_missing_to, count_recipients, count_subject_words,
-    load_model, fetch_and_format_emails
+    ParsedEmail, FEATURES,
+    gmail_service_factory, list_message_ids, fetch_raw_messages, iter_raw_messages, ParsedGmailMessage
 )
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-
-
-def transform_email(message_text):
-    """Transforms an email message into a DataFrame of features"""
-
-    features = [
-    "num_words", "num_links", "num_attachments", "num_suspicious_attachments",
-    "has_html", "spam_score", "num_suspicious_links", "is_fake_domain",
-    "is_missing_to", "num_recipients", "num_subject_words"
-]
-    email_text = message_text[0].strip()
-    headers = extract_headers(email_text)
-    
-    data = {
-        "email_id": str(uuid4()),  # Generate a unique ID
-        "from": headers["from"],
-        "to": headers["to"],
-        "subject": headers["subject"],
-        "date": headers["date"],
-        "body": headers["body"],
-        "num_words": count_words(email_text),
-        "num_links": count_links_and_domains(email_text),
-        "num_attachments": count_attachments(email_text),
-        "num_suspicious_attachments": count_suspicious_attachments(email_text),
-        "has_html": has_html(email_text),
-        "spam_score": spam_score(email_text),
-        "num_suspicious_links": count_suspicious_links(email_text),
-        "is_fake_domain": is_fake_domain(email_text),
-        "is_missing_to": is_missing_to(email_text),
-        "num_recipients": count_recipients(email_text),
-        "num_subject_words": count_subject_words(email_text),
-    }
-    return pd.DataFrame([data])[features].astype(int)
-
-
-# Define a pipeline to process emails
-email_pipeline = Pipeline([
-    ("transformer", FunctionTransformer(transform_email)),
-    ("classifier", load_model("re_complement_naive_bayes_model.pkl"))  # Load a pre-trained model
-])
+from api.classification_cache import get_cache
+from api.mailbox_sync import MAILBOX_SYNC, get_mailbox_index
+from api.evaluation import evaluate_stream
+from api.model_registry import ModelUnavailable, get_registry, resolve_artifact
+from api.inference import predict_with_proba
+from api.rules import get_prefilter, matrix_columns
+from api.cascade import cascade_classify, cascade_fingerprint
+from api.prefetch import PREFETCH_ENABLED, COUNTERS as PREFETCH_COUNTERS, get_prefetcher
+from api import metrics
+from api.metrics import submit_in_context, timed
+
+
+# Models are served from the registry (see api/model_registry.py) and loaded on first use
+MODEL_ADMIN_TOKEN = os.environ.get("MODEL_ADMIN_TOKEN")
+# Load every model at import, for servers that import the app once and then fork workers (gunicorn --preload)
+if os.environ.get("PRELOAD_MODELS", "0") == "1":
+    get_registry().warm()
+
+# Set LOG_LEVEL=DEBUG to log every classified row
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger(__name__)
+
+# Send the inbox and spam pages row by row while their messages are classified
+STREAM_VIEWS = os.environ.get("STREAM_VIEWS", "0") == "1"
+
+# Rows per page of the model-vs-Gmail comparison
+COMPARISON_PER_PAGE = int(os.environ.get("COMPARISON_PER_PAGE", 20))
+
+# Async serving mode (see api/asgi.py) and the executor it runs feature extraction on
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "0") == "1"
+EXTRACTION_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("EXTRACTION_WORKERS", 4)))
+
+# The model was fitted on a DataFrame; the batch path feeds it a plain matrix in the same column order
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 # function to test the model
 def test_naive_bayes_model(email_text):
     """
     Function to test the logistic regression model
     """
-    return email_pipeline.predict([email_text])[0]
-
-
-def evaluate_model_vs_gmail(paginate=False, page=1, per_page=20):
-    inbox_emails, _ = fetch_and_format_emails(label='INBOX')
-    spam_emails, _ = fetch_and_format_emails(label='SPAM')
-
-    all_results = []
-    y_true = []  # Gmail's label
-    y_pred = []  # Model's prediction
-
-    # From inbox (Gmail says NOT SPAM)
-    for email_text in inbox_emails:
-        headers = extract_headers(email_text)
-        prediction = int(test_naive_bayes_model(email_text))
-
-        all_results.append({
-            "subject": headers.get("subject", "(No Subject)"),
-            "from": headers.get("from", "(Unknown)"),
-            "date": headers.get("date", "(Unknown Date)"),
-            "gmail_label": "NOT_SPAM",
-            "model_label": "SPAM" if prediction == 1 else "NOT_SPAM"
-        })
-        y_true.append("NOT_SPAM")
-        y_pred.append("SPAM" if prediction == 1 else "NOT_SPAM")
-
-    # From spam folder (Gmail says SPAM)
-    for email_text in spam_emails:
-        headers = extract_headers(email_text)
-        prediction = int(test_naive_bayes_model(email_text))
-
-        all_results.append({
-            "subject": headers.get("subject", "(No Subject)"),
-            "from": headers.get("from", "(Unknown)"),
-            "date": headers.get("date", "(Unknown Date)"),
-            "gmail_label": "SPAM",
-            "model_label": "SPAM" if prediction == 1 else "NOT_SPAM"
-        })
-        y_true.append("SPAM")
-        y_pred.append("SPAM" if prediction == 1 else "NOT_SPAM")
-
-    # Compute metrics
-    metrics = {
-        "accuracy": round(accuracy_score(y_true, y_pred), 3),
-        "precision": round(precision_score(y_true, y_pred, pos_label="SPAM"), 3),
-        "recall": round(recall_score(y_true, y_pred, pos_label="SPAM"), 3),
-        "f1": round(f1_score(y_true, y_pred, pos_label="SPAM"), 3)
-    }
-
-    # Pagination logic
-    if paginate:
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_results = all_results[start:end]
-        return paginated_results, metrics, len(all_results)
-    
-    return all_results, metrics, len(all_results)
+    return classify_batch([email_text])[0]["label"]
+
+
+def classify_batch(email_texts, model=None):
+    """
+    Classifies a list of raw emails with a single model call.
+
+    Each email is parsed once for both its features and its display headers,
+    then the whole N x 11 matrix goes through the classifier in one go.
+
+    Parameters:
+        email_texts (list): Raw email texts
+        model (str): Registry name of the model to use, None for the default one
+
+    Returns:
+        list: One dict per email with subject, from, date, label, spam_probability and features
+    """
+    with timed("parse"):
+        parsed_emails = [ParsedEmail(email_text.strip()) for email_text in email_texts]
+    return classify_parsed(parsed_emails, model)
+
+
+def classify_parsed(parsed_emails, model=None):
+    """Same as `classify_batch`, for emails that are already parsed."""
+    if not parsed_emails:
+        return []
+
+    with timed("features"):
+        feature_rows = [parsed.feature_vector() for parsed in parsed_emails]
+    labels, probabilities = predict(feature_rows, model)
+    return result_rows(parsed_emails, feature_rows, labels, probabilities)
+
+
+def classify_raw(raw_messages, model=None):
+    """
+    Parses and classifies raw Gmail messages, through the cascade (api/cascade.py)
+    when CASCADE is on and the model has a measured cascade setting.
+
+    Returns:
+        tuple: (parsed messages, feature rows, labels, spam probabilities, stage of each message:
+        1 when the cascade settled it on a prefix, 2 when the whole message was read)
+    """
+    setting = get_registry().get(model).cascade
+    if setting is not None:
+        return cascade_classify(raw_messages, lambda rows: predict(rows, model),
+                                setting["spam_threshold"], setting["ham_threshold"], setting["prefix_bytes"])
+    with timed("parse"):
+        parsed_emails = [ParsedGmailMessage(raw_email_bytes) for raw_email_bytes in raw_messages]
+    with timed("features"):
+        feature_rows = [parsed.feature_vector() for parsed in parsed_emails]
+    labels, probabilities = predict(feature_rows, model) if feature_rows else ([], [])
+    return parsed_emails, feature_rows, labels, probabilities, np.full(len(feature_rows), 2, dtype=np.int8)
+
+
+def result_rows(parsed_emails, feature_rows, labels, probabilities, stages=None):
+    """
+    Display rows of classified emails.
+
+    Rows the cascade settled on a prefix are marked "stage": "prefix": their
+    body features are those of the prefix, so `rescore_rows` leaves them be.
+    """
+    results = []
+    for index, (parsed, features, label, probability) in enumerate(
+            zip(parsed_emails, feature_rows, labels, probabilities)):
+        headers = parsed.headers()
+        row = {
+            "subject": headers["subject"],
+            "from": headers["from"],
+            "date": headers["date"],
+            "label": int(label),
+            "spam_probability": float(probability),
+            "features": features
+        }
+        if stages is not None and stages[index] == 1:
+            row["stage"] = "prefix"
+        results.append(row)
+    return results
+
+
+def predict(feature_rows, model=None):
+    """
+    Runs feature rows through a registry model, with its NumPy kernel when it has one.
+
+    With PREFILTER_RULES set, rows a pre-filter rule fires on are labelled
+    spam with probability 1 and only the others go through the model.
+
+    Returns:
+        tuple: (labels, spam probabilities) as NumPy arrays
+    """
+    entry = get_registry().get(model)
+    X = np.array(feature_rows, dtype=np.int64).reshape(len(feature_rows), len(FEATURES))
+    metrics.MESSAGES.inc(len(X), entry.name)
+    labels = np.ones(len(X), dtype=np.int64)
+    probabilities = np.ones(len(X))
+    rows = slice(None)
+    prefilter = get_prefilter()
+    if prefilter is not None:
+        with timed("prefilter"):
+            fired = prefilter.evaluate(matrix_columns(X))
+            rows = fired < 0
+        for name, count in prefilter.counts(fired).items():
+            if count:
+                metrics.PREFILTERED.inc(count, name)
+    X = X[rows]
+    if len(X):
+        with timed("predict"):
+            model_labels, model_probabilities = predict_with_proba(entry.model, X)
+        labels[rows] = model_labels
+        probabilities[rows] = model_probabilities[:, entry.spam_column]
+    return labels, probabilities
+
+
+def rescore_rows(rows, model=None):
+    """
+    Relabels classified rows with a model from their stored features, without parsing anything.
+
+    Rows the cascade settled on a prefix keep their label: their features
+    are not the whole message's.
+    """
+    full_rows = [index for index, row in enumerate(rows) if row.get("stage") != "prefix"]
+    if not full_rows:
+        return rows
+    labels, probabilities = predict([rows[index]["features"] for index in full_rows], model)
+    rescored = list(rows)
+    for index, label, probability in zip(full_rows, labels, probabilities):
+        rescored[index] = {**rows[index], "label": int(label), "spam_probability": float(probability)}
+    return rescored
+
+
+def classify_message_ids(message_ids, service_factory, model=None):
+    """
+    Classifies Gmail messages by ID.
+
+    Messages already classified by the current model come from the local
+    cache, so only new message IDs are downloaded and run through the model.
+
+    Returns:
+        dict: message_id -> row, missing IDs Gmail returned no content for
+    """
+    with timed("cache_lookup"):
+        rows = get_cache().get_many(message_ids, model_fingerprint(model))
+
+    missing_ids = [message_id for message_id in message_ids if message_id not in rows]
+    if missing_ids:
+        rows.update(classify_raw_messages(missing_ids, fetch_raw_messages(missing_ids, service_factory), model))
+
+    return rows
+
+
+def model_fingerprint(model=None):
+    # Cached labels depend on the pre-filter and the cascade too
+    entry = get_registry().get(model)
+    fingerprint = entry.fingerprint
+    prefilter = get_prefilter()
+    if prefilter is not None:
+        fingerprint = f"{fingerprint}+{prefilter.fingerprint}"
+    if entry.cascade is not None:
+        fingerprint = f"{fingerprint}+{cascade_fingerprint(entry.cascade)}"
+    return fingerprint
+
+
+def classify_raw_messages(message_ids, raw_messages, model=None):
+    """
+    Classifies downloaded Gmail messages and stores them in the cache.
+
+    Parameters:
+        message_ids (list): Gmail message IDs
+        raw_messages (list): Raw email bytes for each ID, None where Gmail sent no content
+        model (str): Registry name of the model to use, None for the default one
+
+    Returns:
+        dict: message_id -> row
+    """
+    # Features come straight from Gmail's bytes, without rebuilding each message as text first
+    fetched = [
+        (message_id, raw_email_bytes)
+        for message_id, raw_email_bytes in zip(message_ids, raw_messages)
+        if raw_email_bytes
+    ]
+    classified = result_rows(*classify_raw([raw_email_bytes for _, raw_email_bytes in fetched], model))
+    rows = {message_id: row for (message_id, _), row in zip(fetched, classified)}
+    get_cache().put_many(model_fingerprint(model), rows)
+    return rows
+
+
+def classify_gmail_page(label='INBOX', page_token=None, max_results=30, service_factory=None, model=None):
+    """
+    Fetches and classifies one page of a Gmail label.
+
+    Returns:
+        tuple: (rows in Gmail order, next_page_token)
+    """
+    if service_factory is None:
+        service_factory = gmail_service_factory()
+    message_ids, next_page_token = list_message_ids(service_factory(), label, max_results, page_token)
+
+    rows = classify_message_ids(message_ids, service_factory, model)
+    return [rows[message_id] for message_id in message_ids if message_id in rows], next_page_token
+
+
+def classified_message_stream(message_ids, service_factory, model=None):
+    """
+    Classifies Gmail messages like `classify_message_ids`, yielding each row as soon as it is ready.
+
+    Cached rows come first, then downloaded messages in the order their
+    downloads finish. Rows are written to the cache once iteration stops.
+
+    Yields:
+        tuple: (position of the message in message_ids, row)
+    """
+    fingerprint = model_fingerprint(model)
+    with timed("cache_lookup"):
+        cached = get_cache().get_many(message_ids, fingerprint)
+    positions = {}
+    for position, message_id in enumerate(message_ids):
+        if message_id in cached:
+            yield position, cached[message_id]
+        else:
+            positions[message_id] = position
+
+    rows = {}
+    try:
+        for message_id, raw_email_bytes in iter_raw_messages(list(positions), service_factory):
+            if raw_email_bytes:
+                rows[message_id] = result_rows(*classify_raw([raw_email_bytes], model))[0]
+                yield positions[message_id], rows[message_id]
+    finally:
+        get_cache().put_many(fingerprint, rows)
+
+
+def in_gmail_order(positioned_rows):
+    """
+    Puts (position, row) pairs back in page order, releasing each row once every row above it arrived.
+
+    Rows after a message Gmail sent no content for wait until the end.
+    """
+    pending, expected = {}, 0
+    for position, row in positioned_rows:
+        pending[position] = row
+        while expected in pending:
+            yield pending.pop(expected)
+            expected += 1
+    for position in sorted(pending):
+        yield pending[position]
+
+
+def load_folder_page(label='INBOX', page_token=None, max_results=30, model=None):
+    """
+    Rows for the inbox and spam views.
+
+    With MAILBOX_SYNC enabled the user's local index is brought up to date
+    from Gmail history and the page is read from it, using the row offset
+    as page token (any other token is a 400). The indexed rows are relabeled
+    from their stored features, so they reflect the requested model, except
+    rows the cascade settled on a prefix (see `rescore_rows`). Otherwise the
+    page is listed live from Gmail, or taken from memory when serving the
+    previous page prefetched it, and the page after it is prefetched in the
+    background.
+
+    Returns:
+        tuple: (rows, next_page_token)
+    """
+    if not MAILBOX_SYNC:
+        service_factory = gmail_service_factory()
+        user = session.get('user_email')
+        page = prefetched_page(user, label, page_token, max_results, model)
+        if page is None:
+            page = classify_gmail_page(label, page_token, max_results, service_factory, model)
+        prefetch_next_page(user, label, page[1], max_results, model, service_factory)
+        return page
+
+    try:
+        offset = int(page_token or 0)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        abort(400, description=f"Invalid page token {page_token!r}")
+    user = session['user_email']
+    get_mailbox_index().sync(user, gmail_service_factory(), classify_message_ids)
+    rows, next_page_token = get_mailbox_index().page(user, label, offset, max_results)
+    return rescore_rows(rows, model), next_page_token
+
+
+def stream_folder_page(label='INBOX', page_token=None, max_results=30, model=None):
+    """
+    Streaming version of `load_folder_page`.
+
+    Only the message list is fetched before returning; rows are classified
+    while the caller iterates, and the next page is prefetched after the
+    last one. Pages read from the mailbox index or the prefetcher are
+    complete already and come out in page order.
+
+    Returns:
+        tuple: (iterator of (position in the page, row), next_page_token)
+    """
+    if MAILBOX_SYNC:
+        rows, next_page_token = load_folder_page(label, page_token, max_results, model)
+        return enumerate(rows), next_page_token
+
+    service_factory = gmail_service_factory()
+    user = session.get('user_email')
+    page = prefetched_page(user, label, page_token, max_results, model)
+    if page is not None:
+        positioned_rows, next_page_token = enumerate(page[0]), page[1]
+    else:
+        message_ids, next_page_token = list_message_ids(service_factory(), label, max_results, page_token)
+        positioned_rows = classified_message_stream(message_ids, service_factory, model)
+
+    def rows_then_prefetch():
+        yield from positioned_rows
+        prefetch_next_page(user, label, next_page_token, max_results, model, service_factory)
+
+    return rows_then_prefetch(), next_page_token
+
+
+def log_page(label, rows, next_page_token):
+    """Logs a served page at DEBUG level: a summary line, then one line per row."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    spam = sum(row["label"] == 1 for row in rows)
+    logger.debug("page folder=%s rows=%d spam=%d next_page_token=%s", label, len(rows), spam, next_page_token)
+    for position, row in enumerate(rows):
+        log_row(label, position, row)
+
+
+def log_row(label, position, row):
+    logger.debug("row folder=%s position=%d label=%d spam_probability=%.3f subject=%r",
+                 label, position, row["label"], row["spam_probability"], row["subject"])
+
+
+def logged_rows(label, positioned_rows):
+    """Passes (position, row) pairs through, logging each row at DEBUG level as it is sent."""
+    for position, row in positioned_rows:
+        log_row(label, position, row)
+        yield position, row
+
+
+def prefetched_page(user, label, page_token, max_results, model):
+    """The page prefetched for `user` when their previous page was served, None if there is none."""
+    if not (PREFETCH_ENABLED and user):
+        return None
+    return get_prefetcher().get(user, (label, page_token, max_results, model))
+
+
+def prefetch_next_page(user, label, next_page_token, max_results, model, service_factory):
+    """Starts fetching and classifying the page a "next" link points to, so the click is served from memory."""
+    if PREFETCH_ENABLED and user and next_page_token:
+        get_prefetcher().schedule(
+            user, (label, next_page_token, max_results, model),
+            lambda: classify_gmail_page(label, next_page_token, max_results, service_factory, model)
+        )
+
+
+def evaluate_model_vs_gmail(paginate=False, page=1, per_page=20, mismatches_only=False, model=None):
+    """
+    Compares the model with Gmail's INBOX and SPAM folders.
+
+    Both folders are fetched and classified at the same time; the inbox rows
+    are counted while the spam folder may still be downloading.
+    """
+    service_factory = gmail_service_factory()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        inbox = submit_in_context(pool, classify_gmail_page, 'INBOX', service_factory=service_factory, model=model)
+        spam = submit_in_context(pool, classify_gmail_page, 'SPAM', service_factory=service_factory, model=model)
+        sources = ((gmail_label, future.result()[0]) for gmail_label, future in (("NOT_SPAM", inbox), ("SPAM", spam)))
+        return evaluate_stream(sources, page if paginate else None, per_page, mismatches_only)
+
+
+async def classify_message_ids_async(message_ids, service_factory, model=None):
+    """
+    Async version of `classify_message_ids`.
+
+    Cache lookups and Gmail downloads run in worker threads and feature
+    extraction runs on EXTRACTION_EXECUTOR, so the event loop never blocks.
+    """
+    with timed("cache_lookup"):
+        # model_fingerprint can load or reload a model, so it runs in the thread too
+        rows = await asyncio.to_thread(lambda: get_cache().get_many(message_ids, model_fingerprint(model)))
+
+    missing_ids = [message_id for message_id in message_ids if message_id not in rows]
+    if missing_ids:
+        raw_messages = await asyncio.to_thread(fetch_raw_messages, missing_ids, service_factory)
+        loop = asyncio.get_running_loop()
+        # Run in a copy of this context, so the stage timings count towards the request's breakdown
+        rows.update(await loop.run_in_executor(
+            EXTRACTION_EXECUTOR, contextvars.copy_context().run, classify_raw_messages, missing_ids, raw_messages, model
+        ))
+
+    return rows
+
+
+async def classify_gmail_page_async(label='INBOX', page_token=None, max_results=30, service_factory=None, model=None):
+    """Async version of `classify_gmail_page`."""
+    if service_factory is None:
+        service_factory = await asyncio.to_thread(gmail_service_factory)
+    # service_factory() can refresh the user's token
+    message_ids, next_page_token = await asyncio.to_thread(
+        lambda: list_message_ids(service_factory(), label, max_results, page_token)
+    )
+
+    rows = await classify_message_ids_async(message_ids, service_factory, model)
+    return [rows[message_id] for message_id in message_ids if message_id in rows], next_page_token
+
+
+async def load_folder_page_async(label='INBOX', page_token=None, max_results=30, model=None):
+    """Async version of `load_folder_page`."""
+    if MAILBOX_SYNC:
+        return await asyncio.to_thread(load_folder_page, label, page_token, max_results, model)
+
+    service_factory = await asyncio.to_thread(gmail_service_factory)
+    user = session.get('user_email')
+    page = await asyncio.to_thread(prefetched_page, user, label, page_token, max_results, model)
+    if page is None:
+        page = await classify_gmail_page_async(label, page_token, max_results, service_factory, model)
+    prefetch_next_page(user, label, page[1], max_results, model, service_factory)
+    return page
+
+
+async def evaluate_model_vs_gmail_async(paginate=False, page=1, per_page=20, mismatches_only=False, model=None):
+    """Async version of `evaluate_model_vs_gmail`."""
+    service_factory = await asyncio.to_thread(gmail_service_factory)
+    (inbox_rows, _), (spam_rows, _) = await asyncio.gather(
+        classify_gmail_page_async('INBOX', service_factory=service_factory, model=model),
+        classify_gmail_page_async('SPAM', service_factory=service_factory, model=model),
+    )
+    sources = (("NOT_SPAM", inbox_rows), ("SPAM", spam_rows))
+    return evaluate_stream(sources, page if paginate else None, per_page, mismatches_only)
+
 
 # # test the model
 # inbox = fetch_and_format_emails()
@@ -135,6 +502,32 @@ app = Flask(__name__)
 CORS(app)
 app.secret_key = 'some-secret-key'  # Required for using session
 
+# Send each response's stage timings back in a Server-Timing header (see api/metrics.py)
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+
+
+@app.before_request
+def start_request_timer():
+    request.started_at = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+def record_request_time(response):
+    """Streamed responses are timed until their headers; their rows are still timed per stage."""
+    elapsed = time.perf_counter() - request.started_at
+    metrics.REQUEST_SECONDS.observe(elapsed, request.endpoint or "unknown")
+    timings = metrics.request_timings()
+    if SERVER_TIMING and timings is not None:
+        response.headers['Server-Timing'] = metrics.server_timing_header({**timings, "total": elapsed})
+    return response
+
+# JSON scoring API (POST /api/v1/classify and /api/v1/classify/batch) for clients with their own raw messages
+API_TOKEN = os.environ.get("API_TOKEN")  # When set, clients must send "Authorization: Bearer <token>"
+API_MAX_BATCH = int(os.environ.get("API_MAX_BATCH", 1000))
+API_MAX_MESSAGE_BYTES = int(os.environ.get("API_MAX_MESSAGE_BYTES", 10 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("API_MAX_REQUEST_BYTES", 64 * 1024 * 1024))
+
 
 
 @app.route('/start-auth', methods=['POST'])
@@ -148,76 +541,344 @@ def start_auth():
 def landing_page():
     return render_template("landing.html")
 
+def selected_model():
+    """Registry model picked with ?model=..., None for the default one."""
+    model = request.args.get('model')
+    if model and model not in get_registry().names:
+        abort(400, description=f"Unknown model {model!r}, expected one of {', '.join(get_registry().names)}")
+    return model
+
+
 @app.route('/spam-folder', methods=['GET'])
 def show_spam_folder():
     page_token = request.args.get('page_token')
-    spam_emails, next_page_token = fetch_and_format_emails(label='SPAM', page_token=page_token)
+    model = selected_model()
+    if STREAM_VIEWS:
+        return stream_folder_view("spam_folder.html", 'SPAM', page_token, model)
+    output, next_page_token = load_folder_page(label='SPAM', page_token=page_token, model=model)
+    log_page('SPAM', output, next_page_token)
 
-    output = []
-    for email_text in spam_emails:
-        headers = extract_headers(email_text)
-        subject = headers.get("subject", "No Subject")
-        sender = headers.get("from", "Unknown Sender")
-        date = headers.get("date", "Unknown Date")
-        label = int(test_naive_bayes_model(email_text))
+    return render_template("spam_folder.html", emails=output, next_page_token=next_page_token, model=model)
 
-        output.append({
-            "subject": subject,
-            "from": sender,
-            "date": date,
-            "label": label
-        })
-        print(output)
 
-    return render_template("spam_folder.html", emails=output, next_page_token=next_page_token)
+async def show_spam_folder_async():
+    page_token = request.args.get('page_token')
+    model = selected_model()
+    output, next_page_token = await load_folder_page_async(label='SPAM', page_token=page_token, model=model)
+    log_page('SPAM', output, next_page_token)
+
+    return render_template("spam_folder.html", emails=output, next_page_token=next_page_token, model=model)
 
 
 @app.route('/inbox-folder', methods=['GET'])
 def check_spam():
     page_token = request.args.get('page_token')  # From query string ?page_token=...
-    inbox, next_page_token = fetch_and_format_emails(page_token=page_token)
+    model = selected_model()
+    if STREAM_VIEWS:
+        return stream_folder_view("inbox.html", 'INBOX', page_token, model)
+    output, next_page_token = load_folder_page(page_token=page_token, model=model)
+    log_page('INBOX', output, next_page_token)
+
+    return render_template("inbox.html", emails=output, next_page_token=next_page_token, model=model)
+
+
+async def check_spam_async():
+    page_token = request.args.get('page_token')
+    model = selected_model()
+    output, next_page_token = await load_folder_page_async(page_token=page_token, model=model)
+    log_page('INBOX', output, next_page_token)
+
+    return render_template("inbox.html", emails=output, next_page_token=next_page_token, model=model)
+
+
+def stream_folder_view(template, label, page_token, model):
+    """
+    Renders a folder page while its messages are classified (STREAM_VIEWS=1).
+
+    The browser gets each row as soon as the rows above it are done, so the
+    first one shows after about one Gmail download instead of all of them.
+    """
+    positioned_rows, next_page_token = stream_folder_page(label, page_token, model=model)
+    emails = in_gmail_order(logged_rows(label, positioned_rows))
+    return Response(
+        stream_template(template, emails=emails, next_page_token=next_page_token, model=model),
+        headers={'X-Accel-Buffering': 'no'}  # Keep proxies from holding the page back
+    )
+
+
+@app.route('/inbox-folder/rows', methods=['GET'])
+def inbox_rows():
+    return folder_rows('INBOX')
+
 
-    output = []
-    for email_text in inbox:
-        headers = extract_headers(email_text)
-        subject = headers.get("subject", "No Subject")
-        sender = headers.get("from", "Unknown Sender")
-        date = headers.get("date", "Unknown Date")
-        label = int(test_naive_bayes_model(email_text))
+@app.route('/spam-folder/rows', methods=['GET'])
+def spam_rows():
+    return folder_rows('SPAM')
 
-        output.append({
-            "subject": subject,
-            "from": sender,
-            "date": date,
-            "label": label
-        })
 
-    return render_template("inbox.html", emails=output, next_page_token=next_page_token)
+def folder_rows(label):
+    """
+    Streams a folder page as newline-delimited JSON while its messages are classified.
+
+    The first line is {"next_page_token": ...}. Each following line is
+    {"position": n, "row": {...}}, sent as soon as that message is
+    classified; position is the message's place in the Gmail page. With
+    "Accept: text/event-stream" the same objects are sent as server-sent
+    events named "page" and "row", followed by an "end" event.
+    """
+    page_token = request.args.get('page_token')
+    model = selected_model()
+    positioned_rows, next_page_token = stream_folder_page(label, page_token, model=model)
+    event_stream = request.accept_mimetypes.best == 'text/event-stream'
+
+    def encode(event, data):
+        if event_stream:
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps(data) + "\n"
+
+    def lines():
+        yield encode("page", {"next_page_token": next_page_token})
+        for position, row in logged_rows(label, positioned_rows):
+            yield encode("row", {"position": position, "row": row})
+        if event_stream:
+            yield encode("end", {})
+
+    return Response(
+        lines(),
+        mimetype='text/event-stream' if event_stream else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/model-vs-gmail')
 def compare_model_vs_gmail():
-    page = int(request.args.get('page', 1))
+    page = comparison_page()
+    filter_mismatches = request.args.get('filter') == 'mismatch'
+    model = selected_model()
+
+    results, scores, total = evaluate_model_vs_gmail(
+        paginate=True, page=page, per_page=COMPARISON_PER_PAGE, mismatches_only=filter_mismatches, model=model
+    )
+    return render_comparison(results, scores, total, page, COMPARISON_PER_PAGE, filter_mismatches, model)
+
+
+async def compare_model_vs_gmail_async():
+    page = comparison_page()
     filter_mismatches = request.args.get('filter') == 'mismatch'
+    model = selected_model()
 
-    results, metrics, total = evaluate_model_vs_gmail(paginate=True, page=page)
+    results, scores, total = await evaluate_model_vs_gmail_async(
+        paginate=True, page=page, per_page=COMPARISON_PER_PAGE, mismatches_only=filter_mismatches, model=model
+    )
+    return render_comparison(results, scores, total, page, COMPARISON_PER_PAGE, filter_mismatches, model)
+
+
+def comparison_page():
+    """1-based page of the comparison view; anything that is not a positive integer is page 1."""
+    return max(request.args.get('page', 1, type=int), 1)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    cache = get_cache()
+    prefetch = get_prefetcher().stats()
+    extra_counters = [
+        ("cache_hits", "Classification cache lookups that found a row", cache.hits),
+        ("cache_misses", "Classification cache lookups that found nothing", cache.misses),
+    ] + [
+        (f"prefetch_{name}", f"Prefetched pages: {name}", prefetch[name]) for name in PREFETCH_COUNTERS
+    ]
+    return Response(metrics.expose(extra_counters), mimetype='text/plain; version=0.0.4')
 
-    if filter_mismatches:
-        results = [r for r in results if r['gmail_label'] != r['model_label']]
 
+@app.route('/prefetch/stats', methods=['GET'])
+def prefetch_stats():
+    return jsonify(get_prefetcher().stats())
+
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify(get_registry().describe())
+
+
+@app.route('/models/<name>/reload', methods=['POST'])
+def reload_model(name):
+    """
+    Hot-swaps a model, optionally to another artifact in MODEL_DIR: {"path": "complement_nb-v2.joblib"}.
+
+    Needs the X-Admin-Token header to match MODEL_ADMIN_TOKEN; without that setting the endpoint is off.
+    """
+    if not MODEL_ADMIN_TOKEN or request.headers.get('X-Admin-Token') != MODEL_ADMIN_TOKEN:
+        abort(403)
+    registry = get_registry()
+    if name not in registry.names:
+        abort(404, description=f"Unknown model {name!r}")
+
+    path = (request.get_json(silent=True) or {}).get('path')
+    try:
+        entry = registry.load(name, resolve_artifact(path) if path else None)
+    except ValueError as error:
+        abort(400, description=str(error))
+    return jsonify(entry.describe())
+
+
+def score_raw_messages(raw_messages, model=None):
+    """
+    Classifies raw RFC 822 messages with one model call.
+
+    Parameters:
+        raw_messages (list): Raw message bytes
+        model (str): Registry name of the model to use, None for the default one
+
+    Returns:
+        list: One dict per message with label, spam_probability and features by name, and
+        "stage": "prefix" when the cascade settled it on a prefix of the message
+    """
+    metrics.MESSAGE_BYTES.inc(sum(len(raw_email_bytes) for raw_email_bytes in raw_messages), "api")
+    _, feature_rows, labels, probabilities, stages = classify_raw(raw_messages, model)
+    results = []
+    for features, label, probability, stage in zip(feature_rows, labels, probabilities, stages):
+        result = {"label": int(label), "spam_probability": float(probability), "features": dict(zip(FEATURES, features))}
+        if stage == 1:
+            result["stage"] = "prefix"
+        results.append(result)
+    return results
+
+
+def require_api_token():
+    if API_TOKEN and request.headers.get('Authorization') != f"Bearer {API_TOKEN}":
+        abort(401)
+
+
+def decode_message(value, index=0):
+    """Decodes one base64 message from a JSON request, standard or URL-safe alphabet, padding optional."""
+    if not isinstance(value, str) or not value:
+        abort(400, description=f"Message {index}: expected a base64 string")
+    if len(value) * 3 // 4 > API_MAX_MESSAGE_BYTES:
+        abort(413, description=f"Message {index} is larger than {API_MAX_MESSAGE_BYTES} bytes")
+    try:
+        value = value.replace('-', '+').replace('_', '/')
+        return base64.b64decode(value + "=" * (-len(value) % 4), validate=True)
+    except (binascii.Error, ValueError):
+        abort(400, description=f"Message {index} is not valid base64")
+
+
+def check_message(raw_email_bytes, index=0):
+    if not raw_email_bytes:
+        abort(400, description=f"Message {index} is empty")
+    if len(raw_email_bytes) > API_MAX_MESSAGE_BYTES:
+        abort(413, description=f"Message {index} is larger than {API_MAX_MESSAGE_BYTES} bytes")
+    return raw_email_bytes
+
+
+@app.route('/api/v1/classify', methods=['POST'])
+def api_classify():
+    """
+    Classifies one raw message.
+
+    The body is either the message itself (message/rfc822, text/plain or
+    application/octet-stream) or JSON {"raw": "<base64>", "id": "..."}.
+    Pick a model with ?model=...
+    """
+    require_api_token()
+    model = selected_model()
+    message_id = None
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400, description='Expected {"raw": "<base64 message>"}')
+        raw_email_bytes, message_id = decode_message(body.get('raw')), body.get('id')
+    else:
+        raw_email_bytes = request.get_data()
+
+    result = score_raw_messages([check_message(raw_email_bytes)], model)[0]
+    return jsonify({"model": get_registry().get(model).name, "id": message_id, **result})
+
+
+@app.route('/api/v1/classify/batch', methods=['POST'])
+def api_classify_batch():
+    """
+    Classifies many raw messages with one model call.
+
+    Accepts JSON {"messages": [...]}, each item a base64 string or
+    {"id": "...", "raw": "<base64>"}, or multipart/form-data with one file
+    per message, identified by its filename or field name. At most
+    API_MAX_BATCH messages of API_MAX_MESSAGE_BYTES each. Results come back
+    in request order, with the index as id where none was given.
+    """
+    require_api_token()
+    model = selected_model()
+    message_ids, raw_messages = [], []
+    if request.mimetype == 'multipart/form-data':
+        files = list(request.files.items(multi=True))
+        if len(files) > API_MAX_BATCH:
+            abort(413, description=f"At most {API_MAX_BATCH} messages per batch")
+        for index, (field, file) in enumerate(files):
+            message_ids.append(file.filename or field)
+            raw_messages.append(check_message(file.read(API_MAX_MESSAGE_BYTES + 1), index))
+    else:
+        body = request.get_json(silent=True)
+        messages = body.get('messages') if isinstance(body, dict) else None
+        if not isinstance(messages, list):
+            abort(400, description='Expected {"messages": [...]} or multipart/form-data')
+        if len(messages) > API_MAX_BATCH:
+            abort(413, description=f"At most {API_MAX_BATCH} messages per batch")
+        for index, message in enumerate(messages):
+            if isinstance(message, dict):
+                message_ids.append(message.get('id', index))
+                message = message.get('raw')
+            else:
+                message_ids.append(index)
+            raw_messages.append(check_message(decode_message(message, index), index))
+
+    results = score_raw_messages(raw_messages, model)
+    return jsonify({
+        "model": get_registry().get(model).name,
+        "results": [{"id": message_id, **result} for message_id, result in zip(message_ids, results)]
+    })
+
+
+@app.errorhandler(HTTPException)
+def api_error(error):
+    """Errors of the /api/ endpoints are JSON; every other page keeps Flask's HTML errors."""
+    if not request.path.startswith('/api/'):
+        return error
+    return jsonify({"error": error.name, "description": error.description}), error.code
+
+
+@app.errorhandler(ModelUnavailable)
+def model_unavailable(error):
+    """A registered model whose artifact is missing or unreadable is a 503, not a crash."""
+    logger.warning("%s", error)
+    return api_error(ServiceUnavailable(description=str(error)))
+
+
+def render_comparison(results, scores, total, page, per_page, filter_mismatches, model=None):
     prev_page = page - 1 if page > 1 else None
-    next_page = page + 1 if (page * 20) < total else None
+    next_page = page + 1 if (page * per_page) < total else None
 
     return render_template(
         "compare.html",
         results=results,
-        metrics=metrics,
+        metrics=scores,
         page=page,
         prev_page=prev_page,
         next_page=next_page,
-        filter_mismatches=filter_mismatches
+        filter_mismatches=filter_mismatches,
+        model=model
     )
 
 
+def use_async_views():
+    """Serves the Gmail-backed views with their async handlers."""
+    app.view_functions['show_spam_folder'] = show_spam_folder_async
+    app.view_functions['check_spam'] = check_spam_async
+    app.view_functions['compare_model_vs_gmail'] = compare_model_vs_gmail_async
+
+
+if ASYNC_VIEWS:
+    use_async_views()
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,15 @@
+"""
+ASGI entry point for the async serving mode.
+
+    ASYNC_VIEWS=1 uvicorn api.asgi:asgi_app
+
+Inbox, spam and model-vs-gmail requests are then handled by their async
+views: Gmail downloads are awaited off the event loop and feature
+extraction runs on the extraction executor.
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from api.app import app, use_async_views
+
+use_async_views()
+asgi_app = WsgiToAsgi(app)
@@ -0,0 +1,194 @@
+"""
+Scores a whole email corpus offline and writes features and predictions to Parquet.
+
+    python -m api.bulk_score emails.csv processed_emails.parquet --workers 8
+    python -m api.bulk_score ~/mail/archive.mbox scores.parquet --format mbox
+    python -m api.bulk_score ~/Maildir scores.parquet --format maildir
+
+Messages are streamed from the input in chunks, feature extraction is fanned
+out over a process pool with a bounded number of chunks in flight, and each
+finished chunk is classified and appended to the Parquet file, so memory use
+does not grow with the size of the corpus.
+"""
+import argparse
+import logging
+import mailbox
+import os
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from api.all_functions import ParsedEmail, FEATURES, load_model
+from api.inference import as_kernel, predict_with_proba
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = float(os.environ.get("BULK_SCORE_PROGRESS_INTERVAL", 10))
+
+HEADER_COLUMNS = ["from", "to", "subject", "date"]
+
+SCHEMA = pa.schema(
+    [("message_key", pa.string())]
+    + [(name, pa.string()) for name in HEADER_COLUMNS]
+    + [(name, pa.int32()) for name in FEATURES]
+    + [("label", pa.int8()), ("spam_probability", pa.float64())]
+)
+
+
+def read_csv_messages(path, chunk_size):
+    """Yields (key, raw_text) from a CSV with a `message` column, keyed by `file` when present."""
+    offset = 0
+    for frame in pd.read_csv(path, chunksize=chunk_size):
+        keys = frame["file"] if "file" in frame.columns else range(offset, offset + len(frame))
+        for key, message in zip(keys, frame["message"]):
+            yield str(key), message if isinstance(message, str) else ""
+        offset += len(frame)
+
+
+def read_mailbox_messages(box):
+    """Yields (key, raw_text) from an mbox or Maildir without parsing the messages."""
+    for key in box.iterkeys():
+        yield str(key), box.get_bytes(key).decode("utf-8", errors="replace")
+
+
+def read_messages(path, input_format, chunk_size):
+    if input_format == "csv":
+        return read_csv_messages(path, chunk_size)
+    if input_format == "mbox":
+        return read_mailbox_messages(mailbox.mbox(path, create=False))
+    return read_mailbox_messages(mailbox.Maildir(path, factory=None, create=False))
+
+
+def chunked(messages, chunk_size):
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def extract_chunk(chunk):
+    """
+    Worker: extracts headers and features for a chunk of (key, raw_text) pairs.
+
+    Messages that fail to parse are skipped and counted instead of aborting the run.
+    """
+    keys, headers, rows = [], [], []
+    errors = 0
+    for key, email_text in chunk:
+        try:
+            parsed = ParsedEmail(email_text.strip())
+            row = parsed.feature_vector()
+        except Exception:
+            errors += 1
+            continue
+        keys.append(key)
+        headers.append([_header_text(parsed.msg[name.capitalize()]) for name in HEADER_COLUMNS])
+        rows.append(row)
+    return keys, headers, rows, errors
+
+
+def _header_text(value):
+    return None if value is None else str(value)
+
+
+def score_chunk(classifier, spam_column, keys, headers, rows):
+    """Classifies one extracted chunk and returns it as an Arrow table."""
+    X = np.array(rows, dtype=np.int64).reshape(len(rows), len(FEATURES))
+    labels, probabilities = predict_with_proba(classifier, X)
+
+    columns = {"message_key": keys}
+    for i, name in enumerate(HEADER_COLUMNS):
+        columns[name] = [header[i] for header in headers]
+    for i, name in enumerate(FEATURES):
+        columns[name] = X[:, i].astype(np.int32)
+    columns["label"] = labels.astype(np.int8)
+    columns["spam_probability"] = probabilities[:, spam_column]
+    return pa.table(columns, schema=SCHEMA)
+
+
+def bulk_score(input_path, output_path, input_format="csv", model_path="re_complement_naive_bayes_model.pkl",
+               workers=None, chunk_size=1000):
+    """
+    Scores every message in the input and writes one Parquet row per message.
+
+    Returns:
+        tuple: (messages written, messages skipped)
+    """
+    workers = workers or os.cpu_count() or 1
+    classifier = as_kernel(load_model(model_path))
+    spam_column = list(classifier.classes_).index(1)
+
+    chunks = chunked(read_messages(input_path, input_format, chunk_size), chunk_size)
+    written = skipped = 0
+    start = last_progress = time.perf_counter()
+
+    with pq.ParquetWriter(output_path, SCHEMA) as writer, ProcessPoolExecutor(max_workers=workers) as pool, \
+            warnings.catch_warnings():
+        # The model was fitted on a DataFrame; score_chunk feeds it a plain matrix in the same column order
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        in_flight = deque()
+
+        def write_next():
+            nonlocal written, skipped, last_progress
+            keys, headers, rows, errors = in_flight.popleft().result()
+            if rows:
+                writer.write_table(score_chunk(classifier, spam_column, keys, headers, rows))
+            written += len(rows)
+            skipped += errors
+            now = time.perf_counter()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                logger.info("%d scored, %d skipped, %.0f msgs/sec", written, skipped, written / (now - start))
+
+        for chunk in chunks:
+            in_flight.append(pool.submit(extract_chunk, chunk))
+            # Only a couple of chunks per worker are ever held in memory
+            if len(in_flight) >= 2 * workers:
+                write_next()
+        while in_flight:
+            write_next()
+
+    return written, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV file, mbox file or Maildir directory")
+    parser.add_argument("output", help="Parquet file to write")
+    parser.add_argument("--format", choices=["csv", "mbox", "maildir"],
+                        help="Input format (default: guessed from the path)")
+    parser.add_argument("--model", default="re_complement_naive_bayes_model.pkl", help="Pickled classifier or exported .joblib artifact")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Messages per work unit")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    input_format = args.format
+    if input_format is None:
+        if os.path.isdir(args.input):
+            input_format = "maildir"
+        elif args.input.endswith(".csv"):
+            input_format = "csv"
+        else:
+            input_format = "mbox"
+
+    start = time.perf_counter()
+    written, skipped = bulk_score(args.input, args.output, input_format, args.model, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    logger.info("Scored %d messages (%d skipped) in %.1fs -> %s", written, skipped, elapsed, args.output)
+
+
+if __name__ == "__main__":
+    main()
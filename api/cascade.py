@@ -0,0 +1,324 @@
+"""
+Two-stage classification of raw messages: headers and a body prefix first, the whole message only when needed.
+
+    python -m api.cascade emails.csv --model models/complement_nb.joblib --write
+    CASCADE=1 python -m api.app
+
+Stage one parses the headers and the first `prefix_bytes` of the body,
+computes the model features on that and runs the model. Of the features,
+is_missing_to, num_recipients, num_subject_words and is_fake_domain only
+read headers and come out exact; the body counts are those of the prefix.
+The stage one answer is kept when its spam probability is at least the spam
+threshold or at most the ham threshold, and always when the prefix is the
+whole message, since stage one then saw everything. Other messages go to
+stage two: the full parse and the model.
+
+A stage one answer can be wrong in either direction. Body counts of a
+prefix are lower than the message's, and a linear model is not monotone in
+them: ComplementNB weighs some counts towards ham, so a prefix can look
+more spam-like than the whole message, and its 0/1 probabilities say
+nothing about how close the call was. Whether a setting agrees with the
+full pipeline is therefore a property of the model, and is measured per
+model rather than assumed.
+
+The CLI runs a corpus through the full pipeline and through the cascade at
+each candidate setting, and reports the share of messages stage one settled
+and the metrics of `evaluate_model_vs_gmail` against the full pipeline's
+labels. With --write it saves the setting that short-circuits most while
+agreeing on at least CASCADE_MIN_AGREEMENT of the labels next to the
+artifact (<artifact>.cascade.json), or nothing when no setting does.
+
+CASCADE=1 serves a model through the cascade only when such a file exists
+for its exact artifact and pre-filter, and picks it up when the model is
+loaded or reloaded. Every other model keeps the full pipeline.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from api.all_functions import ParsedGmailMessage
+from api.evaluation import ConfusionCounts
+from api.metrics import CASCADE_MESSAGES, timed
+
+logger = logging.getLogger(__name__)
+
+CASCADE_ENABLED = os.environ.get("CASCADE", "0") == "1"
+CASCADE_PREFIX_BYTES = int(os.environ.get("CASCADE_PREFIX_BYTES", 4096))
+# Share of labels a setting must leave unchanged to be written
+CASCADE_MIN_AGREEMENT = float(os.environ.get("CASCADE_MIN_AGREEMENT", 0.999))
+# spam:ham thresholds the CLI measures by default; a negative ham threshold keeps no ham answers
+CANDIDATE_THRESHOLDS = [(0.999, 0.001), (0.99, 0.01), (0.9, 0.1), (0.999, -1.0), (0.99, -1.0)]
+
+
+def setting_path(artifact_path):
+    """The cascade setting file of a model artifact."""
+    return artifact_path + ".cascade.json"
+
+
+def load_setting(artifact_path, fingerprint, prefilter_fingerprint=None):
+    """
+    The measured cascade setting of a model, as `write_setting` saved it.
+
+    Parameters:
+        artifact_path (str): Model artifact
+        fingerprint (str): Fingerprint of the loaded model
+        prefilter_fingerprint (str): Fingerprint of the serving pre-filter, None when there is none
+
+    Returns:
+        dict: prefix_bytes, spam_threshold, ham_threshold, agreement and messages; None when there is
+        no setting, or it was measured for another artifact or pre-filter
+    """
+    path = setting_path(artifact_path)
+    try:
+        with open(path) as file:
+            setting = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        logger.warning("Ignoring cascade setting %s: %s", path, error)
+        return None
+    if setting.get("fingerprint") != fingerprint or setting.get("prefilter") != prefilter_fingerprint:
+        logger.warning("Ignoring cascade setting %s: measured for another model or pre-filter", path)
+        return None
+    return setting
+
+
+def write_setting(artifact_path, fingerprint, prefilter_fingerprint, prefix_bytes, run, messages):
+    """Saves a measured setting (a `cascade_report` run) next to the artifact, atomically."""
+    spam_threshold, ham_threshold = run["thresholds"]
+    setting = {
+        "fingerprint": fingerprint,
+        "prefilter": prefilter_fingerprint,
+        "prefix_bytes": prefix_bytes,
+        "spam_threshold": spam_threshold,
+        "ham_threshold": ham_threshold,
+        "agreement": run["agreement"],
+        "short_circuited": run["short_circuited"],
+        "messages": messages,
+    }
+    path = setting_path(artifact_path)
+    with open(path + ".tmp", "w") as file:
+        json.dump(setting, file, indent=2)
+    os.replace(path + ".tmp", path)
+    return setting
+
+
+def cascade_fingerprint(setting):
+    """Identifies a cascade setting, for cache keys: its labels can differ from the full pipeline's."""
+    return f"cascade:{setting['prefix_bytes']}:{setting['spam_threshold']}:{setting['ham_threshold']}"
+
+
+def message_prefix(email_bytes, prefix_bytes=CASCADE_PREFIX_BYTES):
+    """
+    The headers and about `prefix_bytes` of the body of a raw message.
+
+    The body is cut at the end of a line, so no header or boundary line is
+    cut in half.
+
+    Returns:
+        tuple: (prefix bytes, whether the prefix is the whole message)
+    """
+    header_end = len(email_bytes)
+    for separator in (b"\r\n\r\n", b"\n\n"):
+        position = email_bytes.find(separator)
+        if position >= 0:
+            header_end = min(header_end, position + len(separator))
+    end = header_end + prefix_bytes
+    if end >= len(email_bytes):
+        return email_bytes, True
+    cut = email_bytes.rfind(b"\n", header_end, end)
+    return email_bytes[:cut + 1 if cut >= 0 else header_end], False
+
+
+def cascade_classify(raw_messages, predict, spam_threshold, ham_threshold, prefix_bytes=CASCADE_PREFIX_BYTES):
+    """
+    Classifies raw messages through both stages.
+
+    Parameters:
+        raw_messages (list): Raw RFC 822 message bytes
+        predict (callable): Feature rows -> (labels, spam probabilities), like `api.app.predict`
+        spam_threshold (float): Stage one spam probability from which its label is kept
+        ham_threshold (float): Stage one spam probability up to which its label is kept, negative for never
+        prefix_bytes (int): Body bytes stage one reads
+
+    Returns:
+        tuple: (parsed messages, feature rows, labels, spam probabilities, stage of each message: 1 or 2)
+    """
+    if not raw_messages:
+        return [], [], np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int8)
+
+    with timed("parse_prefix"):
+        prefixes = [message_prefix(raw_email_bytes, prefix_bytes) for raw_email_bytes in raw_messages]
+        parsed_emails = [ParsedGmailMessage(prefix) for prefix, _ in prefixes]
+    with timed("features_prefix"):
+        feature_rows = [parsed.feature_vector() for parsed in parsed_emails]
+    labels, probabilities = predict(feature_rows)
+    labels, probabilities = np.array(labels), np.array(probabilities)
+
+    stages = np.ones(len(raw_messages), dtype=np.int8)
+    unsure = [
+        index for index, (_, complete) in enumerate(prefixes)
+        if not complete and ham_threshold < probabilities[index] < spam_threshold
+    ]
+    if unsure:
+        with timed("parse"):
+            full = [ParsedGmailMessage(raw_messages[index]) for index in unsure]
+        with timed("features"):
+            full_rows = [parsed.feature_vector() for parsed in full]
+        full_labels, full_probabilities = predict(full_rows)
+        for position, index in enumerate(unsure):
+            parsed_emails[index] = full[position]
+            feature_rows[index] = full_rows[position]
+        labels[unsure] = full_labels
+        probabilities[unsure] = full_probabilities
+        stages[unsure] = 2
+
+    CASCADE_MESSAGES.inc(len(raw_messages) - len(unsure), "prefix")
+    if unsure:
+        CASCADE_MESSAGES.inc(len(unsure), "full")
+    return parsed_emails, feature_rows, labels, probabilities, stages
+
+
+def kernel_predict(model, prefilter=None):
+    """
+    `predict` for the CLI and benchmarks: a loaded model, served through its kernel when it has one.
+
+    With a pre-filter (api/rules.py), rows a rule fires on are labelled spam
+    with probability 1, as serving labels them.
+    """
+    from api.inference import as_kernel, predict_with_proba
+    from api.rules import matrix_columns
+    model = as_kernel(model)
+    spam_column = list(model.classes_).index(1)
+
+    def predict(feature_rows):
+        X = np.array(feature_rows, dtype=np.int64).reshape(len(feature_rows), -1)
+        labels, probabilities = predict_with_proba(model, X)
+        probabilities = probabilities[:, spam_column]
+        if prefilter is not None:
+            fired = prefilter.evaluate(matrix_columns(X)) >= 0
+            labels = np.where(fired, 1, labels)
+            probabilities = np.where(fired, 1.0, probabilities)
+        return labels, probabilities
+    return predict
+
+
+def parse_thresholds(value):
+    """"0.99:0.01" -> (0.99, 0.01): spam threshold, then ham threshold."""
+    spam, _, ham = value.partition(":")
+    return float(spam), float(ham or 1 - float(spam))
+
+
+def cascade_report(raw_messages, predict, thresholds, prefix_bytes=CASCADE_PREFIX_BYTES):
+    """
+    Runs a corpus through the full pipeline, then through the cascade at each threshold pair.
+
+    Parameters:
+        raw_messages (list): Raw message bytes
+        predict (callable): Feature rows -> (labels, spam probabilities)
+        thresholds (list): (spam threshold, ham threshold) pairs
+        prefix_bytes (int): Body bytes stage one reads
+
+    Returns:
+        list: One dict per run, the full pipeline first, with timings and the metrics against the full pipeline
+    """
+    start = time.perf_counter()
+    full_rows = [ParsedGmailMessage(raw_email_bytes).feature_vector() for raw_email_bytes in raw_messages]
+    full_labels, _ = predict(full_rows)
+    full_seconds = time.perf_counter() - start
+    full_spam = np.asarray(full_labels) == 1
+    counts = ConfusionCounts()
+    counts.update_many(full_spam, full_spam)
+    report = [{"run": "full", "thresholds": None, "seconds": full_seconds, "short_circuited": 0.0,
+               "changed": 0, "agreement": 1.0, "metrics": counts.metrics()}]
+
+    for spam_threshold, ham_threshold in thresholds:
+        start = time.perf_counter()
+        _, _, labels, _, stages = cascade_classify(raw_messages, predict, spam_threshold, ham_threshold, prefix_bytes)
+        seconds = time.perf_counter() - start
+        counts = ConfusionCounts()
+        counts.update_many(full_spam, labels == 1)
+        changed = counts.fp + counts.fn
+        report.append({
+            "run": f"{spam_threshold}:{ham_threshold}",
+            "thresholds": (spam_threshold, ham_threshold),
+            "seconds": seconds,
+            "short_circuited": float(np.mean(stages == 1)) if len(stages) else 0.0,
+            "changed": changed,
+            "agreement": 1 - changed / len(raw_messages) if raw_messages else 1.0,
+            "metrics": counts.metrics(),
+        })
+    return report
+
+
+def best_setting(report, min_agreement=CASCADE_MIN_AGREEMENT):
+    """The cascade run of a report that short-circuits most with at least `min_agreement`, None if none does."""
+    runs = [run for run in report[1:] if run["agreement"] >= min_agreement and run["short_circuited"] > 0]
+    return max(runs, key=lambda run: (run["short_circuited"], run["agreement"]), default=None)
+
+
+def print_report(report, size):
+    print(f"{'run':<12} {'msg/s':>8} {'speedup':>8} {'stage one':>10} {'changed':>8} "
+          f"{'agreement':>10} {'accuracy':>9} {'precision':>10} {'recall':>7} {'f1':>6}")
+    full_seconds = report[0]["seconds"]
+    for run in report:
+        metrics = run["metrics"]
+        print(f"{run['run']:<12} {size / run['seconds']:>8.0f} {full_seconds / run['seconds']:>7.2f}x "
+              f"{run['short_circuited']:>10.1%} {run['changed']:>8} "
+              f"{run['agreement']:>10.2%} {metrics['accuracy']:>9} "
+              f"{metrics['precision']:>10} {metrics['recall']:>7} {metrics['f1']:>6}")
+
+
+def main():
+    from api.all_functions import load_model
+    from api.bulk_score import read_messages
+    from api.rules import get_prefilter
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV file with a message column, mbox file or Maildir directory")
+    parser.add_argument("--format", choices=["csv", "mbox", "maildir"], default="csv")
+    parser.add_argument("--model", required=True, help="Model artifact or pickle")
+    parser.add_argument("--thresholds", nargs="+", type=parse_thresholds, default=CANDIDATE_THRESHOLDS,
+                        help="spam:ham probability thresholds of stage one to measure, e.g. 0.99:0.01; "
+                             "a negative ham threshold keeps no ham answers")
+    parser.add_argument("--prefix-bytes", type=int, default=CASCADE_PREFIX_BYTES)
+    parser.add_argument("--limit", type=int, help="Only the first N messages")
+    parser.add_argument("--min-agreement", type=float, default=CASCADE_MIN_AGREEMENT,
+                        help="Share of labels the written setting must leave unchanged")
+    parser.add_argument("--write", action="store_true",
+                        help="Save the best setting next to the model, for serving with CASCADE=1")
+    args = parser.parse_args()
+
+    # Measured with the serving pre-filter (PREFILTER_RULES), since it changes the labels too
+    prefilter = get_prefilter()
+    model = load_model(args.model)
+    predict = kernel_predict(model, prefilter)
+    raw_messages = []
+    for _, email_text in read_messages(args.input, args.format, 5000):
+        if args.limit is not None and len(raw_messages) >= args.limit:
+            break
+        raw_messages.append(email_text.strip().encode("utf-8", errors="surrogatepass"))
+
+    report = cascade_report(raw_messages, predict, args.thresholds, args.prefix_bytes)
+    print(f"{len(raw_messages)} messages, stage one reads {args.prefix_bytes} body bytes; "
+          "metrics are against the full pipeline")
+    print_report(report, len(raw_messages))
+
+    if args.write:
+        run = best_setting(report, args.min_agreement)
+        if run is None:
+            print(f"No setting agrees on {args.min_agreement:.2%} of the labels; nothing written, "
+                  "the model keeps the full pipeline")
+            return
+        write_setting(args.model, model.fingerprint, prefilter.fingerprint if prefilter else None,
+                      args.prefix_bytes, run, len(raw_messages))
+        print(f"Wrote {setting_path(args.model)}: {run['run']}, {run['short_circuited']:.1%} settled by stage one, "
+              f"{run['agreement']:.2%} agreement")
+
+
+if __name__ == "__main__":
+    main()
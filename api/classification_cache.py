@@ -0,0 +1,153 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Where and how much to cache. A Gmail message ID never changes content, so
+# the TTL only bounds how long stale rows from old mailboxes linger.
+CACHE_PATH = os.environ.get("CLASSIFICATION_CACHE_PATH", "classification_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.environ.get("CLASSIFICATION_CACHE_MAX_ENTRIES", 100000))
+CACHE_TTL_SECONDS = int(os.environ.get("CLASSIFICATION_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+LOOKUP_CHUNK = 500  # Message IDs per SELECT, well below SQLite's limit on bound parameters
+EVICT_INTERVAL = 100  # put_many calls between TTL purges and recounts of the table
+EVICT_TO = 0.9  # Share of max_entries left after an eviction, so a full cache is not recounted on every put
+
+
+class ClassificationCache:
+    """
+    SQLite-backed cache of per-message classifications.
+
+    Rows are keyed by (message_id, model_fingerprint) and hold the extracted
+    features, the display headers and the prediction. Entries older than
+    `ttl_seconds` are ignored and purged, and once the table grows past
+    `max_entries` the least recently read rows are evicted.
+
+    The row count is kept as a running upper bound (replaced rows count
+    again), so `put_many` only counts the table when the bound passes
+    `max_entries` and every EVICT_INTERVAL calls, which also picks up the
+    rows other processes wrote to the same file.
+
+    Parameters:
+        path (str): SQLite database file, or ":memory:"
+        max_entries (int): Maximum number of cached rows
+        ttl_seconds (int): Lifetime of a cached row
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS classifications (
+                message_id TEXT NOT NULL,
+                model_fingerprint TEXT NOT NULL,
+                row TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (message_id, model_fingerprint)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON classifications (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        self._puts = 0
+
+    def get_many(self, message_ids, model_fingerprint):
+        """
+        Looks up cached classifications.
+
+        Returns:
+            dict: message_id -> cached row, only for IDs that were found and not expired
+        """
+        if not message_ids:
+            return {}
+
+        now = time.time()
+        message_ids = list(message_ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(message_ids), LOOKUP_CHUNK):
+                chunk = message_ids[start:start + LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT message_id, row FROM classifications "
+                    f"WHERE model_fingerprint = ? AND created_at >= ? AND message_id IN ({','.join('?' * len(chunk))})",
+                    [model_fingerprint, now - self.ttl_seconds, *chunk]
+                ).fetchall()
+                found.update((message_id, json.loads(row)) for message_id, row in rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE classifications SET last_access = ? WHERE message_id = ? AND model_fingerprint = ?",
+                    [(now, message_id, model_fingerprint) for message_id in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(message_ids) - len(found)
+        return found
+
+    def put_many(self, model_fingerprint, rows):
+        """Stores classifications given as a dict of message_id -> row."""
+        if not rows:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?)",
+                [(message_id, model_fingerprint, json.dumps(row), now, now) for message_id, row in rows.items()]
+            )
+            self._count += len(rows)
+            self._puts += 1
+            if self._count > self.max_entries or self._puts >= EVICT_INTERVAL:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._puts = 0
+        self._conn.execute("DELETE FROM classifications WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        if count > self.max_entries:
+            keep = int(self.max_entries * EVICT_TO)
+            self._conn.execute(
+                "DELETE FROM classifications WHERE rowid IN "
+                "(SELECT rowid FROM classifications ORDER BY last_access LIMIT ?)",
+                (count - keep,)
+            )
+            count = keep
+        self._count = count
+
+    def drop(self, model_fingerprint):
+        """
+        Drops every row that was computed by one model, including the rows
+        keyed by its fingerprint plus a pre-filter or cascade ("<fp>+...").
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM classifications WHERE model_fingerprint = ? OR model_fingerprint LIKE ? || '+%'",
+                (model_fingerprint, model_fingerprint)
+            ).rowcount
+            self._count = max(self._count - deleted, 0)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM classifications")
+            self._count = 0
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the process-wide classification cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ClassificationCache()
+        return _cache
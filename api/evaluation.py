@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class ConfusionCounts:
+    """Running confusion matrix of Gmail's folder against the model, with SPAM as positive class."""
+
+    def __init__(self):
+        self.tp = self.fp = self.tn = self.fn = 0
+
+    def update(self, gmail_label, model_label):
+        if model_label == "SPAM":
+            if gmail_label == "SPAM":
+                self.tp += 1
+            else:
+                self.fp += 1
+        elif gmail_label == "SPAM":
+            self.fn += 1
+        else:
+            self.tn += 1
+
+    def update_many(self, actual_spam, predicted_spam):
+        """Counts many rows at once, from boolean arrays of the true and the predicted class."""
+        actual_spam = np.asarray(actual_spam, dtype=bool)
+        predicted_spam = np.asarray(predicted_spam, dtype=bool)
+        self.tp += int(np.count_nonzero(actual_spam & predicted_spam))
+        self.fp += int(np.count_nonzero(~actual_spam & predicted_spam))
+        self.fn += int(np.count_nonzero(actual_spam & ~predicted_spam))
+        self.tn += int(np.count_nonzero(~actual_spam & ~predicted_spam))
+
+    @property
+    def total(self):
+        return self.tp + self.fp + self.tn + self.fn
+
+    def metrics(self):
+        """Accuracy, precision, recall and F1 rounded to 3 places; 0 where undefined, like sklearn."""
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        accuracy = (self.tp + self.tn) / self.total if self.total else 0.0
+        return {
+            "accuracy": round(accuracy, 3),
+            "precision": round(precision, 3),
+            "recall": round(recall, 3),
+            "f1": round(f1, 3)
+        }
+
+
+def evaluate_stream(sources, page=None, per_page=20, mismatches_only=False):
+    """
+    Compares Gmail's folders with the model in one pass.
+
+    Every classified row updates the confusion counters, but result dicts are
+    only built for the rows that land on the requested page. With
+    `mismatches_only` the filter is applied before paginating, so pages and
+    totals count mismatches only.
+
+    Parameters:
+        sources (iterable): (gmail_label, rows) pairs, rows as returned by classify_batch.
+            A generator lets the engine start on one folder while the next is still downloading.
+        page (int): 1-based page to return, or None for every row
+        per_page (int): Rows per page
+        mismatches_only (bool): Only keep rows where Gmail and the model disagree
+
+    Returns:
+        tuple: (result rows, metrics, total number of matching rows)
+    """
+    counts = ConfusionCounts()
+    start = (page - 1) * per_page if page else 0
+    end = start + per_page if page else None
+    results = []
+    total = 0
+
+    for gmail_label, rows in sources:
+        for row in rows:
+            model_label = "SPAM" if row["label"] == 1 else "NOT_SPAM"
+            counts.update(gmail_label, model_label)
+
+            if mismatches_only and gmail_label == model_label:
+                continue
+            if start <= total and (end is None or total < end):
+                results.append({
+                    "subject": row["subject"],
+                    "from": row["from"],
+                    "date": row["date"],
+                    "gmail_label": gmail_label,
+                    "model_label": model_label
+                })
+            total += 1
+
+    return results, counts.metrics(), total
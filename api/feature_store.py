@@ -0,0 +1,246 @@
+"""
+Columnar store of extracted email features, keyed by message hash.
+
+    python -m api.feature_store emails.csv features.arrow --workers 8
+
+Features are kept in an uncompressed Arrow IPC file with compact column
+types (uint8/uint16 counts, bool flags) instead of the int64 columns of
+`processed_emails.csv`. Every column carries the version of the code that
+extracted it, so an update only recomputes the features whose version in
+the feature registry (api/features.py) changed, plus any messages not stored yet. Readers
+memory-map the file and pull just the columns they need into NumPy.
+"""
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+
+from api.all_functions import ParsedEmail
+from api.features import FEATURES, REGISTRY, as_dtype
+
+# One column per registered feature (see api/features.py), stored as its type and tagged with its version
+COLUMN_TYPES = {name: pa.from_numpy_dtype(feature.dtype) for name, feature in REGISTRY.items()}
+COLUMNS = list(COLUMN_TYPES)
+COLUMN_VERSIONS = {name: feature.version for name, feature in REGISTRY.items()}
+
+
+def message_hash(email_text):
+    """16-byte key of a raw email."""
+    return hashlib.sha256(email_text.encode("utf-8", errors="surrogatepass")).digest()[:16]
+
+
+def _extract_rows(args):
+    texts, names = args
+    rows = []
+    for email_text in texts:
+        parsed = ParsedEmail(email_text.strip())
+        rows.append([int(REGISTRY[name].extract(parsed)) for name in names])
+    return rows
+
+
+def compute_columns(texts, names, pool=None, workers=1):
+    """Computes the named columns for every text. Returns name -> compact NumPy array."""
+    if pool is not None and workers > 1 and len(texts) > workers:
+        size = -(-len(texts) // workers)
+        parts = [(texts[i:i + size], names) for i in range(0, len(texts), size)]
+        rows = [row for part in pool.map(_extract_rows, parts) for row in part]
+    else:
+        rows = _extract_rows((texts, names))
+
+    matrix = np.array(rows, dtype=np.int64).reshape(len(rows), len(names))
+    return {name: as_dtype(matrix[:, j], REGISTRY[name].dtype) for j, name in enumerate(names)}
+
+
+def _schema():
+    fields = [pa.field("message_hash", pa.binary(16))]
+    fields += [
+        pa.field(name, COLUMN_TYPES[name], metadata={"version": str(COLUMN_VERSIONS[name])})
+        for name in COLUMNS
+    ]
+    return pa.schema(fields)
+
+
+class FeatureStore:
+    """
+    Feature store backed by one Arrow IPC file.
+
+    Parameters:
+        path (str): Store file, created on the first update
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read_table(self, columns=None):
+        """Memory-maps the store and returns it as an Arrow table, or None if it does not exist yet."""
+        if not os.path.exists(self.path):
+            return None
+        table = pa.ipc.open_file(pa.memory_map(self.path, "r")).read_all()
+        return table.select(columns) if columns else table
+
+    def stale_columns(self, table=None):
+        """Columns missing from the store or extracted by an older version of their code."""
+        table = table if table is not None else self.read_table()
+        if table is None:
+            return list(COLUMNS)
+        stale = []
+        for name in COLUMNS:
+            index = table.schema.get_field_index(name)
+            metadata = (table.schema.field(index).metadata or {}) if index >= 0 else {}
+            if metadata.get(b"version") != str(COLUMN_VERSIONS[name]).encode():
+                stale.append(name)
+        return stale
+
+    def update(self, messages, chunk_size=5000, workers=1):
+        """
+        Brings the store up to date with a corpus of raw emails.
+
+        Stored messages only get their stale columns recomputed, new messages
+        get every column. Stored messages that are absent from the corpus are
+        kept if none of their columns are stale, and dropped otherwise since
+        they can no longer be recomputed.
+
+        Parameters:
+            messages (iterable): Raw email texts
+            chunk_size (int): Messages extracted per batch
+            workers (int): Worker processes for extraction
+
+        Returns:
+            dict: Counts of added, recomputed and dropped messages and the stale columns
+        """
+        existing = self.read_table()
+        stale = self.stale_columns(existing)
+        stored_hashes = existing.column("message_hash").to_pylist() if existing is not None else []
+        position = {key: i for i, key in enumerate(stored_hashes)}
+
+        recomputed = {name: np.zeros(len(stored_hashes), COLUMN_TYPES[name].to_pandas_dtype()) for name in stale}
+        seen = np.zeros(len(stored_hashes), dtype=bool)
+        new_hashes = []
+        new_columns = {name: [] for name in COLUMNS}
+        new_seen = set()
+
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            chunk = []
+            for email_text in messages:
+                chunk.append(email_text)
+                if len(chunk) == chunk_size:
+                    self._update_chunk(chunk, stale, position, seen, recomputed, new_hashes, new_columns, new_seen, pool, workers)
+                    chunk = []
+            if chunk:
+                self._update_chunk(chunk, stale, position, seen, recomputed, new_hashes, new_columns, new_seen, pool, workers)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if not new_hashes and not stale:
+            return {"added": 0, "recomputed": 0, "dropped": 0, "stale_columns": stale}
+
+        keep = seen if stale else np.ones(len(stored_hashes), dtype=bool)
+        arrays = [pa.array([key for key, kept in zip(stored_hashes, keep) if kept] + new_hashes, pa.binary(16))]
+        for name in COLUMNS:
+            if name in stale:
+                old_values = recomputed[name][keep]
+            else:
+                old_values = existing.column(name).to_numpy()[keep] if existing is not None else np.array([])
+            new_values = np.concatenate(new_columns[name]) if new_columns[name] else np.array([])
+            values = as_dtype(np.concatenate([old_values, new_values]), REGISTRY[name].dtype)
+            arrays.append(pa.array(values, COLUMN_TYPES[name]))
+
+        self._write(pa.Table.from_arrays(arrays, schema=_schema()))
+        return {
+            "added": len(new_hashes),
+            "recomputed": int(seen.sum()) if stale else 0,
+            "dropped": int(len(stored_hashes) - keep.sum()),
+            "stale_columns": stale,
+        }
+
+    def _update_chunk(self, chunk, stale, position, seen, recomputed, new_hashes, new_columns, new_seen, pool, workers):
+        todo_existing, todo_new = [], []
+        for email_text in chunk:
+            key = message_hash(email_text)
+            i = position.get(key)
+            if i is not None:
+                if stale and not seen[i]:
+                    todo_existing.append((i, email_text))
+                seen[i] = True
+            elif key not in new_seen:
+                new_seen.add(key)
+                todo_new.append((key, email_text))
+
+        if todo_existing:
+            values = compute_columns([email_text for _, email_text in todo_existing], stale, pool, workers)
+            rows = [i for i, _ in todo_existing]
+            for name in stale:
+                recomputed[name][rows] = values[name]
+
+        if todo_new:
+            values = compute_columns([email_text for _, email_text in todo_new], COLUMNS, pool, workers)
+            new_hashes.extend(key for key, _ in todo_new)
+            for name in COLUMNS:
+                new_columns[name].append(values[name])
+
+    def _write(self, table):
+        # Write next to the store and swap it in, so readers never see a partial file
+        tmp_path = self.path + ".tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, self.path)
+
+    def load_columns(self, names=FEATURES):
+        """Returns name -> NumPy array, zero-copy views of the memory-mapped file for numeric columns."""
+        table = self.read_table(list(names))
+        return {name: table.column(name).combine_chunks().to_numpy(zero_copy_only=False) for name in names}
+
+    def load_matrix(self, names=FEATURES, dtype=np.float32):
+        """Loads a column subset into one (rows x len(names)) matrix, ready for training."""
+        columns = self.load_columns(names)
+        size = len(next(iter(columns.values()))) if columns else 0
+        matrix = np.empty((size, len(names)), dtype=dtype)
+        for j, name in enumerate(names):
+            matrix[:, j] = columns[name]
+        return matrix
+
+    def iter_chunks(self, names=COLUMNS, chunk_size=65536):
+        """
+        Yields the store `chunk_size` rows at a time, as name -> NumPy array.
+
+        Rows are sliced from the memory-mapped file, so memory use depends on
+        the chunk size and not on the size of the store. Each chunk also holds
+        "message_hash", as a (rows x 16) uint8 array.
+        """
+        table = self.read_table(["message_hash", *names])
+        if table is None:
+            return
+        for offset in range(0, table.num_rows, chunk_size):
+            chunk = table.slice(offset, chunk_size)
+            hashes = chunk.column("message_hash").combine_chunks()
+            data = np.frombuffer(hashes.buffers()[1], dtype=np.uint8)
+            columns = {"message_hash": data[hashes.offset * 16:(hashes.offset + len(hashes)) * 16].reshape(-1, 16)}
+            for name in names:
+                columns[name] = chunk.column(name).combine_chunks().to_numpy(zero_copy_only=False)
+            yield columns
+
+
+def main():
+    from api.bulk_score import read_messages
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV file with a message column, mbox file or Maildir directory")
+    parser.add_argument("store", help="Feature store file (.arrow)")
+    parser.add_argument("--format", choices=["csv", "mbox", "maildir"], default="csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    messages = (email_text for _, email_text in read_messages(args.input, args.format, args.chunk_size))
+    stats = FeatureStore(args.store).update(messages, args.chunk_size, args.workers)
+    print(f"Added {stats['added']}, recomputed {stats['recomputed']}, dropped {stats['dropped']} messages; "
+          f"stale columns: {', '.join(stats['stale_columns']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
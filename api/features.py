@@ -0,0 +1,133 @@
+"""
+The feature registry: name, storage type, version and extractor of every feature.
+
+Serving (api.app), bulk scoring, the feature store, the testing scripts and
+offline training all take their features from here, so a change to an
+extractor reaches every one of them at once:
+
+    feature_matrix(emails)              N x 11 model inputs, for serving and training
+    feature_frame(emails)               The same as a DataFrame with named columns
+    REGISTRY["spam_score"].column(...)  One feature alone, as the feature store recomputes them
+
+Per message, `ParsedEmail.features()` computes all model features in one
+fused pass; each registered extractor computes its feature on its own and
+gives the same value. testing/check_feature_parity.py checks both against
+each other and against the functions the shipped models were trained with.
+"""
+import numpy as np
+
+from api.spam_lexicon import SPAM_LEXICON
+from api.text_features import DOMAIN_RE, LinkScan, ScanBudget, count_words, get_feature_config
+
+
+class Feature:
+    """
+    One registered feature.
+
+    Parameters:
+        name (str): Column name
+        dtype (str): NumPy type it is stored as; counts saturate at the type's maximum
+        version (int): Bump whenever the extraction changes, so stored copies are recomputed
+        extract (callable): Parsed email -> value
+        model (bool): Whether the classifiers take it as input
+    """
+
+    def __init__(self, name, dtype, version, extract, model=True):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.version = version
+        self.extract = extract
+        self.model = model
+
+    def column(self, parsed_emails):
+        """The feature of many parsed emails, as one array of `dtype`."""
+        values = np.fromiter((int(self.extract(parsed)) for parsed in parsed_emails), np.int64, len(parsed_emails))
+        return as_dtype(values, self.dtype)
+
+
+def as_dtype(values, dtype):
+    """Converts integer values to a storage type, saturating counts at its maximum."""
+    dtype = np.dtype(dtype)
+    values = np.asarray(values)
+    if dtype == np.bool_:
+        return values.astype(bool)
+    return np.clip(values, 0, np.iinfo(dtype).max).astype(dtype)
+
+
+def _chunks(parsed, name):
+    # The text regions a text feature scans, under the feature config's plan and budget
+    config = get_feature_config()
+    return config, parsed.scan(name, config, ScanBudget(config.scan_time_budget))
+
+
+def _num_words(parsed):
+    _, chunks = _chunks(parsed, "num_words")
+    return sum(count_words(chunk) for chunk in chunks)
+
+
+def _spam_score(parsed):
+    _, chunks = _chunks(parsed, "spam_score")
+    return sum(SPAM_LEXICON.count(chunk) for chunk in chunks)
+
+
+def _num_links(parsed):
+    _, chunks = _chunks(parsed, "num_links")
+    links = set()
+    for chunk in chunks:
+        links.update(LinkScan(chunk, links=False).urls)
+        links.update(DOMAIN_RE.findall(chunk))
+    return len(links)
+
+
+def _num_suspicious_links(parsed):
+    config, chunks = _chunks(parsed, "num_suspicious_links")
+    return sum(LinkScan(chunk, urls=False).num_suspicious_links(config) for chunk in chunks)
+
+
+# Model features first, in the column order the classifiers were trained on
+REGISTRY = {feature.name: feature for feature in [
+    Feature("num_words", "uint32", 1, _num_words),
+    Feature("num_links", "uint16", 1, _num_links),
+    Feature("num_attachments", "uint8", 1, lambda parsed: parsed.num_attachments),
+    Feature("num_suspicious_attachments", "uint8", 1, lambda parsed: parsed.num_suspicious_attachments),
+    Feature("has_html", "bool", 1, lambda parsed: parsed.has_html),
+    Feature("spam_score", "uint16", 1, _spam_score),
+    Feature("num_suspicious_links", "uint16", 1, _num_suspicious_links),
+    Feature("is_fake_domain", "bool", 1, lambda parsed: parsed.is_fake_domain),
+    Feature("is_missing_to", "bool", 1, lambda parsed: parsed.is_missing_to),
+    Feature("num_recipients", "uint16", 1, lambda parsed: parsed.num_recipients),
+    Feature("num_subject_words", "uint16", 1, lambda parsed: parsed.num_subject_words),
+    # Not a model input; the rule-based labeller needs it ("HTML without a text body")
+    Feature("is_body_empty", "bool", 1, lambda parsed: not (parsed.body or "").strip(), model=False),
+]}
+
+FEATURES = [name for name, feature in REGISTRY.items() if feature.model]
+FEATURE_VERSIONS = {name: REGISTRY[name].version for name in FEATURES}
+
+
+def parse_emails(emails):
+    """ParsedEmail for every raw email text; emails that are parsed already are kept."""
+    # api.all_functions imports this module for FEATURES, so ParsedEmail is imported on use
+    from api.all_functions import ParsedEmail
+    return [email if isinstance(email, ParsedEmail) else ParsedEmail(email.strip()) for email in emails]
+
+
+def feature_matrix(emails, dtype=np.int64):
+    """
+    Model features of many emails, one row per email in `FEATURES` order.
+
+    Parameters:
+        emails (list): Raw email texts or parsed emails
+        dtype: Type of the matrix; int64 is what serving feeds the models
+
+    Returns:
+        numpy.ndarray: N x len(FEATURES) matrix
+    """
+    rows = [parsed.feature_vector() for parsed in parse_emails(emails)]
+    return np.array(rows, dtype=dtype).reshape(len(rows), len(FEATURES))
+
+
+def feature_frame(emails):
+    """Same as `feature_matrix`, as a DataFrame with one column per feature, as the models were fitted on."""
+    import pandas as pd  # Only training and the offline tools want a DataFrame
+    return pd.DataFrame(feature_matrix(emails), columns=FEATURES)
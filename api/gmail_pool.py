@@ -0,0 +1,253 @@
+"""
+Per-user pool of Gmail credentials and API services.
+
+Credentials are read from tokens/<email>.json once and kept in memory. They
+are refreshed GMAIL_REFRESH_MARGIN seconds before they expire, under a
+per-user lock so concurrent requests trigger a single refresh, and the new
+token is written back. Each user gets one Gmail service, built once from the
+cached discovery document. Its transport gives every thread its own
+keep-alive HTTP connection, because httplib2 connections are not thread-safe.
+
+Tokens are stored as the JSON google-auth writes (`Credentials.to_json`),
+readable by the owner only. Unlike a pickle, loading one cannot run code.
+Legacy tokens/<email>.pickle files are converted on first use and removed.
+"""
+import datetime
+import json
+import logging
+import os
+import pickle
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+
+TOKEN_FOLDER = os.environ.get("GMAIL_TOKEN_FOLDER", "tokens")
+GMAIL_REFRESH_MARGIN = float(os.environ.get("GMAIL_REFRESH_MARGIN", 300))  # Seconds before expiry
+GMAIL_HTTP_TIMEOUT = float(os.environ.get("GMAIL_HTTP_TIMEOUT", 60))
+
+# The Google client libraries are imported on first use so that starting the app stays cheap.
+# The Gmail discovery document is kept in this file instead of being looked up on every build().
+GMAIL_DISCOVERY_PATH = os.environ.get("GMAIL_DISCOVERY_PATH", "gmail_discovery.json")
+GMAIL_DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+def gmail_discovery_document():
+    """
+    Returns the Gmail v1 discovery document as JSON text.
+
+    Read from GMAIL_DISCOVERY_PATH, or on first use taken from the copy bundled
+    with google-api-python-client (fetched from Google if there is none) and
+    saved there. Delete the file to pick up a newer document.
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is None:
+            if os.path.exists(GMAIL_DISCOVERY_PATH):
+                with open(GMAIL_DISCOVERY_PATH) as file:
+                    _discovery_document = file.read()
+            else:
+                from googleapiclient.discovery_cache import get_static_doc
+                document = get_static_doc('gmail', 'v1')
+                if document is None:
+                    import urllib.request
+                    with urllib.request.urlopen(GMAIL_DISCOVERY_URL, timeout=30) as response:
+                        document = response.read().decode('utf-8')
+                json.loads(document)  # Never cache a truncated or error response
+                tmp_path = GMAIL_DISCOVERY_PATH + ".tmp"
+                with open(tmp_path, "w") as file:
+                    file.write(document)
+                os.replace(tmp_path, GMAIL_DISCOVERY_PATH)
+                _discovery_document = document
+        return _discovery_document
+
+def build_gmail_service(creds=None, http=None):
+    """Builds a Gmail API service from the cached discovery document, from credentials or an authorized http."""
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(gmail_discovery_document(), credentials=creds, http=http)
+
+
+class ThreadLocalHttp:
+    """
+    httplib2-compatible transport that hands each thread its own authorized connection.
+
+    Parameters:
+        credentials: google-auth credentials shared by every thread
+        http_factory (callable): Returns a new httplib2.Http-like object
+    """
+
+    def __init__(self, credentials, http_factory):
+        self.credentials = credentials
+        self._http_factory = http_factory
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            from google_auth_httplib2 import AuthorizedHttp
+            http = self._local.http = AuthorizedHttp(self.credentials, http=self._http_factory())
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+
+class _UserSession:
+    def __init__(self, credentials, service):
+        self.credentials = credentials
+        self.service = service
+
+
+class GmailPool:
+    """
+    Credentials and Gmail services of every user seen by this process.
+
+    Parameters:
+        token_folder (str): Where tokens/<email>.json files live
+        http_factory (callable): Returns a new httplib2.Http-like transport, for tests and benchmarks
+        auth_request: google.auth.transport.Request used for refreshes, defaults to a keep-alive requests session
+    """
+
+    def __init__(self, token_folder=TOKEN_FOLDER, http_factory=None, auth_request=None):
+        self.token_folder = token_folder
+        self._http_factory = http_factory
+        self._auth_request = auth_request
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._user_locks = {}
+
+    def _user_lock(self, email):
+        with self._lock:
+            return self._user_locks.setdefault(email, threading.Lock())
+
+    def token_path(self, email, extension="json"):
+        return os.path.join(self.token_folder, f"{email}.{extension}")
+
+    def credentials(self, email):
+        """
+        Returns valid credentials for `email`, refreshing them when they are about to expire.
+
+        Returns None when there is no stored token or it can no longer be refreshed,
+        in which case the user has to log in again.
+        """
+        user_session = self._session(email)
+        if user_session is None:
+            return None
+        if self._needs_refresh(user_session.credentials):
+            with self._user_lock(email):
+                user_session = self._sessions.get(email)
+                if user_session is None:
+                    return None
+                if self._needs_refresh(user_session.credentials):
+                    if not self._refresh(email, user_session.credentials):
+                        self.forget(email)
+                        return None
+        return user_session.credentials
+
+    def service(self, email):
+        """Returns the user's Gmail service; safe to use from any thread."""
+        if self.credentials(email) is None:
+            raise Exception(f"No valid Gmail token for {email}, log in again.")
+        return self._sessions[email].service
+
+    def store(self, email, credentials):
+        """Saves new credentials, after a login, and starts serving them."""
+        with self._user_lock(email):
+            self._save(email, credentials)
+            self._sessions[email] = self._new_session(credentials)
+
+    def forget(self, email):
+        with self._lock:
+            self._sessions.pop(email, None)
+
+    def _session(self, email):
+        user_session = self._sessions.get(email)
+        if user_session is None:
+            with self._user_lock(email):
+                user_session = self._sessions.get(email)
+                if user_session is None:
+                    credentials = self._load(email)
+                    if credentials is None:
+                        return None
+                    user_session = self._sessions[email] = self._new_session(credentials)
+        return user_session
+
+    def _new_session(self, credentials):
+        http_factory = self._http_factory
+        if http_factory is None:
+            import httplib2
+            http_factory = lambda: httplib2.Http(timeout=GMAIL_HTTP_TIMEOUT)
+        return _UserSession(credentials, build_gmail_service(http=ThreadLocalHttp(credentials, http_factory)))
+
+    @staticmethod
+    def _needs_refresh(credentials):
+        if not credentials.token:
+            return True
+        if credentials.expiry is None:
+            return False
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - now < datetime.timedelta(seconds=GMAIL_REFRESH_MARGIN)
+
+    def _refresh(self, email, credentials):
+        from google.auth.exceptions import RefreshError
+        if not credentials.refresh_token:
+            return False
+        if self._auth_request is None:
+            import google.auth.transport.requests
+            self._auth_request = google.auth.transport.requests.Request()
+        try:
+            credentials.refresh(self._auth_request)
+        except RefreshError as error:
+            logger.warning("Gmail token refresh failed for %s: %s", email, error)
+            return False
+        self._save(email, credentials)
+        return True
+
+    def _load(self, email):
+        path = self.token_path(email)
+        if os.path.exists(path):
+            from google.oauth2.credentials import Credentials
+            with open(path) as token_file:
+                info = json.load(token_file)
+            try:
+                return Credentials.from_authorized_user_info(info, info.get("scopes") or SCOPES)
+            except ValueError as error:
+                logger.warning("Ignoring unusable Gmail token %s: %s", path, error)
+                return None
+
+        legacy_path = self.token_path(email, "pickle")
+        if os.path.exists(legacy_path):
+            # Written by earlier versions of this app; converted once, then never unpickled again
+            with open(legacy_path, "rb") as token_file:
+                credentials = pickle.load(token_file)
+            self._save(email, credentials)
+            os.remove(legacy_path)
+            return credentials
+        return None
+
+    def _save(self, email, credentials):
+        os.makedirs(self.token_folder, exist_ok=True)
+        path = self.token_path(email)
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as token_file:
+            token_file.write(credentials.to_json())
+        os.replace(tmp_path, path)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_gmail_pool():
+    """Returns the process-wide Gmail pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = GmailPool()
+        return _pool
@@ -0,0 +1,192 @@
+"""
+NumPy inference kernels for the served linear models.
+
+A `LinearKernel` holds the arrays of a fitted ComplementNB
+(`feature_log_prob_`) or binary LogisticRegression (`coef_`, `intercept_`)
+and scores a feature matrix with one matmul, skipping sklearn's input
+validation and dispatch. It reproduces the estimator's `predict` and
+`predict_proba` bit for bit: the same matmul on the same int64 matrix, the
+same normalization, and libm's exp for the logistic sigmoid, which is what
+scipy's expit uses (NumPy's vectorized exp can differ in the last bit).
+
+sklearn changed how it normalizes naive Bayes log-likelihoods between
+releases, so `from_estimator` keeps the formulation that reproduces the
+estimator on validation rows and refuses the conversion if none does.
+Kernels pickle without any sklearn objects, so `python -m api.model_registry
+export` turns a pickled model into an artifact that serves without sklearn.
+"""
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NORMALIZERS = ("shifted", "log1p")
+
+
+def _logsumexp_shifted(jll):
+    # scipy.special.logsumexp up to scipy 1.14, used by sklearn up to 1.6
+    jll_max = np.amax(jll, axis=1, keepdims=True)
+    jll_max[~np.isfinite(jll_max)] = 0
+    with np.errstate(divide="ignore"):
+        out = np.log(np.sum(np.exp(jll - jll_max), axis=1))
+    out += np.squeeze(jll_max, axis=1)
+    return out
+
+
+def _logsumexp_log1p(jll):
+    # sklearn.utils._array_api._logsumexp (sklearn 1.7+), as in scipy 1.15+
+    jll_max = np.max(jll, axis=1, keepdims=True)
+    index_max = jll == jll_max
+    jll = jll.copy()
+    jll[index_max] = -np.inf
+    m = np.sum(index_max.astype(jll.dtype), axis=1, keepdims=True, dtype=jll.dtype)
+    shift = np.where(np.isfinite(jll_max), jll_max, 0)
+    s = np.sum(np.exp(jll - shift), axis=1, keepdims=True, dtype=jll.dtype)
+    s = np.where(s == 0, s, s / m)
+    out = np.log1p(s) + np.log(m) + jll_max
+    return np.squeeze(out, axis=1)
+
+
+_LOGSUMEXP = {"shifted": _logsumexp_shifted, "log1p": _logsumexp_log1p}
+
+
+def _expit(value):
+    # libm exp, like scipy.special.expit
+    try:
+        return 1.0 / (1.0 + math.exp(-value))
+    except OverflowError:
+        return 0.0
+
+
+class LinearKernel:
+    """
+    Scores feature matrices for a ComplementNB or binary logistic regression model.
+
+    Parameters:
+        kind (str): "complement_nb" or "logistic_regression"
+        classes (array): Class labels, in the estimator's `classes_` order
+        weights (array): `feature_log_prob_` or `coef_`, one row per class (one row for binary LR)
+        offset (array): Added to the scores: `intercept_`, or `class_log_prior_` for one-class NB, else None
+        normalizer (str): logsumexp formulation for naive Bayes, one of NORMALIZERS
+    """
+
+    def __init__(self, kind, classes, weights, offset=None, normalizer="shifted"):
+        if kind not in ("complement_nb", "logistic_regression"):
+            raise ValueError(f"unsupported kernel kind {kind!r}")
+        if normalizer not in NORMALIZERS:
+            raise ValueError(f"normalizer must be one of {', '.join(NORMALIZERS)}, not {normalizer!r}")
+        self.kind = kind
+        self.classes_ = np.asarray(classes)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.offset = None if offset is None else np.asarray(offset, dtype=np.float64)
+        self.normalizer = normalizer
+        self.n_features_in_ = self.weights.shape[1]
+
+    @classmethod
+    def from_estimator(cls, estimator, validation_rows=None):
+        """
+        Builds the kernel of a fitted estimator and checks it on validation rows.
+
+        Parameters:
+            estimator: Fitted ComplementNB or binary LogisticRegression
+            validation_rows (array): Feature rows to compare predictions on, defaults to `validation_matrix`
+
+        Raises:
+            TypeError: If the estimator has no kernel
+            ValueError: If no kernel reproduces the estimator exactly
+        """
+        name = type(estimator).__name__
+        if name == "ComplementNB":
+            offset = estimator.class_log_prior_ if len(estimator.classes_) == 1 else None
+            candidates = [
+                cls("complement_nb", estimator.classes_, estimator.feature_log_prob_, offset, normalizer)
+                for normalizer in NORMALIZERS
+            ]
+        elif name == "LogisticRegression" and len(estimator.classes_) == 2:
+            candidates = [cls("logistic_regression", estimator.classes_, estimator.coef_, estimator.intercept_)]
+        else:
+            raise TypeError(f"no inference kernel for {name} with {len(estimator.classes_)} classes")
+
+        X = validation_matrix(estimator.n_features_in_) if validation_rows is None else np.asarray(validation_rows)
+        expected = (estimator.predict(X), estimator.predict_proba(X))
+        for kernel in candidates:
+            if kernel.matches(X, *expected):
+                kernel.fingerprint = getattr(estimator, "fingerprint", None)
+                return kernel
+        raise ValueError(f"no kernel reproduces this {name} bit for bit")
+
+    def matches(self, X, labels, probabilities):
+        """True if the kernel gives exactly these predictions for X."""
+        kernel_labels, kernel_probabilities = self.predict_with_proba(X)
+        return (np.array_equal(kernel_labels, labels) and kernel_probabilities.dtype == probabilities.dtype
+                and kernel_probabilities.tobytes() == np.ascontiguousarray(probabilities).tobytes())
+
+    def _scores(self, X):
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"expected a matrix with {self.n_features_in_} feature columns, got shape {X.shape}")
+        scores = X @ self.weights.T
+        if self.offset is not None:
+            scores = scores + self.offset
+        return scores
+
+    def predict_with_proba(self, X):
+        """
+        Labels and class probabilities from a single matmul.
+
+        Returns:
+            tuple: (labels as `predict` returns them, probabilities as `predict_proba` returns them)
+        """
+        scores = self._scores(X)
+        if self.kind == "logistic_regression":
+            scores = scores.reshape(-1)
+            positive = np.fromiter(map(_expit, scores.tolist()), dtype=np.float64, count=len(scores))
+            labels = self.classes_[(scores > 0).astype(np.intp)]
+            return labels, np.stack([1 - positive, positive], axis=1)
+
+        labels = self.classes_[np.argmax(scores, axis=1)]
+        log_probabilities = scores - np.atleast_2d(_LOGSUMEXP[self.normalizer](scores)).T
+        return labels, np.exp(log_probabilities)
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+    def predict_proba(self, X):
+        return self.predict_with_proba(X)[1]
+
+
+def validation_matrix(n_features, rows=4096, seed=0):
+    """Deterministic feature rows for checking a kernel: mostly small counts, some large, all-zero rows included."""
+    rng = np.random.default_rng(seed)
+    matrix = rng.integers(0, 8, (rows, n_features))
+    large = rng.random((rows, n_features)) < 0.1
+    matrix[large] = rng.integers(0, 5000, int(large.sum()))
+    matrix[:16] = 0
+    return matrix.astype(np.int64)
+
+
+def as_kernel(model):
+    """
+    The kernel for a loaded model, or the model itself when it has no kernel.
+
+    Kernels, and models that have none, are returned unchanged, so sklearn
+    estimators of other types keep serving through sklearn.
+    """
+    if isinstance(model, LinearKernel):
+        return model
+    try:
+        return LinearKernel.from_estimator(model)
+    except (TypeError, ValueError) as error:
+        logger.warning("Serving %s through sklearn: %s", type(model).__name__, error)
+        return model
+
+
+def predict_with_proba(model, X):
+    """(labels, probabilities) from a kernel or from any classifier with `predict_proba`."""
+    if isinstance(model, LinearKernel):
+        return model.predict_with_proba(X)
+    probabilities = model.predict_proba(X)
+    # argmax of predict_proba is what predict returns, so one call gives both
+    return model.classes_[probabilities.argmax(axis=1)], probabilities
@@ -0,0 +1,235 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from api.all_functions import execute_with_retry, list_message_ids
+
+
+# Serve the inbox and spam views from a locally synced index instead of listing Gmail on every request
+MAILBOX_SYNC = os.environ.get("MAILBOX_SYNC", "0") == "1"
+MAILBOX_INDEX_PATH = os.environ.get("MAILBOX_INDEX_PATH", "mailbox_index.sqlite3")
+# How many of the newest messages per label a full sync pulls in
+INITIAL_SYNC_MESSAGES = int(os.environ.get("MAILBOX_INITIAL_SYNC_MESSAGES", 200))
+SYNC_LABELS = ("INBOX", "SPAM")
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+
+class MailboxIndex:
+    """
+    Local per-user index of message metadata and classifications.
+
+    The first sync for a user records the mailbox historyId and indexes the
+    newest messages of every synced label. Later syncs only ask Gmail for the
+    history since that ID, adding, removing and relabeling messages in the
+    index. If Gmail no longer has that much history (HTTP 404), the user
+    falls back to a full sync.
+
+    Parameters:
+        path (str): SQLite database file, or ":memory:"
+        labels (tuple): Gmail labels kept in the index
+        initial_messages (int): Messages per label pulled in by a full sync
+    """
+
+    def __init__(self, path=MAILBOX_INDEX_PATH, labels=SYNC_LABELS, initial_messages=INITIAL_SYNC_MESSAGES):
+        self.labels = labels
+        self.initial_messages = initial_messages
+        self._lock = threading.Lock()
+        self._user_locks = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                user TEXT PRIMARY KEY,
+                history_id TEXT NOT NULL,
+                synced_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                user TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                row TEXT NOT NULL,
+                PRIMARY KEY (user, message_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_order ON messages (user, seq);
+        """)
+        self._conn.commit()
+
+    def _user_lock(self, user):
+        with self._lock:
+            return self._user_locks.setdefault(user, threading.Lock())
+
+    def history_id(self, user):
+        with self._lock:
+            row = self._conn.execute("SELECT history_id FROM sync_state WHERE user = ?", (user,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, user, service_factory, classify):
+        """
+        Brings the user's index up to date with Gmail.
+
+        Parameters:
+            user (str): Key the index is stored under, usually the email address
+            service_factory (callable): Builds a Gmail service for this user
+            classify (callable): classify(message_ids, service_factory) -> dict of message_id -> row
+
+        Returns:
+            str: "full" or "incremental", whichever sync ran
+        """
+        from googleapiclient.errors import HttpError
+        with self._user_lock(user):
+            history_id = self.history_id(user)
+            if history_id is not None:
+                try:
+                    self._incremental_sync(user, history_id, service_factory, classify)
+                    return "incremental"
+                except HttpError as error:
+                    if error.resp.status != 404:  # 404 means the history ID expired
+                        raise
+            self._full_sync(user, service_factory, classify)
+            return "full"
+
+    def _full_sync(self, user, service_factory, classify):
+        service = service_factory()
+        # Read the history ID first so nothing that changes during the listing is missed
+        history_id = execute_with_retry(service.users().getProfile(userId='me'))['historyId']
+
+        labels_by_id = {}
+        order = []
+        for label in self.labels:
+            page_token = None
+            listed = 0
+            while listed < self.initial_messages:
+                message_ids, page_token = list_message_ids(
+                    service, label, min(100, self.initial_messages - listed), page_token
+                )
+                for message_id in message_ids:
+                    if message_id not in labels_by_id:
+                        order.append(message_id)
+                    labels_by_id.setdefault(message_id, set()).add(label)
+                listed += len(message_ids)
+                if not page_token or not message_ids:
+                    break
+
+        rows = classify(order, service_factory)
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE user = ?", (user,))
+            # Gmail lists newest first, the index orders by seq descending
+            self._conn.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                [
+                    (user, message_id, _encode_labels(labels_by_id[message_id]), len(order) - position, json.dumps(rows[message_id]))
+                    for position, message_id in enumerate(order) if message_id in rows
+                ]
+            )
+            self._set_history_id(user, history_id)
+            self._conn.commit()
+
+    def _incremental_sync(self, user, history_id, service_factory, classify):
+        service = service_factory()
+        changes = {}  # message_id -> current labels, or None once deleted
+        page_token = None
+        latest_history_id = history_id
+
+        while True:
+            request_kwargs = {'userId': 'me', 'startHistoryId': history_id, 'historyTypes': HISTORY_TYPES}
+            if page_token:
+                request_kwargs['pageToken'] = page_token
+            response = execute_with_retry(service.users().history().list(**request_kwargs))
+
+            for record in response.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    message = item['message']
+                    changes[message['id']] = set(message.get('labelIds', []))
+                for item in record.get('messagesDeleted', []):
+                    changes[item['message']['id']] = None
+                for item in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                    message = item['message']
+                    if changes.get(message['id'], ()) is not None:
+                        changes[message['id']] = set(message.get('labelIds', []))
+
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        with self._lock:
+            indexed = {
+                message_id for (message_id,) in self._conn.execute(
+                    "SELECT message_id FROM messages WHERE user = ?", (user,)
+                )
+            }
+        # Added messages, and older ones just moved into a synced label, need classifying
+        new_ids = [
+            message_id for message_id, labels in changes.items()
+            if message_id not in indexed and labels and labels & set(self.labels)
+        ]
+        rows = classify(new_ids, service_factory) if new_ids else {}
+
+        with self._lock:
+            next_seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE user = ?", (user,)
+            ).fetchone()[0]
+            for message_id, labels in changes.items():
+                synced_labels = (labels or set()) & set(self.labels)
+                if not synced_labels:
+                    self._conn.execute("DELETE FROM messages WHERE user = ? AND message_id = ?", (user, message_id))
+                elif message_id in indexed:
+                    self._conn.execute(
+                        "UPDATE messages SET labels = ? WHERE user = ? AND message_id = ?",
+                        (_encode_labels(synced_labels), user, message_id)
+                    )
+                elif message_id in rows:
+                    self._conn.execute(
+                        "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                        (user, message_id, _encode_labels(synced_labels), next_seq, json.dumps(rows[message_id]))
+                    )
+                    next_seq += 1
+            self._set_history_id(user, latest_history_id)
+            self._conn.commit()
+
+    def _set_history_id(self, user, history_id):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)", (user, str(history_id), time.time())
+        )
+
+    def page(self, user, label, offset=0, limit=30):
+        """
+        Reads one page of a label from the index, newest first.
+
+        Returns:
+            tuple: (rows, next offset as a string or None on the last page)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row FROM messages WHERE user = ? AND labels LIKE ? ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (user, f"%,{label},%", limit + 1, offset)
+            ).fetchall()
+        next_offset = str(offset + limit) if len(rows) > limit else None
+        return [json.loads(row) for (row,) in rows[:limit]], next_offset
+
+    def forget(self, user):
+        """Drops the user's index so the next sync is a full one."""
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE user = ?", (user,))
+            self._conn.execute("DELETE FROM sync_state WHERE user = ?", (user,))
+            self._conn.commit()
+
+
+def _encode_labels(labels):
+    # Stored as ",INBOX,SPAM," so a label can be matched with LIKE '%,INBOX,%'
+    return "," + ",".join(sorted(labels)) + ","
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_mailbox_index():
+    """Returns the process-wide mailbox index, opening it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MailboxIndex()
+        return _index
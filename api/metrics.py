@@ -0,0 +1,204 @@
+"""
+Latency histograms and counters for the request hot path.
+
+Stages (Gmail list and fetch, parsing, features, prediction) and each
+feature function record their duration in a histogram, exposed with the
+counters on /metrics in the Prometheus text format. Recording a value is a
+lock and a bisect, a microsecond or so, so metrics stay on in production;
+METRICS=0 turns recording off.
+
+Stages timed on a request's own thread are also added to that request's
+breakdown, which the app can send back in a Server-Timing header.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get("METRICS", "1") == "1"
+METRICS_PREFIX = "spam_classifier"
+
+# Upper bounds in seconds, from a single feature function to a whole page
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_request_timings_lock = threading.Lock()  # Worker threads of one request add to the same breakdown
+
+
+def _label_text(label_names, label_values):
+    if not label_names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+
+    Parameters:
+        name (str): Metric name, without the prefix and the _total suffix
+        documentation (str): HELP text
+        label_names (tuple): Names of the labels, in the order values are passed
+    """
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = f"{METRICS_PREFIX}_{name}_total"
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_label_text(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, optionally split by labels.
+
+    Parameters:
+        name (str): Metric name, without the prefix
+        documentation (str): HELP text
+        label_names (tuple): Names of the labels, in the order values are passed
+        buckets (tuple): Sorted upper bounds
+    """
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [counts per bucket and +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._add(label_values, index, value)
+
+    def observe_many(self, values):
+        """Records several observations at once, from a dict of the single label's value -> observed value."""
+        if not METRICS_ENABLED:
+            return
+        buckets = self.buckets
+        with self._lock:
+            for label, value in values.items():
+                series = self._series.get((label,))
+                if series is None:
+                    series = self._series[(label,)] = [[0] * (len(buckets) + 1), 0.0]
+                series[0][bisect.bisect_left(buckets, value)] += 1
+                series[1] += value
+
+    def _add(self, label_values, index, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][index] += 1
+        series[1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((label_values, (list(counts), total))
+                            for label_values, (counts, total) in self._series.items())
+        for label_values, (counts, total) in series:
+            label_pairs = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = _label_text([name for name, _ in label_pairs] + ["le"],
+                                            [value for _, value in label_pairs] + [bound])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _label_text(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each stage of serving a request", ("stage",))
+FEATURE_SECONDS = Histogram("feature_seconds", "Time spent computing each feature of one message", ("feature",))
+REQUEST_SECONDS = Histogram("request_seconds", "Time until the response headers, per endpoint", ("endpoint",))
+MESSAGES = Counter("messages", "Messages classified with a model, pre-filtered ones included", ("model",))
+MESSAGE_BYTES = Counter("message_bytes", "Raw message bytes received", ("source",))
+PREFILTERED = Counter("prefiltered", "Messages labelled spam by a pre-filter rule, without the model", ("rule",))
+CASCADE_MESSAGES = Counter("cascade_messages", "Messages settled by each stage of the cascade", ("stage",))
+
+METRICS = [STAGE_SECONDS, FEATURE_SECONDS, REQUEST_SECONDS, MESSAGES, MESSAGE_BYTES, PREFILTERED, CASCADE_MESSAGES]
+
+
+def record_stage(stage, seconds):
+    """Records a stage duration, and adds it to the current request's breakdown if there is one."""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _request_timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Times the block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def start_request():
+    """Starts collecting the current request's stage breakdown, returned as a dict of stage -> seconds."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """Submits `fn` to a thread pool in a copy of the current context, so its stages count towards the request."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def request_timings():
+    """The current request's stage breakdown, None outside of a request."""
+    return _request_timings.get()
+
+
+def server_timing_header(timings):
+    """Formats a stage breakdown as a Server-Timing header value, durations in milliseconds."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
+def expose(extra_counters=()):
+    """
+    Every metric in the Prometheus text format.
+
+    Parameters:
+        extra_counters (iterable): (name, documentation, value) for counters kept elsewhere, read at scrape time
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    for name, documentation, value in extra_counters:
+        full_name = f"{METRICS_PREFIX}_{name}_total"
+        lines.extend([f"# HELP {full_name} {documentation}", f"# TYPE {full_name} counter", f"{full_name} {value}"])
+    return "\n".join(lines) + "\n"
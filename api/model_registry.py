@@ -0,0 +1,289 @@
+"""
+Registry of the classifiers the app serves, selectable per request.
+
+    MODEL_PATHS="complement_nb=models/complement_nb.joblib,logistic_regression=models/logistic_regression.joblib"
+    python -m api.model_registry export re_complement_naive_bayes_model.pkl models/complement_nb.joblib
+
+Models are stored as uncompressed joblib artifacts and loaded with
+`mmap_mode="r"`, so their coefficient arrays are read-only pages of the
+artifact file that every worker process shares through the OS page cache.
+Legacy pickles still load, just without the sharing. ComplementNB and
+logistic regression models are served through their NumPy kernel (see
+api/inference.py), and exported as that kernel so serving never imports sklearn.
+
+Each model is loaded on first use and identified by a fingerprint of its
+artifact. When an artifact file changes the model is reloaded on the next
+request that uses it; the new model is fully loaded before it replaces the
+old one, so requests never see a half-loaded model.
+
+With CASCADE=1, a model is served through the two-stage cascade when its
+artifact has a measured cascade setting (see api/cascade.py), read when the
+model is loaded.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+from api.all_functions import load_model
+from api.cascade import CASCADE_ENABLED, load_setting
+from api.classification_cache import get_cache
+from api.inference import as_kernel
+from api.rules import get_prefilter
+
+logger = logging.getLogger(__name__)
+
+# name=path pairs; the first one is the default model
+MODEL_PATHS = os.environ.get(
+    "MODEL_PATHS",
+    "complement_nb=re_complement_naive_bayes_model.pkl,logistic_regression=re_logistic_regression_model.pkl"
+)
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL")
+# Artifacts the reload endpoint may switch to must live in this directory
+MODEL_DIR = os.environ.get("MODEL_DIR", ".")
+MODEL_CHECK_INTERVAL = 5.0  # Seconds between checks of the artifacts' mtimes
+
+
+class ModelUnavailable(Exception):
+    """A registered model whose artifact cannot be read, e.g. because it was never deployed."""
+
+
+def parse_model_paths(value):
+    """Parses "name=path,name=path" into an ordered dict."""
+    paths = {}
+    for item in value.split(","):
+        if item.strip():
+            name, path = item.split("=", 1)
+            paths[name.strip()] = path.strip()
+    return paths
+
+
+def export_model(source, destination):
+    """Converts a pickled or joblib model file into a served artifact (see `write_artifact`)."""
+    write_artifact(load_model(source), destination)
+
+
+def write_artifact(model, destination):
+    """Writes a fitted model as an uncompressed joblib artifact that can be memory-mapped, as its kernel if it has one."""
+    model = as_kernel(model)
+    if hasattr(model, "fingerprint"):
+        del model.fingerprint  # Recomputed from the artifact on load
+    import joblib
+    tmp_path = destination + ".tmp"
+    joblib.dump(model, tmp_path, compress=0)
+    os.replace(tmp_path, destination)
+
+
+class ModelEntry:
+    """
+    One loaded model.
+
+    Parameters:
+        name (str): Registry name
+        path (str): Artifact it was loaded from
+        model: LinearKernel, or a fitted classifier with `predict_proba` and `classes_`
+        mtime (float): Artifact mtime at load time
+        version (int): How many times this name has been loaded, starting at 1
+        cascade (dict): Measured cascade setting it is served with, None for the full pipeline
+    """
+
+    def __init__(self, name, path, model, mtime, version, cascade=None):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.fingerprint = model.fingerprint
+        self.mtime = mtime
+        self.version = version
+        self.loaded_at = time.time()
+        self.spam_column = list(model.classes_).index(1)
+        self.cascade = cascade
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "path": self.path,
+            "fingerprint": self.fingerprint,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "cascade": self.cascade,
+        }
+
+
+class ModelRegistry:
+    """
+    Named models, loaded lazily and swapped atomically.
+
+    Parameters:
+        paths (dict): Model name -> artifact path
+        default (str): Name used when a request does not pick a model
+    """
+
+    def __init__(self, paths, default=None):
+        if not paths:
+            raise ValueError("the model registry needs at least one model")
+        self.default = default or next(iter(paths))
+        if self.default not in paths:
+            raise ValueError(f"default model {self.default!r} is not one of {', '.join(paths)}")
+        self._paths = dict(paths)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in paths}
+        self._checked_at = time.monotonic()
+
+    @property
+    def names(self):
+        return list(self._paths)
+
+    def get(self, name=None):
+        """
+        Returns the ModelEntry for `name` (the default model when None), loading it on first use.
+
+        Raises:
+            KeyError: If no model has that name
+            ModelUnavailable: If the model is not loaded yet and its artifact cannot be read
+        """
+        name = name or self.default
+        if name not in self._paths:
+            raise KeyError(name)
+
+        now = time.monotonic()
+        with self._lock:
+            check = now - self._checked_at >= MODEL_CHECK_INTERVAL
+            if check:
+                self._checked_at = now
+        if check:
+            self.reload_changed()
+
+        entry = self._entries.get(name)
+        if entry is None:
+            with self._load_lock(name):
+                entry = self._entries.get(name) or self._load(name)
+        return entry
+
+    def load(self, name, path=None):
+        """
+        Loads (or reloads) a model and swaps it in once it is ready.
+
+        Loads of one name run one at a time, so a load requested later is
+        never replaced by an earlier one that finished after it.
+
+        Parameters:
+            name (str): Registry name, an existing one or a new one
+            path (str): Artifact to load, defaults to the name's current path
+
+        Returns:
+            ModelEntry: The new entry
+
+        Raises:
+            ModelUnavailable: If the artifact cannot be read; the loaded model, if any, stays
+        """
+        with self._load_lock(name):
+            return self._load(name, path)
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _load(self, name, path=None):
+        path = path or self._paths[name]
+        try:
+            mtime = os.path.getmtime(path)
+            model = as_kernel(load_model(path))
+        except OSError as error:
+            raise ModelUnavailable(f"model {name!r} cannot be loaded from {path}: {error.strerror or error}") from error
+        cascade = None
+        if CASCADE_ENABLED:
+            prefilter = get_prefilter()
+            cascade = load_setting(path, model.fingerprint, prefilter.fingerprint if prefilter else None)
+
+        with self._lock:
+            previous = self._entries.get(name)
+            entry = ModelEntry(name, path, model, mtime, previous.version + 1 if previous else 1, cascade)
+            self._paths[name] = path
+            self._entries[name] = entry
+            still_served = {other.fingerprint for other in self._entries.values()}
+
+        # Rows classified by the replaced model can never be read again
+        if previous is not None and previous.fingerprint not in still_served:
+            get_cache().drop(previous.fingerprint)
+        logger.info("Model %r v%d (%s) loaded from %s", name, entry.version, entry.fingerprint, path)
+        return entry
+
+    def reload_changed(self):
+        """Reloads every loaded model whose artifact changed on disk. Returns the reloaded names."""
+        reloaded = []
+        for name, entry in list(self._entries.items()):
+            try:
+                changed = os.path.getmtime(entry.path) != entry.mtime
+            except OSError:
+                continue  # Artifact being replaced or removed, keep serving the loaded model
+            if changed:
+                with self._load_lock(name):
+                    if self._entries[name] is entry:
+                        try:
+                            self._load(name)
+                        except ModelUnavailable as error:
+                            logger.warning("Keeping the loaded model: %s", error)
+                            continue
+                reloaded.append(name)
+        return reloaded
+
+    def warm(self):
+        """
+        Loads every model now instead of on first use, e.g. before forking workers.
+
+        Models that cannot be loaded are logged and skipped; requests for them get ModelUnavailable.
+        """
+        for name in self.names:
+            try:
+                self.get(name)
+            except Exception as error:
+                logger.warning("Model %r not preloaded: %s", name, error)
+
+    def describe(self):
+        return {
+            "default": self.default,
+            "models": [
+                self._entries[name].describe() if name in self._entries else {"name": name, "path": path}
+                for name, path in self._paths.items()
+            ],
+        }
+
+
+def resolve_artifact(path):
+    """Resolves a path for the reload endpoint, refusing anything outside MODEL_DIR."""
+    model_dir = os.path.realpath(MODEL_DIR)
+    resolved = os.path.realpath(os.path.join(model_dir, path))
+    if os.path.commonpath([model_dir, resolved]) != model_dir or not os.path.isfile(resolved):
+        raise ValueError(f"{path!r} is not a model artifact in {MODEL_DIR}")
+    return resolved
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Returns the process-wide model registry, configured from MODEL_PATHS and DEFAULT_MODEL."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(parse_model_paths(MODEL_PATHS), DEFAULT_MODEL)
+        return _registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Convert a pickled model into a memory-mappable joblib artifact")
+    export.add_argument("source", help="Pickled or joblib model")
+    export.add_argument("destination", help="Artifact to write (.joblib)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_model(args.source, args.destination)
+        print(f"Wrote {args.destination}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Background prefetch of the next folder page.
+
+After a page of the inbox or spam folder is served, the page its "next"
+link points to is fetched and classified on a background thread and kept
+in memory, so the click on "next" is answered without waiting for Gmail.
+A click that arrives while the prefetch is still running waits for it
+instead of starting a second fetch.
+
+Memory is bounded per user (PREFETCH_MAX_PAGES pages and
+PREFETCH_MAX_BYTES of rows) and across users (PREFETCH_MAX_USERS, least
+recently active dropped first). Pages older than PREFETCH_TTL seconds are
+not served. Users idle for PREFETCH_IDLE_SECONDS lose their pages, and
+prefetches that have not started yet are cancelled.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.environ.get("PREFETCH_PAGES", "1") == "1"
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 2))
+PREFETCH_MAX_PAGES = int(os.environ.get("PREFETCH_MAX_PAGES", 2))
+PREFETCH_MAX_BYTES = int(os.environ.get("PREFETCH_MAX_BYTES", 1 << 20))
+PREFETCH_MAX_USERS = int(os.environ.get("PREFETCH_MAX_USERS", 1000))
+PREFETCH_TTL = float(os.environ.get("PREFETCH_TTL", 120))
+PREFETCH_IDLE_SECONDS = float(os.environ.get("PREFETCH_IDLE_SECONDS", 300))
+
+COUNTERS = ("hits", "waits", "misses", "scheduled", "failed", "expired", "evicted", "cancelled")
+
+
+class _Entry:
+    def __init__(self, future):
+        self.future = future
+        self.size = 0
+        self.loaded_at = None
+
+
+class PagePrefetcher:
+    """
+    Loads pages ahead of time and hands each one out once.
+
+    Parameters:
+        workers (int): Background threads
+        max_pages (int): Pages kept or in flight per user
+        max_bytes (int): Size of the rows kept per user, as JSON
+        max_users (int): Users with prefetched pages
+        ttl (float): Seconds a prefetched page stays servable
+        idle_seconds (float): Inactivity after which a user's pages are dropped
+    """
+
+    def __init__(self, workers=PREFETCH_WORKERS, max_pages=PREFETCH_MAX_PAGES, max_bytes=PREFETCH_MAX_BYTES,
+                 max_users=PREFETCH_MAX_USERS, ttl=PREFETCH_TTL, idle_seconds=PREFETCH_IDLE_SECONDS):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_users = max_users
+        self.ttl = ttl
+        self.idle_seconds = idle_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._users = OrderedDict()  # user -> OrderedDict of key -> _Entry, least recently active first
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def get(self, user, key):
+        """
+        Returns the prefetched page for `key` and forgets it, or None on a miss.
+
+        Waits for a prefetch of that page that is still running.
+        """
+        with self._lock:
+            self._touch(user)
+            entry = self._users.get(user, {}).pop(key, None)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            running = not entry.future.done()
+        try:
+            page = entry.future.result()
+        except (Exception, CancelledError):
+            self._count("misses")  # _load counted the failure itself
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl:
+            self._count("expired")
+            self._count("misses")
+            return None
+        self._count("waits" if running else "hits")
+        return page
+
+    def schedule(self, user, key, load):
+        """
+        Starts loading a page in the background unless it is already prefetched.
+
+        Parameters:
+            user (str): Whose memory budget the page counts against
+            key (tuple): What the page will be looked up by
+            load (callable): Loads the page; called on a background thread without the Flask session
+        """
+        if self.max_pages < 1:
+            return
+        with self._lock:
+            self._touch(user)
+            pages = self._users.setdefault(user, OrderedDict())
+            if key in pages:
+                return
+            entry = pages[key] = _Entry(None)
+            self.counters["scheduled"] += 1
+            self._evict(user)
+            entry.future = self._executor.submit(self._load, user, key, entry, load)
+
+    def cancel(self, user):
+        """Drops the user's pages and cancels prefetches that have not started."""
+        with self._lock:
+            self._drop_user(user)
+
+    def stats(self):
+        with self._lock:
+            pages = sum(len(pages) for pages in self._users.values())
+            size = sum(entry.size for pages in self._users.values() for entry in pages.values())
+            return {**self.counters, "users": len(self._users), "pages": pages, "bytes": size}
+
+    def _load(self, user, key, entry, load):
+        try:
+            page = load()
+        except Exception as error:
+            logger.warning("Prefetch of %s for %s failed: %s", key, user, error)
+            self._count("failed")
+            raise
+        entry.size = len(json.dumps(page[0], default=str))
+        entry.loaded_at = time.monotonic()
+        with self._lock:
+            if self._users.get(user, {}).get(key) is entry:
+                self._evict(user)
+        return page
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _touch(self, user):
+        # Called with the lock held: marks the user active and sweeps idle users
+        now = time.monotonic()
+        self._last_seen[user] = now
+        if user in self._users:
+            self._users.move_to_end(user)
+        for idle_user in [other for other, seen in self._last_seen.items() if now - seen > self.idle_seconds]:
+            self._drop_user(idle_user)
+        while len(self._users) > self.max_users:
+            self._drop_user(next(iter(self._users)))
+
+    def _evict(self, user):
+        # Called with the lock held: drops the user's oldest pages until they fit the budget
+        pages = self._users.get(user)
+        while pages and (len(pages) > self.max_pages or sum(entry.size for entry in pages.values()) > self.max_bytes):
+            _, entry = pages.popitem(last=False)
+            self._discard(entry)
+
+    def _drop_user(self, user):
+        for entry in self._users.pop(user, {}).values():
+            self._discard(entry)
+        self._last_seen.pop(user, None)
+
+    def _discard(self, entry):
+        # Prefetches that have not started are cancelled; loaded or running pages are evicted
+        if entry.future is not None and entry.future.cancel():
+            self.counters["cancelled"] += 1
+        else:
+            self.counters["evicted"] += 1
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher():
+    """Returns the process-wide page prefetcher."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = PagePrefetcher()
+        return _prefetcher
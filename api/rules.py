@@ -0,0 +1,273 @@
+"""
+Declarative spam rules, compiled into NumPy column expressions.
+
+    python -m api.rules features.arrow --output labels.arrow
+    python -m api.rules features.arrow --rules rules.json
+
+A rule set is an ordered list of rules, and a rule fires when all of its
+conditions hold. Rules are read from JSON; a condition is [feature,
+operator, value], or [feature] for a flag that is set:
+
+    [{"name": "spam_words", "when": [["spam_score", ">", 3]]},
+     {"name": "html_without_text", "when": [["has_html"], ["is_body_empty"]]}]
+
+Features are the columns of the feature registry (api/features.py).
+Without a rule file, the rules are the notebooks' `label_spam_rule_based`
+(`NOTEBOOK_RULES`), which is where the training labels come from.
+
+A rule set is evaluated on whole columns at once, millions of rows per
+second. For each row it gives the first rule that fired, like the
+notebooks' if-chain, or -1 when none did. The CLI labels a feature store
+this way and writes each message's label and rule.
+
+Serving can run a rule set ahead of the model (PREFILTER_RULES=rules.json).
+Messages a rule fires on are labelled spam without the model. Pre-filter
+rules can only use the model features, because those are all that cached
+rows keep.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from api.features import FEATURES, REGISTRY
+
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+# label_spam_rule_based of the notebooks, in its order
+NOTEBOOK_RULES = [
+    {"name": "spam_words", "when": [["spam_score", ">", 3]]},
+    {"name": "many_links", "when": [["num_links", ">", 5]]},
+    {"name": "suspicious_links", "when": [["num_suspicious_links", ">", 0]]},
+    {"name": "many_attachments", "when": [["num_attachments", ">", 4]]},
+    {"name": "suspicious_attachments", "when": [["num_suspicious_attachments", ">", 0]]},
+    {"name": "html_without_text", "when": [["has_html"], ["is_body_empty"]]},
+    {"name": "fake_domain", "when": [["is_fake_domain"]]},
+    {"name": "missing_to", "when": [["is_missing_to"]]},
+    {"name": "many_recipients", "when": [["num_recipients", ">", 5]]},
+    {"name": "short_subject", "when": [["num_subject_words", "<", 3]]},
+]
+
+PREFILTER_RULES = os.environ.get("PREFILTER_RULES")
+
+
+class Rule:
+    """
+    One named rule.
+
+    Parameters:
+        name (str): Reported when the rule fires
+        when (list): Conditions that must all hold, each [feature, operator, value] or [feature]
+
+    Raises:
+        ValueError: On an unknown feature or operator, or a malformed condition
+    """
+
+    def __init__(self, name, when):
+        if not when:
+            raise ValueError(f"rule {name!r} has no conditions")
+        self.name = name
+        self.when = []
+        for condition in when:
+            if len(condition) == 1:
+                feature, operator, value = condition[0], None, None
+            elif len(condition) == 3:
+                feature, operator, value = condition
+            else:
+                raise ValueError(f"rule {name!r}: expected [feature, operator, value] or [feature], got {condition!r}")
+            if feature not in REGISTRY:
+                raise ValueError(f"rule {name!r}: unknown feature {feature!r}")
+            if operator is not None and operator not in OPERATORS:
+                raise ValueError(f"rule {name!r}: unknown operator {operator!r}, expected one of {', '.join(OPERATORS)}")
+            self.when.append((feature, operator, value))
+
+    @property
+    def features(self):
+        return [feature for feature, _, _ in self.when]
+
+    def expression(self):
+        """The conditions as text, for reports."""
+        return " and ".join(feature if operator is None else f"{feature} {operator} {value}"
+                            for feature, operator, value in self.when)
+
+    def mask(self, columns):
+        """Boolean array of the rows the rule fires on."""
+        mask = None
+        for feature, operator, value in self.when:
+            column = np.asarray(columns[feature])
+            condition = column.astype(bool) if operator is None else OPERATORS[operator](column, value)
+            if mask is None:
+                mask = condition
+            else:
+                mask &= condition
+        return mask
+
+    def to_config(self):
+        return {"name": self.name, "when": [[feature] if operator is None else [feature, operator, value]
+                                            for feature, operator, value in self.when]}
+
+
+class RuleSet:
+    """
+    Ordered rules, evaluated on columns.
+
+    Parameters:
+        rules (list): Rule objects, in the order they are checked
+    """
+
+    def __init__(self, rules):
+        if not rules:
+            raise ValueError("a rule set needs at least one rule")
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise ValueError("rule names must be unique")
+        self.rules = rules
+        self.names = names
+        config = json.dumps([rule.to_config() for rule in rules], sort_keys=True)
+        self.fingerprint = hashlib.sha256(config.encode()).hexdigest()[:16]
+
+    @classmethod
+    def from_config(cls, config):
+        """Rule set from a list of {"name": ..., "when": [...]} dicts."""
+        return cls([Rule(rule["name"], rule["when"]) for rule in config])
+
+    @classmethod
+    def load(cls, path=None):
+        """Rule set from a JSON file, the notebook rules when `path` is None."""
+        if path is None:
+            return cls.from_config(NOTEBOOK_RULES)
+        with open(path) as file:
+            return cls.from_config(json.load(file))
+
+    @property
+    def features(self):
+        """Every feature the rules read, in registry order."""
+        used = {feature for rule in self.rules for feature in rule.features}
+        return [name for name in REGISTRY if name in used]
+
+    def evaluate(self, columns):
+        """
+        The first rule that fires on each row.
+
+        Parameters:
+            columns (dict): Feature name -> array, or a DataFrame
+
+        Returns:
+            numpy.ndarray: int16 index into `rules` per row, -1 where no rule fired
+        """
+        fired = None
+        # Last rule first, so earlier rules overwrite later ones where both fire
+        for index in range(len(self.rules) - 1, -1, -1):
+            mask = self.rules[index].mask(columns)
+            if fired is None:
+                fired = np.full(len(mask), -1, dtype=np.int16)
+            np.putmask(fired, mask, index)
+        return fired
+
+    def labels(self, columns):
+        """1 for the rows any rule fires on, 0 for the others."""
+        spam = self.rules[0].mask(columns)
+        for rule in self.rules[1:]:
+            spam |= rule.mask(columns)
+        return spam.astype(np.int64)
+
+    def counts(self, fired):
+        """Rule name -> rows it was the first to fire on, from `evaluate`'s result."""
+        counts = np.bincount(fired[fired >= 0], minlength=len(self.rules))
+        return dict(zip(self.names, counts.tolist()))
+
+    def rule_names(self, fired):
+        """Name of the rule that fired on each row, None where none did."""
+        names = np.array(self.names + [None], dtype=object)
+        return names[fired]  # -1 picks the trailing None
+
+
+def matrix_columns(X, names=FEATURES):
+    """Columns of a feature matrix by name, as views."""
+    return {name: X[:, j] for j, name in enumerate(names)}
+
+
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+def get_prefilter():
+    """Returns the serving pre-filter configured by PREFILTER_RULES, None when there is none."""
+    global _prefilter
+    if not PREFILTER_RULES:
+        return None
+    with _prefilter_lock:
+        if _prefilter is None:
+            rules = RuleSet.load(PREFILTER_RULES)
+            missing = [name for name in rules.features if name not in FEATURES]
+            if missing:
+                raise ValueError(f"pre-filter rules can only use model features, not {', '.join(missing)}")
+            _prefilter = rules
+        return _prefilter
+
+
+def main():
+    import pyarrow as pa
+    from api.feature_store import FeatureStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("store", help="Feature store file (.arrow), see api/feature_store.py")
+    parser.add_argument("--rules", help="Rule file (.json), defaults to the notebook rules")
+    parser.add_argument("--output", help="Arrow file to write message_hash, label and rule to")
+    parser.add_argument("--chunk-size", type=int, default=262144)
+    args = parser.parse_args()
+
+    rules = RuleSet.load(args.rules)
+    schema = pa.schema([("message_hash", pa.binary(16)), ("label", pa.uint8()),
+                        ("rule", pa.dictionary(pa.int16(), pa.string()))])
+    dictionary = pa.array(rules.names, pa.string())
+    counts = dict.fromkeys(rules.names, 0)
+    rows = 0
+    seconds = 0.0
+
+    sink = writer = None
+    if args.output:
+        sink = pa.OSFile(args.output + ".tmp", "wb")
+        writer = pa.ipc.new_file(sink, schema)
+    try:
+        for columns in FeatureStore(args.store).iter_chunks(rules.features, args.chunk_size):
+            start = time.perf_counter()
+            fired = rules.evaluate(columns)
+            seconds += time.perf_counter() - start
+            rows += len(fired)
+            for name, count in rules.counts(fired).items():
+                counts[name] += count
+            if writer is not None:
+                hashes = pa.FixedSizeBinaryArray.from_buffers(pa.binary(16), len(fired),
+                                                              [None, pa.py_buffer(columns["message_hash"].tobytes())])
+                rule = pa.DictionaryArray.from_arrays(pa.array(fired, mask=fired < 0), dictionary)
+                writer.write_batch(pa.record_batch([hashes, pa.array((fired >= 0).astype(np.uint8)), rule],
+                                                   schema=schema))
+    finally:
+        if writer is not None:
+            writer.close()
+            sink.close()
+    if args.output:
+        os.replace(args.output + ".tmp", args.output)
+
+    spam = sum(counts.values())
+    print(f"{rows} messages, {spam} spam ({spam / rows if rows else 0:.1%}); "
+          f"rules evaluated at {rows / seconds if seconds else 0:,.0f} rows/s")
+    for rule in rules.rules:
+        print(f"  {rule.name:<24} {counts[rule.name]:>10}  {rule.expression()}")
+    if args.output:
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
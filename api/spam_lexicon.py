@@ -0,0 +1,177 @@
+import re
+from collections import Counter
+
+
+# Phrases counted by `spam_score`. Each one is matched between word
+# boundaries, the same way `re.findall(rf"\b{word}\b", text)` did.
+SPAM_WORDS = [
+    "free", "win", "winner", "winnings", "money", "cash", "earn", "easy money",
+    "make money", "fast cash", "quick cash", "extra cash", "double your income",
+    "get rich", "financial freedom", "increase sales", "investment", 
+    "passive income", "work from home", "no experience needed", "limited time",
+    "instant cash", "credit", "debt relief", "bank transfer", "wire transfer", 
+    "fast loan", "no credit check", "lowest rate", "instant approval",
+    "offer", "discount", "prize", "reward", "bonus", "gift", "apply now",
+    "special deal", "hot deal", "lowest price", "save big", "best deal", 
+    "bargain", "buy now", "order now", "cheap", "affordable", "best price", 
+    "exclusive", "promo", "promotion", "limited offer", "free trial", 
+    "new customer", "subscription", "membership", "act fast", "expires soon",
+    "urgent", "hurry", "act now", "last chance", "final notice", "important", 
+    "as soon as possible", "time-sensitive", "one-time", "today only", 
+    "do it now", "limited stock", "this won’t last", "once in a lifetime",
+    "click", "click here", "click below", "open now", "access now",
+    "view online", "sign up", "register now", "confirm your details",
+    "log in", "update your account", "verify your identity", 
+    "secure your account", "your account is at risk", "security alert", 
+    "reset password", "your payment failed", "billing issue", "invoice attached",
+    "guarantee", "risk-free", "no risk", "100% free", "money-back", 
+    "satisfaction guaranteed", "no obligation", "hidden charges", 
+    "secret formula", "miracle", "exclusive deal", "instant cure", 
+    "congratulations", "you have been selected", "you are a winner",
+    "unsubscribe", "remove me", "opt-out", "this is not spam",
+    "why are you receiving this", "you received this email because",
+    "not interested?", "spam-free guarantee", "no more emails",
+    "bitcoin", "crypto", "blockchain", "ethereum", "trading", "forex", 
+    "broker", "binary options", "wallet", "crypto exchange", "payout", 
+    "account verification", "account update", "account locked", "secure login",
+    "miracle cure", "cure", "no prescription", "pharmacy", "drugs", 
+    "weight loss", "diet pill", "anti-aging", "instant results", "clinically proven",
+    "lottery", "jackpot", "lucky draw", "winning ticket", "unclaimed prize", 
+    "claim your reward", "sweepstakes", "mega millions", "powerball", 
+    "your lucky number", "your check is waiting",
+    "earn at home", "home-based business", "be your own boss", "online income",
+    "startup funding", "government grant", "high-paying job", "no skills required",
+    "mortgage rates", "real estate", "home loan", "house for sale", 
+    "foreclosure", "cheap property", "investment property", "flipping houses",
+    "identity verification", "social security number", "ssn", "bank account", 
+    "routing number", "password reset", "security question", "personal details",
+    "your computer is infected", "tech support", "fix your pc", "remote access",
+    "download now", "install this update", "your system is at risk", 
+    "trojan detected", "virus warning", "malware detected", "spyware removal",
+    "help us", "donate now", "urgent donation needed", "support our cause", 
+    "charity request", "nonprofit", "disaster relief", "emergency appeal",
+    "as seen on tv", "elon musk recommends", "warren buffet’s secret", 
+    "celebrity approved", "doctor recommended", "scientifically proven"
+]
+
+
+def _literal_variants(phrase):
+    """
+    Expands a phrase into the literal strings it matches.
+
+    The phrases used to be interpolated straight into a regex, so a trailing
+    "?" makes the previous character optional ("not interested?" matches
+    "not interested" and "not intereste"). Every other character is literal.
+    """
+    if phrase.endswith("?"):
+        return [phrase[:-1], phrase[:-2]]
+    return [phrase]
+
+
+def _is_word_char(char):
+    return re.match(r"\w", char) is not None
+
+
+def _trie_pattern(words):
+    """Builds a regex alternation shaped like a trie, longest continuation first."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return "(?:" + pattern + ")?"  # Greedy, so longer phrases win
+        return pattern
+
+    return build(trie)
+
+
+class SpamLexicon:
+    """
+    Matches every spam phrase in a single pass over the text.
+
+    All phrases are compiled once into one trie-shaped alternation wrapped in a
+    lookahead, so the scan visits every position of the text exactly once and
+    reports the longest phrase starting there. Shorter phrases that match at
+    the same position ("click" inside "click here") are known ahead of time,
+    which keeps the counts identical to running one `re.findall` per phrase.
+
+    Parameters:
+        phrases (list): Lowercase spam phrases
+    """
+
+    def __init__(self, phrases):
+        self.phrases = list(phrases)
+
+        variants = {}  # Literal text -> phrase it counts towards
+        for phrase in self.phrases:
+            for variant in _literal_variants(phrase):
+                variants[variant] = phrase
+
+        # When `longest` is the longest match at a position, these (phrase, length)
+        # pairs match there too: every variant that is a prefix of it and ends on
+        # a word boundary inside it.
+        self._fired = {}
+        for longest in variants:
+            self._fired[longest] = [
+                (phrase, len(variant))
+                for variant, phrase in variants.items()
+                if longest.startswith(variant) and (
+                    len(variant) == len(longest)
+                    or _is_word_char(variant[-1]) != _is_word_char(longest[len(variant)])
+                )
+            ]
+
+        self.pattern = re.compile(r"(?=\b(" + _trie_pattern(variants) + r")\b)")
+        # Variants that are one run of letters and digits, for `count_tokens`
+        self.token_variants = frozenset(variant for variant in variants if re.fullmatch(r"[a-z0-9]+", variant))
+
+    def hits(self, text):
+        """
+        Counts how often each phrase occurs in the text.
+
+        Parameters:
+            text (str): Raw email text
+
+        Returns:
+            Counter: Hit count per phrase, only phrases that fired
+        """
+        counts = Counter()
+        last_end = {}  # A phrase never overlaps its own previous match, like re.findall
+
+        for match in self.pattern.finditer(text.lower()):
+            start = match.start()
+            for phrase, length in self._fired[match.group(1)]:
+                if start >= last_end.get(phrase, 0):
+                    counts[phrase] += 1
+                    last_end[phrase] = start + length
+        return counts
+
+    def count(self, text):
+        """Total number of spam phrase hits in the text."""
+        return sum(self.hits(text).values())
+
+    def count_tokens(self, tokens):
+        """
+        Same as `count` for a text that is nothing but letter and digit runs
+        split by "+", "/" and "=", such as base64. Only single-word phrases can
+        match there, each on a whole run.
+
+        Parameters:
+            tokens (list): The lowercased runs
+
+        Returns:
+            int: Total number of spam phrase hits
+        """
+        counts = Counter(tokens)
+        return sum(counts[variant] for variant in self.token_variants if variant in counts)
+
+
+SPAM_LEXICON = SpamLexicon(SPAM_WORDS)
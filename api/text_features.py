@@ -0,0 +1,285 @@
+"""
+Precompiled patterns and lookup tables for the text-level features.
+
+The suspicious domain, dangerous extension and fake sender keyword lists
+live in a `FeatureConfig`. It can be loaded from a JSON file named by
+FEATURE_CONFIG_PATH and is reloaded automatically when that file changes:
+
+    {
+        "suspicious_domains": ["bit.ly", "tinyurl.com"],
+        "dangerous_exts": [".exe", ".zip"],
+        "fake_domain_keywords": ["free", "lottery"],
+        "link_match": "substring"
+    }
+
+`link_match` decides how a link is checked against the suspicious domains.
+"substring" reproduces the original `domain in link` test, which the
+models were trained with ("t.co" also matches "microsoft.com"), with one
+search of a compiled alternation of the domains per link. "host"
+matches the link's host exactly or by parent domain through a set lookup;
+switching to it changes `num_suspicious_links`, so bump its entry in
+FEATURE_VERSIONS and retrain.
+
+`scan` bounds the text features (num_words, num_links, spam_score and
+num_suspicious_links) on pathological messages:
+
+    "scan": {
+        "num_words": {"regions": ["text"], "max_chars": 200000},
+        "num_links": {"regions": ["headers", "text"], "max_chars": 200000}
+    },
+    "scan_time_budget_ms": 50
+
+Each feature scans the listed regions, joined by line breaks, up to
+`max_chars` characters (an html body is cut to `max_chars` before its
+tags are stripped):
+
+    raw      the whole email as received, base64 attachments included
+    headers  the header block
+    text     the plain text body, or the html body with tags stripped
+    html     the html body with tags stripped
+
+Features missing from `scan` keep scanning "raw" without a limit, which is
+what the models were trained on, so changing a plan also needs a
+FEATURE_VERSIONS bump and a retrain. `scan_time_budget_ms` is a per-message
+budget shared by the four features. Text is scanned in SCAN_CHUNK_CHARS
+pieces cut at line breaks. Once the budget is spent, every feature that is
+still scanning stops after the piece it is on, and the features still to
+come scan only their first piece. The counts then cover a prefix of the
+region and `ParsedEmail.scan_truncated` is set.
+"""
+import html
+import json
+import os
+import re
+import threading
+import time
+
+WORD_RE = re.compile(r"\w+")  # Same count as \b\w+\b: every maximal run of word characters
+URL_SCHEME_RE = re.compile(r"https?://")
+URL_TAIL_RE = re.compile(r"[^\s<>\"']+")  # Rest of a URL, as counted by count_links_and_domains
+# Rest of a link, as found by count_suspicious_links: ASCII $ to _, a-z, "!" and %XX escapes
+LINK_TAIL_RE = re.compile(r"(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+")
+URL_RE = re.compile(r"https?://" + URL_TAIL_RE.pattern)
+LINK_RE = re.compile(r"https?://" + LINK_TAIL_RE.pattern)
+DOMAIN_RE = re.compile(r"\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,6}\b")
+SENDER_DOMAIN_RE = re.compile(r"@([\w.-]+)")
+HOST_RE = re.compile(r"https?://(?:[^/?#@]*@)?([^/?#:]*)")
+HEADER_END_RE = re.compile(r"\r?\n\r?\n")
+TAG_RE = re.compile(r"<(script|style)\b.*?</\1\s*>|<!--.*?-->|<[^>]*>", re.DOTALL | re.IGNORECASE)
+
+DEFAULT_CONFIG = {
+    "suspicious_domains": ["bit.ly", "tinyurl.com", "t.co", "goo.gl", "ow.ly", "is.gd", "buff.ly"],
+    "dangerous_exts": [".exe", ".zip", ".rar", ".scr", ".iso", ".js", ".bat"],
+    "fake_domain_keywords": ["free", "money", "offer", "lottery", "deal", "promo", "cheap"],
+    "link_match": "substring",
+    "scan": {},
+    "scan_time_budget_ms": None,
+}
+FEATURE_CONFIG_PATH = os.environ.get("FEATURE_CONFIG_PATH")
+CONFIG_CHECK_INTERVAL = 5.0  # Seconds between checks of the config file's mtime
+
+TEXT_FEATURES = ("num_words", "num_links", "spam_score", "num_suspicious_links")
+SCAN_REGIONS = ("raw", "headers", "text", "html")
+SCAN_CHUNK_CHARS = 65536
+WHOLE_EMAIL = (("raw",), None)  # Scan plan the models were trained with
+
+
+class FeatureConfig:
+    """Compiled form of the configurable lists: one alternation or hash set per list."""
+
+    def __init__(self, suspicious_domains, dangerous_exts, fake_domain_keywords, link_match="substring",
+                 scan=None, scan_time_budget_ms=None):
+        if link_match not in ("substring", "host"):
+            raise ValueError(f"link_match must be 'substring' or 'host', not {link_match!r}")
+        self.scan_plans = {}  # Feature -> (regions, max_chars)
+        for feature, plan in (scan or {}).items():
+            if feature not in TEXT_FEATURES:
+                raise ValueError(f"scan plans are for {', '.join(TEXT_FEATURES)}, not {feature!r}")
+            regions = tuple(plan.get("regions", ["raw"]))
+            unknown = [region for region in regions if region not in SCAN_REGIONS]
+            if not regions or unknown:
+                raise ValueError(f"scan regions for {feature} must be some of {', '.join(SCAN_REGIONS)}, got {regions}")
+            self.scan_plans[feature] = (regions, plan.get("max_chars"))
+        self.scan_time_budget = scan_time_budget_ms / 1000 if scan_time_budget_ms else None
+        self.suspicious_domains = frozenset(domain.lower() for domain in suspicious_domains)
+        self.dangerous_exts = tuple(ext.lower() for ext in dangerous_exts)
+        self.fake_domain_keywords = tuple(fake_domain_keywords)
+        self.link_match = link_match
+        self._domain_re = _alternation(suspicious_domains)
+        self._keyword_re = _alternation(fake_domain_keywords)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{**DEFAULT_CONFIG, **values})
+
+    def is_suspicious_link(self, link):
+        if self.link_match == "substring":
+            return self._domain_re.search(link) is not None
+        match = HOST_RE.match(link)
+        if not match:
+            return False
+        # Exact host, then every parent domain: a.b.bit.ly, b.bit.ly, bit.ly, ly
+        labels = match.group(1).lower().rstrip(".").split(".")
+        return any(".".join(labels[i:]) in self.suspicious_domains for i in range(len(labels)))
+
+    def num_suspicious_links(self, links):
+        if self.link_match == "substring":
+            search = self._domain_re.search
+            return sum(1 for link in links if search(link))
+        return sum(1 for link in links if self.is_suspicious_link(link))
+
+    def scan_plan(self, feature):
+        """(regions, max_chars or None) a text feature scans."""
+        return self.scan_plans.get(feature, WHOLE_EMAIL)
+
+    def is_fake_sender_domain(self, domain):
+        return self._keyword_re.search(domain) is not None
+
+    def is_dangerous_filename(self, filename):
+        return filename.lower().endswith(self.dangerous_exts)
+
+
+def _alternation(words):
+    if not words:
+        return re.compile(r"(?!)")  # Matches nothing
+    return re.compile("|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+
+class _ConfigHolder:
+    """Keeps the active FeatureConfig and reloads it when its JSON file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self.config = FeatureConfig.from_dict({})
+        self._reload()
+
+    def _reload(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+        with open(self.path) as file:
+            self.config = FeatureConfig.from_dict(json.load(file))
+        self._mtime = mtime
+
+    def get(self):
+        now = time.monotonic()
+        if self.path and now - self._checked_at >= CONFIG_CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked_at >= CONFIG_CHECK_INTERVAL:
+                    self._checked_at = now
+                    self._reload()
+        return self.config
+
+
+_holder = _ConfigHolder(FEATURE_CONFIG_PATH)
+
+def get_feature_config():
+    """Returns the active feature config, picking up changes to FEATURE_CONFIG_PATH."""
+    return _holder.get()
+
+def set_feature_config(config, path=None):
+    """Replaces the active config, optionally switching to a different JSON file to watch."""
+    global _holder
+    if path is not None:
+        _holder = _ConfigHolder(path)
+    if config is not None:
+        _holder.config = config
+
+
+class LinkScan:
+    """
+    Every link in a text, found in a single pass over its http(s):// schemes.
+
+    `urls` are the spans count_links_and_domains counts and `links` the spans
+    count_suspicious_links checks; either can be switched off when only the
+    other is needed, and a findall of the remaining pattern then finds its
+    spans. The two use different character sets, so when both are wanted
+    each scheme occurrence is extended with both anchored patterns, skipping
+    occurrences inside the previous match of that pattern just like findall.
+    """
+
+    def __init__(self, text, urls=True, links=True):
+        if not (urls and links):
+            self.urls = URL_RE.findall(text) if urls else []
+            self.links = LINK_RE.findall(text) if links else []
+            return
+        self.urls = []
+        self.links = []
+        url_end = link_end = 0
+        for scheme in URL_SCHEME_RE.finditer(text):
+            start, tail = scheme.start(), scheme.end()
+            if start >= url_end:
+                match = URL_TAIL_RE.match(text, tail)
+                if match:
+                    self.urls.append(text[start:match.end()])
+                    url_end = match.end()
+            if start >= link_end:
+                match = LINK_TAIL_RE.match(text, tail)
+                if match:
+                    self.links.append(text[start:match.end()])
+                    link_end = match.end()
+
+    def num_links(self, text):
+        """Distinct full URLs and plain domain mentions."""
+        return len(set(self.urls).union(DOMAIN_RE.findall(text)))
+
+    def num_suspicious_links(self, config=None):
+        return (config or get_feature_config()).num_suspicious_links(self.links)
+
+
+class ScanBudget:
+    """
+    Per-message time budget shared by the text features.
+
+    Parameters:
+        seconds (float): Budget, or None for no limit
+    """
+
+    def __init__(self, seconds=None):
+        self.deadline = time.perf_counter() + seconds if seconds else None
+        self.exhausted = False
+
+    def chunks(self, text, max_chars=None):
+        """Yields `text[:max_chars]` in pieces cut at line breaks, for as long as the budget lasts."""
+        if max_chars is not None:
+            text = text[:max_chars]
+        if self.deadline is None:
+            yield text
+            return
+
+        start = 0
+        while start < len(text):
+            end = start + SCAN_CHUNK_CHARS
+            if end < len(text):
+                # A line break never falls inside a word, link or spam phrase
+                cut = text.rfind("\n", start, end)
+                end = cut + 1 if cut > start else end
+            yield text[start:end]
+            start = end
+            if start < len(text) and (self.exhausted or time.perf_counter() > self.deadline):
+                self.exhausted = True
+                return
+
+
+def strip_tags(html_text):
+    """Visible text of an html document: scripts, styles, comments and tags removed."""
+    return html.unescape(TAG_RE.sub(" ", html_text))
+
+
+def header_block(email_text):
+    match = HEADER_END_RE.search(email_text)
+    return email_text[:match.start()] if match else email_text
+
+
+def count_words(text):
+    return len(WORD_RE.findall(text))
+
+
+def sender_domain(email_from):
+    match = SENDER_DOMAIN_RE.search(email_from)
+    return match.group(1).lower() if match else None
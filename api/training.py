@@ -0,0 +1,246 @@
+"""
+Trains the classifiers from the feature store, one chunk of rows at a time.
+
+    python -m api.training features.arrow models/complement_nb.joblib --model complement_nb
+    python -m api.training features.arrow models/logistic_regression.joblib --model logistic_regression --epochs 5
+
+Rows are labelled by a rule set (api/rules.py), the notebooks'
+`label_spam_rule_based` unless --rules names another one, and split into
+train and test by their message hash, so a message lands in the same split
+on every run and for any chunk size.
+
+ComplementNB is fitted with `partial_fit`. Logistic regression is fitted
+with SGD on the log loss over standardized features, after a first pass for
+their mean and variance; the scaling is then folded into the coefficients,
+so the result is a plain LogisticRegression on the raw counts that serves
+through the NumPy kernel like the shipped models. Only one chunk of the
+memory-mapped store is in memory at a time, so peak memory depends on
+--chunk-size and not on the size of the store.
+
+The model is written as a served artifact, like `python -m api.model_registry
+export` writes them, and its metrics on the test split as JSON next to it.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from api.evaluation import ConfusionCounts
+from api.feature_store import FeatureStore
+from api.features import FEATURE_VERSIONS, FEATURES
+from api.inference import as_kernel, predict_with_proba
+from api.model_registry import write_artifact
+from api.rules import RuleSet
+
+MODELS = ("complement_nb", "logistic_regression")
+CLASSES = np.array([0, 1])
+NOTEBOOK_RULE_SET = RuleSet.load()
+
+
+def rule_based_labels(columns, rules=None):
+    """
+    Training labels from a rule set, on whole columns at once.
+
+    Parameters:
+        columns (dict): Feature name -> array, as `FeatureStore.iter_chunks` yields them
+        rules (RuleSet): Rules to label with, defaults to the notebooks' `label_spam_rule_based`
+
+    Returns:
+        numpy.ndarray: 1 for spam, 0 otherwise
+    """
+    return (rules or NOTEBOOK_RULE_SET).labels(columns)
+
+
+def in_test_split(message_hashes, test_fraction):
+    """Whether each message belongs to the test split, from the first 4 bytes of its (rows x 16) hash."""
+    buckets = np.ascontiguousarray(message_hashes[:, :4]).view("<u4").ravel().astype(np.uint64)
+    return buckets < np.uint64(round(test_fraction * 2 ** 32))
+
+
+def labelled_chunks(store, test, test_fraction, chunk_size, rules=None):
+    """
+    Yields (X, y) for the rows of one split, one store chunk at a time.
+
+    Parameters:
+        store (FeatureStore): Store to read
+        test (bool): Test split rather than train split
+        test_fraction (float): Share of the messages in the test split
+        chunk_size (int): Store rows per chunk
+        rules (RuleSet): Rules to label with, defaults to the notebook rules
+
+    Returns:
+        generator: int64 feature matrix in `FEATURES` order and labels
+    """
+    rules = rules or NOTEBOOK_RULE_SET
+    names = FEATURES + [name for name in rules.features if name not in FEATURES]
+    for columns in store.iter_chunks(names, chunk_size):
+        rows = in_test_split(columns["message_hash"], test_fraction) == test
+        if not rows.any():
+            continue
+        labels = rule_based_labels(columns, rules)[rows]
+        X = np.empty((len(labels), len(FEATURES)), dtype=np.int64)
+        for j, name in enumerate(FEATURES):
+            X[:, j] = columns[name][rows]
+        yield X, labels
+
+
+def train_complement_nb(chunks, alpha=1.0):
+    """Fits ComplementNB chunk by chunk; returns the model and the training rows per class."""
+    from sklearn.naive_bayes import ComplementNB
+    model = ComplementNB(alpha=alpha)
+    class_counts = np.zeros(len(CLASSES), dtype=np.int64)
+    for X, y in chunks():
+        model.partial_fit(X, y, classes=CLASSES)
+        class_counts += np.bincount(y, minlength=len(CLASSES))
+    if not class_counts.any():
+        raise ValueError("no training rows in the feature store")
+    return model, class_counts
+
+
+def train_logistic_regression(chunks, epochs=5, alpha=0.0001, seed=42):
+    """
+    Fits logistic regression with SGD chunk by chunk.
+
+    Parameters:
+        chunks (callable): Returns a new iterator of (X, y) training chunks for each pass
+        epochs (int): Passes of SGD over the training rows
+        alpha (float): L2 regularization strength
+        seed (int): Seed of SGD's shuffling within each chunk
+
+    Returns:
+        tuple: LogisticRegression on unscaled features, training rows per class
+    """
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    class_counts = np.zeros(len(CLASSES), dtype=np.int64)
+    for X, y in chunks():
+        scaler.partial_fit(X.astype(np.float64))
+        class_counts += np.bincount(y, minlength=len(CLASSES))
+    if not class_counts.any():
+        raise ValueError("no training rows in the feature store")
+
+    sgd = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed)
+    for _ in range(epochs):
+        for X, y in chunks():
+            sgd.partial_fit(scaler.transform(X.astype(np.float64)), y, classes=CLASSES)
+
+    # w . (x - mean) / scale + b  ==  (w / scale) . x + (b - (w / scale) . mean)
+    model = LogisticRegression()
+    model.classes_ = sgd.classes_
+    model.coef_ = sgd.coef_ / scaler.scale_
+    model.intercept_ = sgd.intercept_ - model.coef_ @ scaler.mean_
+    model.n_features_in_ = len(FEATURES)
+    model.n_iter_ = np.array([epochs])
+    return model, class_counts
+
+
+def evaluate(model, chunks):
+    """Confusion counts of a served model on (X, y) chunks, spam as positive class."""
+    counts = ConfusionCounts()
+    for X, y in chunks():
+        labels, _ = predict_with_proba(model, X)
+        counts.update_many(y == 1, labels == 1)
+    return counts
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far, None where the platform does not report it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def train(store_path, model_name, chunk_size=65536, test_fraction=0.2, epochs=5, alpha=None, seed=42, rules=None):
+    """
+    Trains a model on the train split of a feature store and evaluates it on the test split.
+
+    Parameters:
+        store_path (str): Feature store file (.arrow)
+        model_name (str): One of `MODELS`
+        chunk_size (int): Store rows in memory at a time
+        test_fraction (float): Share of the messages held out for the metrics
+        epochs (int): SGD passes, logistic regression only
+        alpha (float): Smoothing for ComplementNB, L2 strength for logistic regression; None for their defaults
+        seed (int): SGD seed, logistic regression only
+        rules (RuleSet): Rules to label with, defaults to the notebook rules
+
+    Returns:
+        tuple: (model as it will be served, metrics dict)
+    """
+    store = FeatureStore(store_path)
+    rules = rules or NOTEBOOK_RULE_SET
+    start = time.perf_counter()
+
+    def train_chunks():
+        return labelled_chunks(store, False, test_fraction, chunk_size, rules)
+
+    def test_chunks():
+        return labelled_chunks(store, True, test_fraction, chunk_size, rules)
+
+    if model_name == "complement_nb":
+        params = {"alpha": 1.0 if alpha is None else alpha}
+        model, class_counts = train_complement_nb(train_chunks, **params)
+    elif model_name == "logistic_regression":
+        params = {"epochs": epochs, "alpha": 0.0001 if alpha is None else alpha, "seed": seed}
+        model, class_counts = train_logistic_regression(train_chunks, **params)
+    else:
+        raise ValueError(f"unknown model {model_name!r}, expected one of {', '.join(MODELS)}")
+    train_seconds = time.perf_counter() - start
+
+    model = as_kernel(model)
+    counts = evaluate(model, test_chunks)
+    metrics = {
+        "model": model_name,
+        "params": params,
+        "features": FEATURES,
+        "feature_versions": FEATURE_VERSIONS,
+        "labels": {"rules": rules.names, "fingerprint": rules.fingerprint},
+        "test_fraction": test_fraction,
+        "chunk_size": chunk_size,
+        "train_rows": int(class_counts.sum()),
+        "train_spam": int(class_counts[1]),
+        "test_rows": counts.total,
+        "test": counts.metrics(),
+        "confusion_matrix": {"tp": counts.tp, "fp": counts.fp, "tn": counts.tn, "fn": counts.fn},
+        "train_seconds": round(train_seconds, 3),
+        "peak_memory_mb": peak_memory_mb(),
+    }
+    return model, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("store", help="Feature store file (.arrow), see api/feature_store.py")
+    parser.add_argument("output", help="Model artifact to write (.joblib)")
+    parser.add_argument("--model", choices=MODELS, default="complement_nb")
+    parser.add_argument("--chunk-size", type=int, default=65536, help="Store rows in memory at a time")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=5, help="SGD passes (logistic regression)")
+    parser.add_argument("--alpha", type=float, help="ComplementNB smoothing or SGD L2 strength")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rules", help="Rule file to label with (see api/rules.py), defaults to the notebook rules")
+    parser.add_argument("--metrics", help="Metrics file to write, defaults to <output>.metrics.json")
+    args = parser.parse_args()
+
+    model, metrics = train(args.store, args.model, args.chunk_size, args.test_fraction, args.epochs,
+                           args.alpha, args.seed, RuleSet.load(args.rules))
+    write_artifact(model, args.output)
+    metrics_path = args.metrics or args.output + ".metrics.json"
+    with open(metrics_path, "w") as file:
+        json.dump(metrics, file, indent=2)
+
+    test = metrics["test"]
+    print(f"Trained {args.model} on {metrics['train_rows']} messages ({metrics['train_spam']} spam) "
+          f"in {metrics['train_seconds']:.1f}s, peak memory {metrics['peak_memory_mb']} MB")
+    print(f"Test split, {metrics['test_rows']} messages: accuracy {test['accuracy']}, precision {test['precision']}, "
+          f"recall {test['recall']}, F1 {test['f1']}")
+    print(f"Wrote {args.output} and {metrics_path}")
+
+
+if __name__ == "__main__":
+    main()
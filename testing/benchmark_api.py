@@ -0,0 +1,80 @@
+"""
+Throughput of the JSON scoring API, in messages/sec at several batch sizes.
+
+Posts synthetic raw messages through Flask's test client, so the numbers
+cover request parsing, base64 decoding, feature extraction, the model and
+JSON encoding, without network overhead. "single" posts each message raw to
+/api/v1/classify; the others post batches to /api/v1/classify/batch as JSON
+(base64) or multipart/form-data.
+
+Without --model a ComplementNB is fitted on synthetic emails, as in
+benchmark_startup.
+
+Run from the repository root:
+    python -m testing.benchmark_api --messages 2000 --batch-sizes 1,10,100,500
+"""
+import argparse
+import base64
+import io
+import os
+import tempfile
+import time
+
+from testing.benchmark_startup import synthetic_model
+from testing.sample_emails import generate_corpus
+
+
+def post_single(client, messages):
+    for raw_email_bytes in messages:
+        response = client.post("/api/v1/classify", data=raw_email_bytes, content_type="message/rfc822")
+        assert response.status_code == 200, response.get_json()
+
+
+def post_json(client, batch):
+    body = {"messages": [base64.b64encode(raw_email_bytes).decode() for raw_email_bytes in batch]}
+    response = client.post("/api/v1/classify/batch", json=body)
+    assert response.status_code == 200 and len(response.get_json()["results"]) == len(batch), response.get_json()
+
+
+def post_multipart(client, batch):
+    files = {f"message-{i}": (io.BytesIO(raw_email_bytes), f"{i}.eml") for i, raw_email_bytes in enumerate(batch)}
+    response = client.post("/api/v1/classify/batch", data=files, content_type="multipart/form-data")
+    assert response.status_code == 200 and len(response.get_json()["results"]) == len(batch), response.get_json()
+
+
+def throughput(post, client, messages, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(messages), batch_size):
+        post(client, messages[offset:offset + batch_size])
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="Messages scored per run")
+    parser.add_argument("--batch-sizes", default="1,10,100,500", help="Comma-separated batch sizes")
+    parser.add_argument("--model", help="Model artifact to serve (default: a synthetic one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The registry reads MODEL_PATHS on import, which building the synthetic model already does
+        if args.model:
+            os.environ["MODEL_PATHS"] = f"default={args.model}"
+        else:
+            os.environ["MODEL_PATHS"] = f"default={os.path.join(directory, 'complement_nb.joblib')}"
+            synthetic_model(directory)
+
+        from api.app import app, get_registry
+        get_registry().warm()
+        client = app.test_client()
+        messages = [email_text.strip().encode() for email_text in generate_corpus(args.messages)]
+
+        print(f"{'single':<10} {throughput(post_single, client, messages, 1):>8.0f} messages/sec")
+        for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+            json_rate = throughput(post_json, client, messages, batch_size)
+            multipart_rate = throughput(post_multipart, client, messages, batch_size)
+            print(f"batch {batch_size:<4} {json_rate:>8.0f} messages/sec (JSON)  {multipart_rate:>8.0f} (multipart)")
+
+
+if __name__ == "__main__":
+    main()
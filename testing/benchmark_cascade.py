@@ -0,0 +1,92 @@
+"""
+Speed and agreement of the two-stage cascade (api/cascade.py) against the full pipeline.
+
+The synthetic corpus is converted to Gmail's raw format, and some of its
+emails get a long body (newsletters) or a large attachment, which is where
+reading only a prefix saves work. Each model then scores the corpus through
+the full pipeline and through the cascade at each threshold pair; the report
+gives the share of messages settled by stage one and the metrics of
+`evaluate_model_vs_gmail` against the full pipeline's labels, then the
+setting `python -m api.cascade --write` would save for the model, if any.
+Agreement differs between models and corpus sizes, which is why serving
+only uses a setting measured for the model it serves.
+
+Without --models, a ComplementNB and a LogisticRegression are fitted on the
+synthetic corpus, as in benchmark_inference.
+
+Run from the repository root:
+    python -m testing.benchmark_cascade --size 2000 --thresholds 0.999:0.001 0.99:-1
+    python -m testing.benchmark_cascade --models models/complement_nb.joblib --prefix-bytes 2048 8192
+"""
+import argparse
+import random
+
+import numpy as np
+
+from api.all_functions import ParsedGmailMessage, load_model
+from api.cascade import (
+    CANDIDATE_THRESHOLDS, CASCADE_MIN_AGREEMENT, best_setting, cascade_report, kernel_predict, parse_thresholds,
+    print_report
+)
+from testing.benchmark_inference import fitted_models
+from testing.benchmark_raw_ingest import gmail_raw, with_large_attachment
+from testing.sample_emails import SENTENCES, generate_corpus
+
+
+def with_long_body(email_text, size_kb, rng):
+    """Grows the first text body of an email to about `size_kb`, like a newsletter."""
+    header, separator, body = email_text.partition("\n\n")
+    sentences = []
+    while sum(map(len, sentences)) < size_kb * 1024:
+        sentences.append(rng.choice(SENTENCES))
+    if "boundary123" not in header:
+        return header + separator + body.rstrip("\n") + " " + " ".join(sentences) + "\n"
+    first_part_end = body.index("\n--boundary123", 1)
+    return header + separator + body[:first_part_end] + " " + " ".join(sentences) + body[first_part_end:]
+
+
+def build_corpus(size, long_fraction, body_kb, attachment_kb, seed=0):
+    rng = random.Random(seed)
+    emails = []
+    for email_text in generate_corpus(size):
+        if rng.random() < long_fraction:
+            email_text = with_long_body(email_text, body_kb, rng)
+        if attachment_kb and "multipart/mixed" in email_text:
+            email_text = with_large_attachment(email_text, attachment_kb, rng)
+        emails.append(email_text)
+    return emails, [gmail_raw(email_text) for email_text in emails]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2000, help="Number of synthetic emails")
+    parser.add_argument("--long-fraction", type=float, default=0.3, help="Share of emails with a long body")
+    parser.add_argument("--body-kb", type=int, default=64, help="Size of a long body")
+    parser.add_argument("--attachment-kb", type=int, default=256,
+                        help="Size of an attachment added to every multipart/mixed email, 0 for none")
+    parser.add_argument("--prefix-bytes", type=int, nargs="+", default=[4096])
+    parser.add_argument("--thresholds", nargs="+", type=parse_thresholds, default=CANDIDATE_THRESHOLDS)
+    parser.add_argument("--min-agreement", type=float, default=CASCADE_MIN_AGREEMENT)
+    parser.add_argument("--models", nargs="+", help="Model artifacts or pickles (default: fitted on the corpus)")
+    args = parser.parse_args()
+
+    _, corpus = build_corpus(args.size, args.long_fraction, args.body_kb, args.attachment_kb)
+    print(f"Corpus: {len(corpus)} emails, {sum(map(len, corpus)) / 1e6:.1f} MB")
+    if args.models:
+        models = [(path, load_model(path)) for path in args.models]
+    else:
+        X = np.array([ParsedGmailMessage(email_bytes).feature_vector() for email_bytes in corpus])
+        models = fitted_models(X)
+
+    for name, model in models:
+        predict = kernel_predict(model)
+        for prefix_bytes in args.prefix_bytes:
+            print(f"\n{name}, stage one reads {prefix_bytes} body bytes; metrics are against the full pipeline")
+            report = cascade_report(corpus, predict, args.thresholds, prefix_bytes)
+            print_report(report, len(corpus))
+            run = best_setting(report, args.min_agreement)
+            print(f"Setting to write: {run['run'] if run else 'none, the model keeps the full pipeline'}")
+
+
+if __name__ == "__main__":
+    main()
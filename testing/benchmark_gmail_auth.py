@@ -0,0 +1,110 @@
+"""
+Per-request cost of Gmail authentication and service setup, offline.
+
+Compares the old path, which unpickled the user's token, refreshed it when
+needed and built a new Gmail service (and connection) for the request thread
+and for every download thread, with the per-user `GmailPool`. Both run the
+real googleapiclient against `FakeGmailTransport` and refresh tokens through
+`FakeTokenEndpoint`, so connections and refreshes can be counted.
+
+--stored-expires-in sets how long the stored token has left. Once that is
+below google-auth's refresh threshold (3m45s) the old path refreshes on
+every request, since it never saved the refreshed token; the pool refreshes
+once, GMAIL_REFRESH_MARGIN seconds before expiry, and saves the new token.
+
+Run from the repository root:
+    python -m testing.benchmark_gmail_auth --requests 20 --concurrency 4 --connect-latency 0.05
+    python -m testing.benchmark_gmail_auth --stored-expires-in 60
+"""
+import argparse
+import datetime
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+
+from api.all_functions import fetch_raw_messages, list_message_ids
+from api.gmail_pool import GmailPool, SCOPES, build_gmail_service
+from testing.fake_gmail import FakeGmailService, FakeGmailTransport, FakeTokenEndpoint
+from testing.sample_emails import generate_corpus
+
+EMAIL = "me@example.com"
+
+
+def stored_credentials(expires_in):
+    return Credentials(
+        token="access-token-0", refresh_token="refresh-token", client_id="client-id", client_secret="secret",
+        token_uri="https://oauth2.googleapis.com/token", scopes=SCOPES,
+        expiry=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        + datetime.timedelta(seconds=expires_in),
+    )
+
+
+def old_service_factory(token_path, transport, token_endpoint):
+    """What every request did before the pool: unpickle, maybe refresh, new service per thread."""
+    with open(token_path, "rb") as token_file:
+        creds = pickle.load(token_file)
+    if not creds.valid:
+        creds.refresh(token_endpoint)
+    return lambda: build_gmail_service(http=AuthorizedHttp(creds, http=transport.http()))
+
+
+def pool_service_factory(pool):
+    pool.credentials(EMAIL)
+    return lambda: pool.service(EMAIL)
+
+
+def page_request(make_factory):
+    service_factory = make_factory()
+    message_ids, _ = list_message_ids(service_factory(), "INBOX", 30)
+    return fetch_raw_messages(message_ids, service_factory, max_workers=8)
+
+
+def run(label, make_factory, transport, token_endpoint, requests, concurrency):
+    transport.connections = 0
+    token_endpoint.refreshes = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pages = list(pool.map(lambda _: page_request(make_factory), range(requests)))
+    elapsed = time.perf_counter() - start
+    assert all(len(page) == 30 and all(page) for page in pages)
+    print(f"{label:<10} {elapsed / requests * 1000:>8.1f} ms/request  {requests / elapsed:>7.1f} requests/sec  "
+          f"{transport.connections:>4} connections  {token_endpoint.refreshes:>3} token refreshes")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="Page requests per run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Page requests served at once")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds per fake Gmail request")
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="Seconds to open a connection")
+    parser.add_argument("--refresh-latency", type=float, default=0.1, help="Seconds per token refresh")
+    parser.add_argument("--stored-expires-in", type=int, default=3600, help="Seconds the stored token has left")
+    parser.add_argument("--expires-in", type=int, default=3600, help="Lifetime of refreshed tokens in seconds")
+    args = parser.parse_args()
+
+    service = FakeGmailService.from_corpus(generate_corpus(30), spam_fraction=0.0, latency=args.latency)
+    token_endpoint = FakeTokenEndpoint(latency=args.refresh_latency, expires_in=args.expires_in)
+    transport = FakeGmailTransport(service, connect_latency=args.connect_latency, token_endpoint=token_endpoint)
+
+    with tempfile.TemporaryDirectory() as token_folder:
+        token_path = os.path.join(token_folder, f"{EMAIL}.pickle")
+        with open(token_path, "wb") as token_file:
+            pickle.dump(stored_credentials(args.stored_expires_in), token_file)
+        before = run("old", lambda: old_service_factory(token_path, transport, token_endpoint),
+                     transport, token_endpoint, args.requests, args.concurrency)
+
+        # The pool converts the same pickle to tokens/<email>.json on first use
+        pool = GmailPool(token_folder, http_factory=transport.http, auth_request=token_endpoint)
+        after = run("pool", lambda: pool_service_factory(pool), transport, token_endpoint,
+                    args.requests, args.concurrency)
+        print(f"speedup {before / after:.1f}x; token file now {sorted(os.listdir(token_folder))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Measures page fetch time against the fake Gmail service at several concurrency levels.
+
+Run from the repository root:
+    python -m testing.benchmark_gmail_fetch --latency 0.05 --workers 1 4 8 16
+"""
+import argparse
+import time
+
+from api.all_functions import fetch_and_format_emails
+from testing.fake_gmail import FakeGmailService
+from testing.sample_emails import generate_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake Gmail request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 429")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--pages", type=int, default=3)
+    args = parser.parse_args()
+
+    service = FakeGmailService.from_corpus(
+        generate_corpus(30 * args.pages), spam_fraction=0.0,
+        latency=args.latency, error_rate=args.error_rate
+    )
+
+    baseline = None
+    for workers in args.workers:
+        service.request_count = 0
+        start = time.perf_counter()
+        page_token, fetched = None, 0
+        for _ in range(args.pages):
+            emails, page_token = fetch_and_format_emails(
+                page_token=page_token, service_factory=lambda: service, max_workers=workers
+            )
+            fetched += len(emails)
+        elapsed = (time.perf_counter() - start) / args.pages
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {elapsed * 1000:>8.1f} ms/page  {baseline / elapsed:>5.1f}x  "
+              f"({fetched} emails, {service.request_count} requests)")
+
+
+if __name__ == "__main__":
+    main()
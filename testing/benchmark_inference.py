@@ -0,0 +1,95 @@
+"""
+Per-email inference latency of the sklearn pipeline against the NumPy kernel.
+
+Features are extracted once up front, so only the model call is timed:
+the old `Pipeline` with its DataFrame transformer, the bare estimator on a
+NumPy matrix and `LinearKernel`, one email at a time and in batches. Also
+checks that the kernel's labels and probabilities are bit-identical to the
+estimator's on the corpus rows and on `validation_matrix`.
+
+Without --models, a ComplementNB and a LogisticRegression are fitted on the
+synthetic corpus with rule-based labels.
+
+Run from the repository root:
+    python -m testing.benchmark_inference --size 2000
+    python -m testing.benchmark_inference --models re_complement_naive_bayes_model.pkl re_logistic_regression_model.pkl
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import ComplementNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from api.all_functions import ParsedEmail, FEATURES, load_model
+from api.inference import LinearKernel, validation_matrix
+from testing.sample_emails import generate_corpus
+
+
+def fitted_models(X):
+    column = {name: X[:, i] for i, name in enumerate(FEATURES)}
+    y = ((column["spam_score"] > 3) | (column["num_suspicious_links"] > 0)
+         | (column["num_suspicious_attachments"] > 0) | column["is_fake_domain"].astype(bool)).astype(int)
+    return [
+        ("ComplementNB", ComplementNB().fit(X, y)),
+        ("LogisticRegression", LogisticRegression(max_iter=1000).fit(X, y)),
+    ]
+
+
+def old_pipeline(classifier):
+    return Pipeline([
+        ("transformer", FunctionTransformer(lambda rows: pd.DataFrame(rows, columns=FEATURES))),
+        ("classifier", classifier),
+    ])
+
+
+def per_email_us(func, X, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(X), batch_size):
+        func(X[i:i + batch_size])
+    return (time.perf_counter() - start) / len(X) * 1e6
+
+
+def mismatches(kernel, classifier, X):
+    labels, probabilities = kernel.predict_with_proba(X)
+    expected_labels, expected_probabilities = classifier.predict(X), classifier.predict_proba(X)
+    same_labels = labels == expected_labels
+    same_probabilities = (probabilities.view(np.uint64) == expected_probabilities.view(np.uint64)).all(axis=1)
+    return int((~(same_labels & same_probabilities)).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2000, help="Number of synthetic emails")
+    parser.add_argument("--models", nargs="*", help="Pickled or joblib classifiers (default: fit two on the corpus)")
+    parser.add_argument("--batch-sizes", type=int, nargs="*", default=[1, 30, 1000])
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", message="X (does not have valid|has) feature names")
+
+    X = np.array([ParsedEmail(email_text.strip()).feature_vector() for email_text in generate_corpus(args.size)],
+                 dtype=np.int64)
+    if args.models:
+        models = [(path, load_model(path)) for path in args.models]
+    else:
+        models = fitted_models(X)
+
+    for name, classifier in models:
+        kernel = LinearKernel.from_estimator(classifier)
+        pipeline = old_pipeline(classifier)
+        print(f"\n{name} (normalizer: {kernel.normalizer})")
+        print(f"Mismatched rows: corpus {mismatches(kernel, classifier, X)}/{len(X)}, "
+              f"validation {mismatches(kernel, classifier, validation_matrix(X.shape[1]))}/4096")
+        print(f"{'batch':>6} {'pipeline us/email':>18} {'estimator us/email':>19} {'kernel us/email':>16} {'speedup':>8}")
+        for batch_size in args.batch_sizes:
+            before = per_email_us(pipeline.predict_proba, X, batch_size)
+            bare = per_email_us(classifier.predict_proba, X, batch_size)
+            after = per_email_us(kernel.predict_with_proba, X, batch_size)
+            print(f"{batch_size:>6} {before:>18.1f} {bare:>19.1f} {after:>16.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Overhead of the hot-path metrics (api/metrics.py).
+
+Classifies the same synthetic emails through `classify_batch` with metrics
+recording on and off, alternating runs, and reports the per-email cost of
+each and of a single histogram observation.
+
+Without --model a ComplementNB is fitted on synthetic emails, as in
+benchmark_startup.
+
+Run from the repository root:
+    python -m testing.benchmark_metrics --emails 500 --runs 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import timeit
+
+from testing.benchmark_startup import synthetic_model
+from testing.sample_emails import generate_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=500, help="Emails per run")
+    parser.add_argument("--batch-size", type=int, default=30, help="Emails per classify_batch call, like a page")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per setting")
+    parser.add_argument("--model", help="Model artifact to serve (default: a synthetic one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The registry reads MODEL_PATHS on import, which building the synthetic model already does
+        if args.model:
+            os.environ["MODEL_PATHS"] = f"default={args.model}"
+        else:
+            os.environ["MODEL_PATHS"] = f"default={os.path.join(directory, 'complement_nb.joblib')}"
+            synthetic_model(directory)
+
+        from api import metrics
+        from api.app import classify_batch, get_registry
+        get_registry().warm()
+        emails = generate_corpus(args.emails)
+
+        def run():
+            start = time.perf_counter()
+            for offset in range(0, len(emails), args.batch_size):
+                classify_batch(emails[offset:offset + args.batch_size])
+            return (time.perf_counter() - start) / len(emails)
+
+        results = {True: [], False: []}
+        for _ in range(args.runs):
+            for enabled in (False, True):
+                metrics.METRICS_ENABLED = enabled
+                results[enabled].append(run())
+
+        off, on = statistics.median(results[False]), statistics.median(results[True])
+        print(f"metrics off {off * 1e6:>8.1f} us/email")
+        print(f"metrics on  {on * 1e6:>8.1f} us/email  ({(on - off) / off * 100:+.1f}%)")
+
+        histogram = metrics.Histogram("benchmark_seconds", "Benchmark", ("stage",))
+        observe = timeit.timeit(lambda: histogram.observe(0.001, "parse"), number=100000) / 100000
+        print(f"one histogram observation {observe * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compares per-feature parsing with the single-parse `ParsedEmail` extractor.
+
+Run from the repository root:
+    python -m testing.benchmark_parsing --size 5000
+"""
+import argparse
+import time
+
+from api.all_functions import (
+    count_words, count_links_and_domains, has_html,
+    count_attachments, count_suspicious_attachments, spam_score, count_suspicious_links,
+    is_fake_domain, is_missing_to, count_recipients, count_subject_words,
+    extract_headers, ParsedEmail, FEATURES
+)
+from testing.sample_emails import generate_corpus
+
+
+def features_per_function(email_text):
+    """The old `transform_email` path: every MIME feature parses the email again."""
+    headers = extract_headers(email_text)
+    features = {
+        "num_words": count_words(email_text),
+        "num_links": count_links_and_domains(email_text),
+        "num_attachments": count_attachments(email_text),
+        "num_suspicious_attachments": count_suspicious_attachments(email_text),
+        "has_html": has_html(email_text),
+        "spam_score": spam_score(email_text),
+        "num_suspicious_links": count_suspicious_links(email_text),
+        "is_fake_domain": is_fake_domain(email_text),
+        "is_missing_to": is_missing_to(email_text),
+        "num_recipients": count_recipients(email_text),
+        "num_subject_words": count_subject_words(email_text),
+    }
+    return headers, [int(features[name]) for name in FEATURES]
+
+
+def features_single_parse(email_text):
+    parsed = ParsedEmail(email_text)
+    return parsed.headers(), parsed.feature_vector()
+
+
+def mime_per_function(email_text):
+    """Only the header/MIME features, which used to parse the email eight times."""
+    return (
+        extract_headers(email_text), has_html(email_text), count_attachments(email_text),
+        count_suspicious_attachments(email_text), is_fake_domain(email_text),
+        is_missing_to(email_text), count_recipients(email_text), count_subject_words(email_text),
+    )
+
+
+def mime_single_parse(email_text):
+    parsed = ParsedEmail(email_text)
+    return (
+        parsed.headers(), parsed.has_html, parsed.num_attachments,
+        parsed.num_suspicious_attachments, parsed.is_fake_domain,
+        parsed.is_missing_to, parsed.num_recipients, parsed.num_subject_words,
+    )
+
+
+def run(label, func, corpus):
+    start = time.perf_counter()
+    results = [func(email_text) for email_text in corpus]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<20} {len(corpus) / elapsed:>10.1f} emails/sec  ({elapsed:.2f}s)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=5000, help="Number of synthetic emails")
+    args = parser.parse_args()
+
+    corpus = [email_text.strip() for email_text in generate_corpus(args.size)]
+    print(f"Corpus: {len(corpus)} emails")
+
+    print("MIME parsing only:")
+    before = run("per-function", mime_per_function, corpus)
+    after = run("single parse", mime_single_parse, corpus)
+    print(f"Mismatched rows: {sum(1 for old, new in zip(before, after) if old != new)}")
+
+    print("All 11 features plus headers:")
+    before = run("per-function", features_per_function, corpus)
+    after = run("single parse", features_single_parse, corpus)
+    print(f"Mismatched rows: {sum(1 for old, new in zip(before, after) if old != new)}")
+
+
+if __name__ == "__main__":
+    main()
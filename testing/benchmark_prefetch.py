@@ -0,0 +1,95 @@
+"""
+Latency of clicking "next" through a folder, with and without prefetching.
+
+A simulated user opens the inbox and follows its "next" link page after
+page, pausing --think-time seconds on each page like a reader would. Gmail
+is the fake service with --latency seconds per request, and the
+classification cache is disabled so every page really is fetched and
+classified. With prefetching the page behind "next" is loaded while the
+user reads, so clicks after the first are answered from memory. The
+prefetcher's hit/miss counters are printed at the end.
+
+Without --model a ComplementNB is fitted on synthetic emails, as in
+benchmark_startup.
+
+Run from the repository root:
+    python -m testing.benchmark_prefetch --pages 8 --think-time 0.5 --latency 0.05
+"""
+import argparse
+import os
+import re
+import statistics
+import tempfile
+import time
+
+# Every page should pay for fetching and classifying, not hit a warm cache
+os.environ.setdefault("CLASSIFICATION_CACHE_PATH", ":memory:")
+
+from testing.benchmark_startup import synthetic_model
+from testing.fake_gmail import FakeGmailService
+from testing.sample_emails import generate_corpus
+
+NEXT_LINK_RE = re.compile(r"page_token=([^\"&]+)")
+
+
+def browse(app_module, user, pages, think_time):
+    """Seconds taken by each page request while clicking through `pages` pages."""
+    client = app_module.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session["user_email"] = user
+    latencies = []
+    route = "/inbox-folder"
+    for _ in range(pages):
+        start = time.perf_counter()
+        response = client.get(route)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, (route, response.status_code)
+        match = NEXT_LINK_RE.search(response.get_data(as_text=True))
+        if match is None:
+            break
+        route = f"/inbox-folder?page_token={match.group(1)}"
+        time.sleep(think_time)
+    return latencies
+
+
+def report(label, latencies):
+    later = latencies[1:] or latencies
+    print(f"{label:<12} first page {latencies[0] * 1000:>7.1f} ms   "
+          f"next clicks median {statistics.median(later) * 1000:>7.1f} ms   max {max(later) * 1000:>7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=8, help="Pages to click through")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Seconds spent reading each page")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake Gmail request")
+    parser.add_argument("--model", help="Model artifact to serve (default: a synthetic one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The registry reads MODEL_PATHS on import, which building the synthetic model already does
+        if args.model:
+            os.environ["MODEL_PATHS"] = f"default={args.model}"
+        else:
+            os.environ["MODEL_PATHS"] = f"default={os.path.join(directory, 'complement_nb.joblib')}"
+            synthetic_model(directory)
+
+        import api.app as app_module
+        from api.classification_cache import get_cache
+        from api.prefetch import get_prefetcher
+
+        service = FakeGmailService.from_corpus(generate_corpus(30 * args.pages), spam_fraction=0.0,
+                                               latency=args.latency)
+        app_module.gmail_service_factory = lambda: (lambda: service)
+        get_cache().max_entries = 0  # Evict on every write, so nothing is served from cache
+        app_module.get_registry().warm()
+
+        app_module.PREFETCH_ENABLED = False
+        report("no prefetch", browse(app_module, "reader-a@example.com", args.pages, args.think_time))
+        app_module.PREFETCH_ENABLED = True
+        report("prefetch", browse(app_module, "reader-b@example.com", args.pages, args.think_time))
+        print("prefetcher: " + ", ".join(f"{name} {value}" for name, value in get_prefetcher().stats().items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compares the reconstruct-then-parse Gmail path with `ParsedGmailMessage`.
+
+The synthetic emails are converted to what Gmail's `format=raw` returns:
+CRLF line endings and base64 attachments wrapped at 76 columns. Edge cases
+cover non-canonical base64, quoted-printable attachments, encoded headers and
+large base64 bodies that have to fall back to a full parse.
+
+Run from the repository root:
+    python -m testing.benchmark_raw_ingest --size 2000 --attachment-kb 512
+"""
+import argparse
+import base64
+import random
+import textwrap
+import time
+
+from api.all_functions import extract_raw_email, ParsedEmail, ParsedGmailMessage
+from testing.sample_emails import generate_corpus
+
+EDGE_CASES = [
+    # Base64 with non-zero trailing bits and a stray character: not canonical, decoded like before
+    "From: a@b.com\nTo: c@d.com\nSubject: odd base64\nContent-Type: multipart/mixed; boundary=\"b\"\n\n"
+    "--b\nContent-Type: text/plain\n\nfree money\n--b\nContent-Disposition: attachment; filename=\"x.exe\"\n"
+    "Content-Transfer-Encoding: base64\n\nZnJlZR==\nZn*Jl\n--b--\n",
+    # Quoted-printable attachment and an empty one
+    "From: promo@free-deals.biz\nSubject: =?utf-8?q?Win_a_prize?=\nContent-Type: multipart/mixed; boundary=\"b\"\n\n"
+    "--b\nContent-Type: text/plain\n\nhttp://bit.ly/x\n--b\nContent-Disposition: attachment; filename=\"a.txt\"\n"
+    "Content-Transfer-Encoding: quoted-printable\n\nfree=20cash=\nhere\n--b\nContent-Disposition: attachment; "
+    "filename=\"empty.zip\"\nContent-Transfer-Encoding: base64\n\n\n--b--\n",
+    # Single part html, no body in the reconstruction
+    "From: x@y.com\nTo: a@b.com, c@d.com\nSubject: html\nContent-Type: text/html\n\n<p>FREE offer</p>\n",
+    # Large base64 bodies that are not attachments: a plain text body and an inline image
+    "From: news@example.com\nTo: a@b.com\nSubject: base64 text body\nContent-Type: multipart/related; boundary=\"b\"\n\n"
+    "--b\nContent-Type: text/plain; charset=utf-8\nContent-Transfer-Encoding: base64\n\n"
+    + base64.b64encode(b"Act now, free cash prize! " * 400).decode("ascii") + "\n"
+    "--b\nContent-Type: image/png\nContent-Disposition: inline\nContent-Transfer-Encoding: base64\n\n"
+    + base64.b64encode(bytes(range(256)) * 40).decode("ascii") + "\n--b--\n",
+    # Large attachment whose last quad has non-zero trailing bits
+    "From: a@b.com\nSubject: large odd base64\nContent-Type: multipart/mixed; boundary=\"b\"\n\n"
+    "--b\nContent-Disposition: attachment; filename=\"big.bin\"\nContent-Transfer-Encoding: base64\n\n"
+    + "QUJD" * 2000 + "QR==\n--b--\n",
+]
+
+
+def gmail_raw(email_text):
+    """Wraps one-line base64 payloads at 76 columns and switches to CRLF, like Gmail's raw format."""
+    lines = []
+    for line in email_text.split("\n"):
+        if len(line) > 76 and " " not in line:
+            lines.extend(textwrap.wrap(line, 76, break_on_hyphens=False))
+        else:
+            lines.append(line)
+    return "\r\n".join(lines).encode("utf-8")
+
+
+def with_large_attachment(email_text, size_kb, rng):
+    """Adds one `size_kb` base64 attachment to a multipart/mixed email."""
+    payload = base64.encodebytes(rng.randbytes(size_kb * 1024)).decode("ascii")
+    part = (
+        "--boundary123\nContent-Type: application/pdf\n"
+        "Content-Disposition: attachment; filename=\"report.pdf\"\n"
+        f"Content-Transfer-Encoding: base64\n\n{payload}"
+    )
+    return email_text.replace("--boundary123--", part + "--boundary123--")
+
+
+def reconstruct_then_parse(email_bytes):
+    parsed = ParsedEmail(extract_raw_email(email_bytes).strip())
+    return parsed.headers(), parsed.feature_vector()
+
+
+def parse_gmail_bytes(email_bytes):
+    parsed = ParsedGmailMessage(email_bytes)
+    return parsed.headers(), parsed.feature_vector()
+
+
+def run(label, func, corpus):
+    start = time.perf_counter()
+    results = [func(email_bytes) for email_bytes in corpus]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {len(corpus) / elapsed:>10.1f} emails/sec  ({elapsed:.2f}s)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2000, help="Number of synthetic emails")
+    parser.add_argument("--attachment-kb", type=int, default=0,
+                        help="Also add an attachment of this size to every multipart/mixed email")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    emails = generate_corpus(args.size)
+    if args.attachment_kb:
+        emails = [with_large_attachment(email_text, args.attachment_kb, rng) for email_text in emails]
+    corpus = [gmail_raw(email_text) for email_text in emails + EDGE_CASES]
+    print(f"Corpus: {len(corpus)} emails, {sum(map(len, corpus)) / 1e6:.1f} MB")
+
+    before = run("reconstruct then parse", reconstruct_then_parse, corpus)
+    after = run("parse Gmail bytes", parse_gmail_bytes, corpus)
+    print(f"Mismatched rows: {sum(1 for old, new in zip(before, after) if old != new)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Throughput of the rule engine (api/rules.py) against the notebooks' row-by-row labeller.
+
+Labels synthetic feature columns three ways: `label_spam_rule_based` through
+`DataFrame.apply` as the notebooks did, `RuleSet.labels` and
+`RuleSet.evaluate`, which also reports the rule that fired. Checks that all
+three agree on every row, and that the first rule reported is the branch
+the if-chain returned from. Also times the rules on a 30-row page, as the
+serving pre-filter runs them.
+
+Run from the repository root:
+    python -m testing.benchmark_rules --rows 5000000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from api.features import FEATURES
+from api.rules import RuleSet, matrix_columns
+from testing.benchmark_training import label_spam_rule_based, synthetic_columns
+
+NOTEBOOK_BRANCHES = [
+    lambda row: row["spam_score"] > 3,
+    lambda row: row["num_links"] > 5,
+    lambda row: row["num_suspicious_links"] > 0,
+    lambda row: row["num_attachments"] > 4,
+    lambda row: row["num_suspicious_attachments"] > 0,
+    lambda row: row["has_html"] and row["is_body_empty"],
+    lambda row: row["is_fake_domain"],
+    lambda row: row["is_missing_to"],
+    lambda row: row["num_recipients"] > 5,
+    lambda row: row["num_subject_words"] < 3,
+]
+
+
+def first_branch(row):
+    # Index of the if-chain's branch that returns 1, -1 when it falls through
+    for index, branch in enumerate(NOTEBOOK_BRANCHES):
+        if branch(row):
+            return index
+    return -1
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000000, help="Rows for the rule engine")
+    parser.add_argument("--apply-rows", type=int, default=100000, help="Rows for DataFrame.apply, which is slow")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rules = RuleSet.load()
+    columns = synthetic_columns(np.random.default_rng(0), args.rows)
+
+    sample = pd.DataFrame({name: column[:args.apply_rows] for name, column in columns.items()})
+    start = time.perf_counter()
+    expected = sample.apply(label_spam_rule_based, axis=1).to_numpy()
+    apply_seconds = time.perf_counter() - start
+    expected_branches = sample.apply(first_branch, axis=1).to_numpy()
+
+    labels_seconds, labels = best_of(lambda: rules.labels(columns), args.repeat)
+    evaluate_seconds, fired = best_of(lambda: rules.evaluate(columns), args.repeat)
+
+    print(f"{'DataFrame.apply':<20} {args.apply_rows / apply_seconds:>14,.0f} rows/s  ({args.apply_rows} rows)")
+    print(f"{'RuleSet.labels':<20} {args.rows / labels_seconds:>14,.0f} rows/s  ({args.rows} rows)")
+    print(f"{'RuleSet.evaluate':<20} {args.rows / evaluate_seconds:>14,.0f} rows/s  ({args.rows} rows, with the rule)")
+    for name, count in rules.counts(fired).items():
+        print(f"    {name:<24} {count:>10}")
+
+    # A pre-filter only sees model features, so html_without_text is left out
+    prefilter = RuleSet([rule for rule in rules.rules if all(name in FEATURES for name in rule.features)])
+    X = np.column_stack([columns[name][:30] for name in FEATURES]).astype(np.int64)
+    page_seconds, _ = best_of(lambda: prefilter.evaluate(matrix_columns(X)), 1000)
+    print(f"Pre-filter of {len(prefilter.rules)} rules on a 30-row page: {page_seconds * 1e6:.0f} us")
+
+    n = args.apply_rows
+    mismatches = {
+        "labels": int(np.count_nonzero(labels[:n] != expected)),
+        "evaluate": int(np.count_nonzero((fired[:n] >= 0) != expected)),
+        "first rule": int(np.count_nonzero(fired[:n] != expected_branches)),
+    }
+    print("Mismatches against the notebook: " + ", ".join(f"{name} {count}" for name, count in mismatches.items()))
+    if any(mismatches.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
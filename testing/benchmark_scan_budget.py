@@ -0,0 +1,74 @@
+"""
+Feature extraction latency against attachment size, with and without scan budgets.
+
+The emails have the shape `extract_raw_email` produces: a short text body
+followed by one base64 attachment inlined into the text. The default config
+scans the whole email, so time grows with the attachment. The budgeted
+config scans the text body and headers only, capped in size and time.
+
+Run from the repository root:
+    python -m testing.benchmark_scan_budget --sizes-mb 0.1 1 5 20
+"""
+import argparse
+import base64
+import os
+import time
+
+from api.all_functions import ParsedEmail
+from api.text_features import FeatureConfig, get_feature_config, set_feature_config
+
+BUDGETED = {
+    "scan": {
+        "num_words": {"regions": ["text"], "max_chars": 200000},
+        "spam_score": {"regions": ["headers", "text"], "max_chars": 200000},
+        "num_links": {"regions": ["text"], "max_chars": 200000},
+        "num_suspicious_links": {"regions": ["text"], "max_chars": 200000},
+    },
+    "scan_time_budget_ms": 20,
+}
+
+
+def make_email(attachment_bytes):
+    payload = base64.b64encode(os.urandom(attachment_bytes)).decode("ascii")
+    return (
+        "From: Deals <promo@cheap-offers.biz>\nTo: a@example.com\nSubject: Your free prize\n"
+        "Mime-Version: 1.0\nContent-Type: multipart/mixed; boundary=\"boundary123\"\n\n"
+        "--boundary123\nContent-Type: text/plain; charset=\"UTF-8\"\nContent-Transfer-Encoding: 7bit\n\n"
+        "Act now to claim your free cash prize at http://bit.ly/claim or www.example.com\n\n"
+        "--boundary123\nContent-Type: application/octet-stream\n"
+        "Content-Disposition: attachment; filename=\"invoice.zip\"\nContent-Transfer-Encoding: base64\n\n"
+        f"{payload}\n\n--boundary123--\n"
+    )
+
+
+def time_features(email_text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = ParsedEmail(email_text)
+        vector = parsed.feature_vector()
+        best = min(best, time.perf_counter() - start)
+    return best, vector, parsed.scan_truncated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[0.1, 1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    default_config = get_feature_config()
+    budgeted_config = FeatureConfig.from_dict(BUDGETED)
+    print(f"{'attachment MB':>13} {'whole email ms':>15} {'budgeted ms':>12}  budgeted features")
+    for size in args.sizes_mb:
+        email_text = make_email(int(size * 1024 * 1024))
+        set_feature_config(default_config)
+        whole, _, _ = time_features(email_text, args.repeat)
+        set_feature_config(budgeted_config)
+        budgeted, vector, truncated = time_features(email_text, args.repeat)
+        print(f"{size:>13} {whole * 1000:>15.1f} {budgeted * 1000:>12.1f}  {vector}{' (truncated)' if truncated else ''}")
+    set_feature_config(default_config)
+
+
+if __name__ == "__main__":
+    main()
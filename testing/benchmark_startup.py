@@ -0,0 +1,113 @@
+"""
+Cold-start cost of the web app: import time and time to first request.
+
+Each run starts a fresh interpreter. `python -X importtime` gives the import
+total of `api.app` and its heaviest dependencies; time to first request is
+measured from spawning the process until the first classification returned,
+model loading included. Also lists which heavy libraries were loaded by the
+time the first request was served.
+
+Without --model a ComplementNB is fitted on synthetic emails and exported
+as a kernel artifact, like `python -m api.model_registry export` does.
+
+Run from the repository root:
+    python -m testing.benchmark_startup --runs 5
+"""
+import argparse
+import json
+import os
+import pickle
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "joblib", "pyarrow", "googleapiclient", "google_auth_oauthlib"]
+IMPORT_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+FIRST_REQUEST = """
+import sys, time, json
+from api.app import app, classify_batch
+from testing.sample_emails import generate_corpus
+imported = time.time()
+app.test_client().get("/models")
+classify_batch(generate_corpus(1))
+print(json.dumps({"imported": imported, "first_request": time.time(),
+                  "heavy": [name for name in HEAVY if name in sys.modules]}))
+"""
+
+
+def import_times():
+    """(cumulative ms of api.app, {direct dependency: cumulative ms}) from one cold import."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api.app"],
+                            capture_output=True, text=True, check=True)
+    total, modules = 0, {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        # Modules are listed after their own imports, so api.app's direct dependencies come just before it
+        if depth == 1 and name == "api.app":
+            total = cumulative
+        elif depth == 3 and not total:
+            modules[name] = cumulative / 1000
+        elif depth == 1:
+            modules = {}  # Imported by the interpreter itself (site, .pth files), not by the app
+    return total / 1000, modules
+
+
+def first_request(env):
+    """(seconds to import, seconds to first response) from spawning a fresh process."""
+    script = f"HEAVY = {HEAVY_MODULES!r}\n" + FIRST_REQUEST
+    start = time.time()
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, env=env)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings["imported"] - start, timings["first_request"] - start, timings["heavy"]
+
+
+def synthetic_model(directory):
+    import numpy as np
+    from sklearn.naive_bayes import ComplementNB
+    from api.all_functions import ParsedEmail, FEATURES
+    from api.model_registry import export_model
+    from testing.sample_emails import generate_corpus
+
+    X = np.array([ParsedEmail(email_text.strip()).feature_vector() for email_text in generate_corpus(500)])
+    y = (X[:, FEATURES.index("spam_score")] > 3).astype(int)
+    pickle_path = os.path.join(directory, "complement_nb.pkl")
+    with open(pickle_path, "wb") as file:
+        pickle.dump(ComplementNB().fit(X, y), file)
+    artifact_path = os.path.join(directory, "complement_nb.joblib")
+    export_model(pickle_path, artifact_path)
+    return artifact_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure")
+    parser.add_argument("--model", help="Model artifact to serve (default: a synthetic one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = args.model or synthetic_model(directory)
+        env = {**os.environ, "MODEL_PATHS": f"default={model_path}",
+               "CLASSIFICATION_CACHE_PATH": os.path.join(directory, "cache.db")}
+
+        runs = [import_times() for _ in range(args.runs)]
+        totals = [total for total, _ in runs]
+        print(f"import api.app (-X importtime, cumulative): median {statistics.median(totals):.0f} ms, "
+              f"min {min(totals):.0f} ms over {args.runs} runs")
+        heaviest = sorted(runs[-1][1].items(), key=lambda item: -item[1])[:8]
+        print("  heaviest imports: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in heaviest))
+
+        starts = [first_request(env) for _ in range(args.runs)]
+        print(f"spawn to app imported: median {statistics.median(s[0] for s in starts) * 1000:.0f} ms")
+        print(f"spawn to first request: median {statistics.median(s[1] for s in starts) * 1000:.0f} ms")
+        print(f"heavy modules loaded: {', '.join(starts[-1][2]) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Time to first row of the inbox: whole-page rendering against streaming.
+
+Each mode loads the same inbox page from the fake Gmail service with
+--latency seconds per request and the classification cache disabled:
+
+    page    /inbox-folder, rendered once every message is classified
+    html    /inbox-folder with STREAM_VIEWS=1, rows streamed in page order
+    ndjson  /inbox-folder/rows, rows streamed as each message is classified
+
+Time to first row is when the first message appears in the response body.
+Without --model a ComplementNB is fitted on synthetic emails, as in
+benchmark_startup.
+
+Run from the repository root:
+    python -m testing.benchmark_streaming --runs 5 --latency 0.05
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+# Every page should pay for fetching and classifying, not hit a warm cache
+os.environ.setdefault("CLASSIFICATION_CACHE_PATH", ":memory:")
+os.environ.setdefault("PREFETCH_PAGES", "0")
+
+from testing.benchmark_startup import synthetic_model
+from testing.fake_gmail import FakeGmailService
+from testing.sample_emails import generate_corpus
+
+MODES = {
+    "page": ("/inbox-folder", False, b'class="email-card"'),
+    "html": ("/inbox-folder", True, b'class="email-card"'),
+    "ndjson": ("/inbox-folder/rows", False, b'"position"'),
+}
+
+
+def load(app_module, route, stream_views, row_marker):
+    """(seconds to the first row, seconds to the end of the response, rows) for one request."""
+    app_module.STREAM_VIEWS = stream_views
+    client = app_module.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session["user_email"] = "reader@example.com"
+
+    start = time.perf_counter()
+    response = client.get(route, buffered=False)
+    assert response.status_code == 200, (route, response.status_code)
+    first_row, rows = None, 0
+    for chunk in response.response:
+        chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+        if row_marker in chunk:
+            first_row = first_row or time.perf_counter() - start
+            rows += chunk.count(row_marker)
+    total = time.perf_counter() - start
+    response.close()
+    return first_row, total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Page loads per mode")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake Gmail request")
+    parser.add_argument("--model", help="Model artifact to serve (default: a synthetic one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The registry reads MODEL_PATHS on import, which building the synthetic model already does
+        if args.model:
+            os.environ["MODEL_PATHS"] = f"default={args.model}"
+        else:
+            os.environ["MODEL_PATHS"] = f"default={os.path.join(directory, 'complement_nb.joblib')}"
+            synthetic_model(directory)
+
+        import api.app as app_module
+        from api.classification_cache import get_cache
+
+        service = FakeGmailService.from_corpus(generate_corpus(30), spam_fraction=0.0, latency=args.latency)
+        app_module.gmail_service_factory = lambda: (lambda: service)
+        get_cache().max_entries = 0  # Evict on every write, so nothing is served from cache
+        app_module.get_registry().warm()
+
+        for mode, (route, stream_views, row_marker) in MODES.items():
+            runs = [load(app_module, route, stream_views, row_marker) for _ in range(args.runs)]
+            assert all(rows == 30 for _, _, rows in runs), (mode, [rows for _, _, rows in runs])
+            print(f"{mode:<7} first row {statistics.median(r[0] for r in runs) * 1000:>7.1f} ms   "
+                  f"whole page {statistics.median(r[1] for r in runs) * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark of every text feature function against its original implementation.
+
+Also checks that both give identical outputs on a golden corpus: the
+synthetic sample emails plus hand-written edge cases.
+
+Run from the repository root:
+    python -m testing.benchmark_text_features --size 3000
+"""
+import argparse
+import re
+import time
+from email import message_from_string
+
+from api.all_functions import (
+    count_words, count_links_and_domains, count_suspicious_links,
+    is_fake_domain, count_suspicious_attachments
+)
+from testing.sample_emails import generate_corpus
+
+EDGE_CASES = [
+    "See http://microsoft.com/download and https://t.co/abc, also bit.ly/x",
+    "nested http://a.com/?u=http://bit.ly/zz and 'http://goo.gl/q' <https://ow.ly/p>",
+    "http:// https://\thttp://\"quoted\" hhttp://is.gd/1 HTTP://BIT.LY/UP",
+    "From: Deals <promo@cheap-offers.biz>\nTo: a@b.com\nSubject: hi\n\nbody",
+    "From: no-at-sign\nSubject: x\n\ny",
+    "Words_with_underscores and-hyphens, numbers 123 456, café naïve",
+    "Content-Type: multipart/mixed; boundary=\"b\"\n\n--b\nContent-Disposition: attachment; "
+    "filename=\"SETUP.EXE\"\n\nx\n--b\nContent-Disposition: attachment; filename=\"a.js.txt\"\n\ny\n--b--\n",
+    "",
+]
+
+
+def original_count_words(text):
+    words = re.findall(r"\b\w+\b", text)
+    return len(words)
+
+
+def original_count_links_and_domains(text):
+    url_pattern = r"https?://[^\s<>\"']+"
+    domain_pattern = r"\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,6}\b"
+    urls = re.findall(url_pattern, text)
+    domains = re.findall(domain_pattern, text)
+    return len(set(urls + domains))
+
+
+def original_count_suspicious_links(text):
+    suspicious_domains = {"bit.ly", "tinyurl.com", "t.co", "goo.gl", "ow.ly", "is.gd", "buff.ly"}
+    links = re.findall(r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+", text)
+    return sum(1 for link in links if any(domain in link for domain in suspicious_domains))
+
+
+def original_is_fake_domain(email_text):
+    msg = message_from_string(email_text)
+    email_from = msg["From"]
+    fake_keywords = ["free", "money", "offer", "lottery", "deal", "promo", "cheap"]
+    if email_from:
+        match = re.search(r'@([\w.-]+)', email_from)
+        if match:
+            domain = match.group(1).lower()
+            return any(keyword in domain for keyword in fake_keywords)
+    return False
+
+
+def original_count_suspicious_attachments(email_text):
+    msg = message_from_string(email_text)
+    dangerous_exts = {".exe", ".zip", ".rar", ".scr", ".iso", ".js", ".bat"}
+    return sum(
+        1 for part in msg.walk()
+        if part.get_filename() and any(part.get_filename().lower().endswith(ext) for ext in dangerous_exts)
+    )
+
+
+PAIRS = [
+    ("count_words", original_count_words, count_words),
+    ("count_links_and_domains", original_count_links_and_domains, count_links_and_domains),
+    ("count_suspicious_links", original_count_suspicious_links, count_suspicious_links),
+    ("is_fake_domain", original_is_fake_domain, is_fake_domain),
+    ("count_suspicious_attachments", original_count_suspicious_attachments, count_suspicious_attachments),
+]
+
+
+def timed(func, corpus):
+    start = time.perf_counter()
+    results = [func(email_text) for email_text in corpus]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=3000, help="Number of synthetic emails")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size) + EDGE_CASES
+    print(f"{'function':<30} {'before us/call':>15} {'after us/call':>15} {'speedup':>8} {'mismatches':>11}")
+    for name, before, after in PAIRS:
+        expected, before_time = timed(before, corpus)
+        actual, after_time = timed(after, corpus)
+        mismatches = sum(1 for old, new in zip(expected, actual) if old != new)
+        print(f"{name:<30} {before_time / len(corpus) * 1e6:>15.1f} {after_time / len(corpus) * 1e6:>15.1f} "
+              f"{before_time / after_time:>7.1f}x {mismatches:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Peak memory of chunked training (api/training.py) against fitting in memory.
+
+Writes synthetic feature stores of growing size, then trains each model on
+each store in a fresh process, once with `python -m api.training` and once
+the way the notebooks did: the whole store in a DataFrame, labelled with
+`label_spam_rule_based` and fitted in one call. Peak resident memory of the
+chunked run should stay flat as the store grows, apart from the pages of
+the memory-mapped store itself; the in-memory one grows with it.
+
+Also checks that the vectorized `rule_based_labels` gives the notebook's
+row-by-row labels on every row of a sample, and times both.
+
+Run from the repository root:
+    python -m testing.benchmark_training --sizes 100000 400000 1600000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from api.feature_store import COLUMN_TYPES, COLUMNS, FeatureStore, _schema
+from api.features import FEATURES
+from api.training import MODELS, peak_memory_mb, rule_based_labels
+
+
+def label_spam_rule_based(row):
+    # The notebooks' labeller, with "not row['body'].strip()" as the stored is_body_empty flag
+    if row["spam_score"] > 3:
+        return 1
+    if row["num_links"] > 5:
+        return 1
+    if row["num_suspicious_links"] > 0:
+        return 1
+    if row["num_attachments"] > 4:
+        return 1
+    if row["num_suspicious_attachments"] > 0:
+        return 1
+    if row["has_html"] and row["is_body_empty"]:
+        return 1
+    if row["is_fake_domain"]:
+        return 1
+    if row["is_missing_to"]:
+        return 1
+    if row["num_recipients"] > 5:
+        return 1
+    if row["num_subject_words"] < 3:
+        return 1
+    return 0
+
+
+def synthetic_columns(rng, rows):
+    """Feature columns with roughly the spread of real mail, so both classes are common."""
+    values = {
+        "num_words": rng.geometric(1 / 200, rows),
+        "num_links": rng.poisson(2, rows),
+        "num_attachments": rng.poisson(0.3, rows),
+        "num_suspicious_attachments": rng.random(rows) < 0.02,
+        "has_html": rng.random(rows) < 0.6,
+        "spam_score": rng.poisson(1, rows),
+        "num_suspicious_links": rng.random(rows) < 0.05,
+        "is_fake_domain": rng.random(rows) < 0.03,
+        "is_missing_to": rng.random(rows) < 0.03,
+        "num_recipients": rng.poisson(1.5, rows),
+        "num_subject_words": rng.poisson(5, rows),
+        "is_body_empty": rng.random(rows) < 0.05,
+    }
+    return {name: np.asarray(values[name]).astype(COLUMN_TYPES[name].to_pandas_dtype()) for name in COLUMNS}
+
+
+def write_store(path, rows, seed=0, batch_rows=100000):
+    """Writes a synthetic feature store of `rows` messages, a batch at a time."""
+    rng = np.random.default_rng(seed)
+    schema = _schema()
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for offset in range(0, rows, batch_rows):
+            size = min(batch_rows, rows - offset)
+            columns = synthetic_columns(rng, size)
+            hashes = pa.array([rng.bytes(16) for _ in range(size)], pa.binary(16))
+            writer.write_batch(pa.record_batch([hashes] + [pa.array(columns[name]) for name in COLUMNS],
+                                               schema=schema))
+
+
+def fit_in_memory(store_path, model_name):
+    """The notebooks' way: everything in a DataFrame, labelled row by row, one `fit`."""
+    import pandas as pd
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.naive_bayes import ComplementNB
+
+    df = pd.DataFrame(FeatureStore(store_path).load_columns(COLUMNS))
+    df["label"] = df.apply(label_spam_rule_based, axis=1)
+    X_train, X_test, y_train, y_test = train_test_split(df[FEATURES].astype(int), df["label"], test_size=0.2,
+                                                        random_state=42)
+    model = ComplementNB() if model_name == "complement_nb" else LogisticRegression(max_iter=500)
+    model.fit(X_train, y_train)
+    return {"accuracy": round(float((model.predict(X_test) == y_test).mean()), 3)}
+
+
+def run(arguments):
+    """Runs a command in a fresh interpreter; returns its wall time."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *arguments], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def check_labels(store_path, sample):
+    import pandas as pd
+    columns = next(FeatureStore(store_path).iter_chunks(COLUMNS, sample))
+    df = pd.DataFrame({name: columns[name] for name in COLUMNS})
+    start = time.perf_counter()
+    expected = df.apply(label_spam_rule_based, axis=1).to_numpy()
+    row_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    labels = rule_based_labels(columns)
+    vector_seconds = time.perf_counter() - start
+    differ = int(np.count_nonzero(expected != labels))
+    print(f"Labels of {len(df)} rows: row by row {row_seconds * 1000:.0f} ms, vectorized {vector_seconds * 1000:.2f} ms "
+          f"({row_seconds / vector_seconds:.0f}x); spam {labels.mean():.0%}; {differ} rows differ")
+    return differ == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 400000, 1600000])
+    parser.add_argument("--models", nargs="+", choices=MODELS, default=list(MODELS))
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--skip-in-memory", action="store_true", help="Only run chunked training")
+    parser.add_argument("--in-memory", nargs=2, metavar=("STORE", "MODEL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.in_memory:
+        # Child process of the in-memory baseline: reports its own peak memory
+        metrics = fit_in_memory(*args.in_memory)
+        print(json.dumps({**metrics, "peak_memory_mb": peak_memory_mb()}), file=sys.stderr)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        ok = True
+        print(f"{'rows':>9} {'model':<20} {'chunked MB':>11} {'s':>6} {'accuracy':>9} "
+              f"{'in-memory MB':>13} {'s':>6} {'accuracy':>9}")
+        for rows in args.sizes:
+            store_path = os.path.join(directory, f"features_{rows}.arrow")
+            write_store(store_path, rows)
+            if rows == args.sizes[0]:
+                ok = check_labels(store_path, min(rows, 50000))
+            for model_name in args.models:
+                artifact = os.path.join(directory, f"{model_name}.joblib")
+                seconds = run(["-m", "api.training", store_path, artifact, "--model", model_name,
+                               "--chunk-size", str(args.chunk_size)])
+                with open(artifact + ".metrics.json") as file:
+                    metrics = json.load(file)
+                line = (f"{rows:>9} {model_name:<20} {metrics['peak_memory_mb']:>11} {seconds:>6.1f} "
+                        f"{metrics['test']['accuracy']:>9}")
+                if not args.skip_in_memory:
+                    start = time.perf_counter()
+                    result = subprocess.run([sys.executable, "-m", "testing.benchmark_training",
+                                             "--in-memory", store_path, model_name],
+                                            check=True, capture_output=True, text=True)
+                    baseline = json.loads(result.stderr.strip().splitlines()[-1])
+                    line += (f" {baseline['peak_memory_mb']:>13} {time.perf_counter() - start:>6.1f} "
+                             f"{baseline['accuracy']:>9}")
+                print(line)
+            os.remove(store_path)
+        if not ok:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
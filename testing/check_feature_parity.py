@@ -0,0 +1,105 @@
+"""
+Parity check of every way features are computed, down to the bytes.
+
+Runs a golden corpus (synthetic emails plus the edge cases of the text
+feature and raw ingest benchmarks) through:
+
+    training    the frozen functions the shipped models were trained with (testing/reference_features.py)
+    serving     `feature_matrix`, the fused `ParsedEmail.features()` pass used by the app and training
+    registry    each feature's own extractor in api/features.py, as the feature store recomputes them
+    store       `compute_columns` of the feature store
+    gmail       `ParsedGmailMessage` on Gmail's raw bytes, as the app and the scoring API see them
+
+and compares the int64 matrices of each against serving byte for byte.
+Exits with status 1 on any difference, listing the first few.
+
+Run from the repository root:
+    python -m testing.check_feature_parity --size 500
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from api.all_functions import ParsedGmailMessage, extract_raw_email
+from api.feature_store import compute_columns
+from api.features import FEATURES, REGISTRY, feature_matrix, parse_emails
+from testing import reference_features
+from testing.benchmark_raw_ingest import EDGE_CASES as RAW_EDGE_CASES, gmail_raw
+from testing.benchmark_text_features import EDGE_CASES as TEXT_EDGE_CASES
+from testing.sample_emails import generate_corpus
+
+REFERENCE_EXTRACTORS = {
+    "num_words": reference_features.count_words,
+    "num_links": reference_features.count_links_and_domains,
+    "num_attachments": reference_features.count_attachments,
+    "num_suspicious_attachments": reference_features.count_suspicious_attachments,
+    "has_html": reference_features.has_html,
+    "spam_score": reference_features.spam_score,
+    "num_suspicious_links": reference_features.count_suspicious_links,
+    "is_fake_domain": reference_features.is_fake_domain,
+    "is_missing_to": reference_features.is_missing_to,
+    "num_recipients": reference_features.count_recipients,
+    "num_subject_words": reference_features.count_subject_words,
+}
+
+
+def training_matrix(email_texts):
+    """Features as the old `transform_email` computed them for training, one function per feature."""
+    rows = [[int(REFERENCE_EXTRACTORS[name](email_text.strip())) for name in FEATURES] for email_text in email_texts]
+    return np.array(rows, dtype=np.int64).reshape(len(rows), len(FEATURES))
+
+
+def registry_matrix(email_texts):
+    parsed_emails = parse_emails(email_texts)
+    return np.column_stack([REGISTRY[name].column(parsed_emails).astype(np.int64) for name in FEATURES])
+
+
+def store_matrix(email_texts):
+    columns = compute_columns(email_texts, FEATURES)
+    return np.column_stack([columns[name].astype(np.int64) for name in FEATURES])
+
+
+def compare(label, expected, actual, email_texts, limit=3):
+    """Prints the outcome of one comparison; returns whether it matched byte for byte."""
+    if expected.shape == actual.shape and expected.tobytes() == actual.tobytes():
+        print(f"{label:<10} {len(email_texts):>6} emails  identical")
+        return True
+    if expected.shape != actual.shape:
+        print(f"{label:<10} shape {actual.shape} instead of {expected.shape}")
+        return False
+    rows = np.flatnonzero((expected != actual).any(axis=1))
+    print(f"{label:<10} {len(email_texts):>6} emails  {len(rows)} rows differ")
+    for row in rows[:limit]:
+        columns = np.flatnonzero(expected[row] != actual[row])
+        differences = ", ".join(f"{FEATURES[j]} {expected[row, j]} != {actual[row, j]}" for j in columns)
+        print(f"    email {row} ({email_texts[row][:40]!r}): {differences}")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=500, help="Synthetic emails in the golden corpus")
+    args = parser.parse_args()
+
+    email_texts = generate_corpus(args.size) + TEXT_EDGE_CASES + RAW_EDGE_CASES
+    serving = feature_matrix(email_texts)
+
+    results = [
+        compare("training", serving, training_matrix(email_texts), email_texts),
+        compare("registry", serving, registry_matrix(email_texts), email_texts),
+        compare("store", serving, store_matrix(email_texts), email_texts),
+    ]
+
+    # Gmail hands out raw bytes; the app used to rebuild them as text before extracting features
+    raw_messages = [gmail_raw(email_text) for email_text in email_texts]
+    rebuilt = [extract_raw_email(email_bytes) for email_bytes in raw_messages]
+    gmail = np.array([ParsedGmailMessage(email_bytes).feature_vector() for email_bytes in raw_messages], np.int64)
+    results.append(compare("gmail", feature_matrix(rebuilt), gmail, rebuilt))
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+In-memory stand-in for the Gmail API client.
+
+It answers the same `service.users().messages()...execute()` and
+`users().history().list()` calls the app makes, with injectable latency and
+transient errors, so fetching and mailbox sync can be exercised and
+benchmarked without Google.
+
+`FakeGmailTransport` serves the same fake mailbox one level lower, as HTTP
+to the real googleapiclient service, and `FakeTokenEndpoint` stands in for
+Google's OAuth token endpoint, so credential handling and connection reuse
+can be measured offline too.
+"""
+import base64
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# History record keys and the historyTypes filter value that selects them
+HISTORY_TYPE_BY_KEY = {
+    "messagesAdded": "messageAdded",
+    "messagesDeleted": "messageDeleted",
+    "labelsAdded": "labelAdded",
+    "labelsRemoved": "labelRemoved",
+}
+
+
+class _FakeRequest:
+    def __init__(self, service, handler):
+        self._service = service
+        self._handler = handler
+
+    def execute(self):
+        return self._service._execute(self._handler)
+
+
+class _FakeMessages:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId, labelIds=None, maxResults=100, pageToken=None, **kwargs):
+        return _FakeRequest(self._service, lambda: self._service._list(labelIds, maxResults, pageToken))
+
+    def get(self, userId, id, format='full', **kwargs):
+        return _FakeRequest(self._service, lambda: self._service._get(id))
+
+
+class _FakeHistory:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, maxResults=100, **kwargs):
+        return _FakeRequest(
+            self._service, lambda: self._service._history(startHistoryId, historyTypes, pageToken, maxResults)
+        )
+
+
+class _FakeUsers:
+    def __init__(self, service):
+        self._service = service
+
+    def messages(self):
+        return _FakeMessages(self._service)
+
+    def history(self):
+        return _FakeHistory(self._service)
+
+    def getProfile(self, userId):
+        return _FakeRequest(self._service, lambda: {
+            "emailAddress": self._service.email_address,
+            "historyId": str(self._service.history_id),
+        })
+
+
+class FakeGmailService:
+    """
+    Fake Gmail service backed by a dict of raw messages.
+
+    Parameters:
+        latency (float): Seconds every request sleeps before answering
+        error_rate (float): Fraction of requests that fail with `error_status`
+        error_status (int): HTTP status of injected failures (429, 503, ...)
+        email_address (str): Address returned by getProfile
+        seed (int): Seed for the injected failures
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=429, email_address="me@example.com", seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.email_address = email_address
+        self.messages = {}  # message_id -> raw bytes
+        self.message_labels = {}  # message_id -> set of labels
+        self.history_id = 1000
+        self.history = []  # History records, oldest first
+        self.history_floor = self.history_id  # Older start IDs answer 404, like expired Gmail history
+        self.request_count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_corpus(cls, emails, spam_fraction=0.3, **kwargs):
+        """Builds a fake mailbox from raw email texts, putting roughly `spam_fraction` in SPAM."""
+        service = cls(**kwargs)
+        rng = random.Random(kwargs.get("seed", 0))
+        for email_text in emails:
+            label = "SPAM" if rng.random() < spam_fraction else "INBOX"
+            service.add_message(email_text, [label])
+        return service
+
+    def add_message(self, email_text, labels):
+        """Stores a message under the given labels and returns its ID."""
+        with self._lock:
+            message_id = f"{len(self.messages) + 1:016x}"
+            self.messages[message_id] = email_text.encode("utf-8") if isinstance(email_text, str) else email_text
+            self.message_labels[message_id] = set(labels)
+            self._record("messagesAdded", message_id)
+        return message_id
+
+    def delete_message(self, message_id):
+        with self._lock:
+            self.message_labels.pop(message_id)
+            self._record("messagesDeleted", message_id, labels=[])
+
+    def modify_labels(self, message_id, add=(), remove=()):
+        with self._lock:
+            labels = self.message_labels[message_id]
+            labels.update(add)
+            labels.difference_update(remove)
+            if add:
+                self._record("labelsAdded", message_id, changed=list(add))
+            if remove:
+                self._record("labelsRemoved", message_id, changed=list(remove))
+
+    def expire_history(self):
+        """Forgets all history so far; syncing from an older history ID then fails with 404."""
+        with self._lock:
+            self.history = []
+            self.history_floor = self.history_id
+
+    def _record(self, history_type, message_id, labels=None, changed=None):
+        self.history_id += 1
+        if labels is None:
+            labels = sorted(self.message_labels[message_id])
+        item = {"message": {"id": message_id, "labelIds": labels}}
+        if changed is not None:
+            item["labelIds"] = changed
+        self.history.append({"id": str(self.history_id), history_type: [item]})
+
+    def users(self):
+        return _FakeUsers(self)
+
+    def _execute(self, handler):
+        with self._lock:
+            self.request_count += 1
+            fail = self._rng.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise HttpError(httplib2.Response({"status": self.error_status}), b"injected failure")
+        return handler()
+
+    def _list(self, label_ids, max_results, page_token):
+        message_ids = sorted(
+            (message_id for message_id, labels in self.message_labels.items() if labels & set(label_ids or [])),
+            reverse=True  # IDs grow with every new message, so this is newest first
+        )
+        start = int(page_token or 0)
+        end = start + max_results
+        result = {"messages": [{"id": message_id} for message_id in message_ids[start:end]]}
+        if end < len(message_ids):
+            result["nextPageToken"] = str(end)
+        return result
+
+    def _history(self, start_history_id, history_types, page_token, max_results):
+        if int(start_history_id) < self.history_floor:
+            raise HttpError(httplib2.Response({"status": 404}), b"history id too old")
+        records = [record for record in self.history if int(record["id"]) > int(start_history_id)]
+        if history_types:
+            records = [
+                record for record in records
+                if any(HISTORY_TYPE_BY_KEY.get(key) in history_types for key in record)
+            ]
+        start = int(page_token or 0)
+        end = start + max_results
+        result = {"history": records[start:end], "historyId": str(self.history_id)}
+        if end < len(records):
+            result["nextPageToken"] = str(end)
+        return result
+
+    def _get(self, message_id):
+        raw = base64.urlsafe_b64encode(self.messages[message_id]).decode("ascii")
+        return {"id": message_id, "raw": raw}
+
+
+class _FakeHttp:
+    """One httplib2.Http connection to the fake Gmail API."""
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._connected = False
+        self.timeout = None
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if not self._connected:
+            time.sleep(self._transport.connect_latency)  # TCP and TLS handshake
+            self._connected = True
+        return self._transport._respond(uri, method, body, headers or {})
+
+
+class FakeGmailTransport:
+    """
+    Serves a FakeGmailService to the real Gmail client, as an httplib2 transport.
+
+    Use `http` as the http factory; every call opens a new connection whose
+    first request pays `connect_latency`. Requests without a bearer token get
+    a 401, like Gmail. Token refreshes google-auth sends through the transport
+    go to `token_endpoint`.
+
+    Parameters:
+        service (FakeGmailService): Mailbox, latency and injected errors
+        connect_latency (float): Seconds to open a connection
+        token_endpoint (FakeTokenEndpoint): Answers requests to the OAuth token URL
+    """
+
+    def __init__(self, service, connect_latency=0.0, token_endpoint=None):
+        self.service = service
+        self.connect_latency = connect_latency
+        self.token_endpoint = token_endpoint
+        self.connections = 0
+        self.tokens_seen = set()
+        self._lock = threading.Lock()
+
+    def http(self):
+        with self._lock:
+            self.connections += 1
+        return _FakeHttp(self)
+
+    def _respond(self, uri, method, body, headers):
+        if self.token_endpoint is not None and urlsplit(uri).path.endswith("/token"):
+            response = self.token_endpoint(uri, method, body, headers)
+            return httplib2.Response({"status": response.status, **response.headers}), response.data
+
+        authorization = {key.lower(): value for key, value in headers.items()}.get("authorization", "")
+        if not authorization.startswith("Bearer "):
+            return httplib2.Response({"status": 401}), b'{"error": "unauthenticated"}'
+        with self._lock:
+            self.tokens_seen.add(authorization[len("Bearer "):])
+
+        parts = urlsplit(uri)
+        query = parse_qs(parts.query)
+        path = parts.path.split("/users/me/", 1)[-1]
+        service = self.service
+        if path == "messages":
+            handler = lambda: service._list(query.get("labelIds"), int(query.get("maxResults", ["100"])[0]),
+                                            query.get("pageToken", [None])[0])
+        elif path.startswith("messages/"):
+            handler = lambda: service._get(path[len("messages/"):])
+        elif path == "history":
+            handler = lambda: service._history(query["startHistoryId"][0], query.get("historyTypes"),
+                                               query.get("pageToken", [None])[0],
+                                               int(query.get("maxResults", ["100"])[0]))
+        elif path == "profile":
+            handler = lambda: {"emailAddress": service.email_address, "historyId": str(service.history_id)}
+        else:
+            return httplib2.Response({"status": 404}), b'{"error": "not found"}'
+
+        try:
+            result = service._execute(handler)
+        except HttpError as error:
+            return httplib2.Response({"status": error.resp.status}), error.content
+        return httplib2.Response({"status": 200, "content-type": "application/json"}), json.dumps(result).encode()
+
+
+class _FakeAuthResponse:
+    def __init__(self, status, payload):
+        self.status = status
+        self.headers = {"content-type": "application/json"}
+        self.data = json.dumps(payload).encode()
+
+
+class FakeTokenEndpoint:
+    """
+    google.auth.transport.Request that answers OAuth refreshes with new access tokens.
+
+    Parameters:
+        latency (float): Seconds per refresh
+        expires_in (int): Lifetime of the issued tokens in seconds
+    """
+
+    def __init__(self, latency=0.0, expires_in=3600):
+        self.latency = latency
+        self.expires_in = expires_in
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.refreshes += 1
+            token = f"access-token-{self.refreshes}"
+        return _FakeAuthResponse(200, {"access_token": token, "expires_in": self.expires_in, "token_type": "Bearer"})
@@ -0,0 +1,69 @@
+"""
+Load test of the sync and async serving modes against the fake Gmail service.
+
+Run from the repository root (the model pickle must be in the working directory):
+    python -m testing.load_test_async --concurrency 8 --requests 20 --latency 0.05
+"""
+import argparse
+import os
+import threading
+import time
+
+# Every request should pay for fetching and classifying, not hit a warm cache
+os.environ.setdefault("CLASSIFICATION_CACHE_PATH", ":memory:")
+
+import api.app as app_module
+from api.classification_cache import get_cache
+from testing.fake_gmail import FakeGmailService
+from testing.sample_emails import generate_corpus
+
+ROUTES = ["/inbox-folder", "/spam-folder", "/inbox-folder?page_token=30", "/model-vs-gmail"]
+
+
+def run(label, concurrency, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client_loop(client_number):
+        client = app_module.app.test_client()
+        for i in range(requests_per_client):
+            route = ROUTES[(client_number + i) % len(ROUTES)]
+            start = time.perf_counter()
+            response = client.get(route)
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, (route, response.status_code)
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client_loop, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<6} {len(latencies) / wall:>8.2f} req/s   p50 {p50 * 1000:>8.1f} ms   p99 {p99 * 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake Gmail request")
+    args = parser.parse_args()
+
+    service = FakeGmailService.from_corpus(generate_corpus(300), latency=args.latency)
+    app_module.gmail_service_factory = lambda: (lambda: service)
+    get_cache().max_entries = 0  # Evict on every write, so nothing is served from cache
+
+    run("sync", args.concurrency, args.requests)
+    app_module.use_async_views()
+    run("async", args.concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    main()
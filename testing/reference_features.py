@@ -1,13 +1,13 @@
+"""
+Frozen copy of the feature functions the shipped models were trained with.
+
+Nothing serves or trains from these any more; features come from the
+registry in api/features.py. They are kept unchanged so that
+testing/check_feature_parity.py can prove the registry still produces the
+exact features the models saw in training.
+"""
 from email import message_from_string
 import re
-import pickle
-
-
-def load_model(filename):
-    with open(filename, 'rb') as file:
-        model = pickle.load(file)
-    print(f"Model loaded from {filename}")
-    return model
 
 
 def extract_headers(email_text):
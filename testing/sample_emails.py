@@ -0,0 +1,73 @@
+import base64
+import random
+
+# Building blocks for a synthetic corpus that looks like the Gmail/Enron mail we score
+SENDERS = [
+    "alice@example.com", "bob@company.org", "promo@free-offers.biz",
+    "news@cheapdeals.net", "support@bank-secure.com", "jane.doe@enron.com",
+]
+RECIPIENTS = [
+    "me@example.com", "team@company.org", "a@x.com, b@x.com, c@x.com",
+    "list@lists.example.com, ops@example.com", "",
+]
+SUBJECTS = [
+    "Meeting notes", "URGENT", "Your invoice is ready", "Congratulations, you are a winner!",
+    "Quarterly report for review", "Free trial ends today only", "Re: lunch?",
+]
+SENTENCES = [
+    "Please find the agenda for tomorrow's meeting below.",
+    "Click here to claim your prize before it expires soon.",
+    "The quarterly numbers look good, see https://reports.example.com/q3 for details.",
+    "Get rich with this secret formula, 100% free and risk-free!",
+    "Visit bit.ly/abc123 or http://tinyurl.com/xyz for a special deal.",
+    "Let me know if you have any questions about the contract.",
+    "Act now, limited time offer on crypto trading and forex signals.",
+    "Thanks for your help with the migration last week.",
+]
+ATTACHMENTS = ["report.pdf", "invoice.zip", "setup.exe", "photo.jpg", "notes.txt"]
+
+
+def _body(rng, num_sentences):
+    return " ".join(rng.choice(SENTENCES) for _ in range(num_sentences))
+
+
+def make_email(rng):
+    """Builds one raw email: plain text, html alternative or multipart with attachments."""
+    headers = [
+        f"Message-ID: <{rng.getrandbits(64):x}@example.com>",
+        "Date: Mon, 14 Oct 2024 10:00:00 +0000",
+        f"From: {rng.choice(SENDERS)}",
+        f"Subject: {rng.choice(SUBJECTS)}",
+        "Mime-Version: 1.0",
+    ]
+    to = rng.choice(RECIPIENTS)
+    if to:
+        headers.insert(3, f"To: {to}")
+
+    kind = rng.random()
+    text = _body(rng, rng.randint(2, 30))
+    if kind < 0.4:
+        headers.append("Content-Type: text/plain; charset=\"UTF-8\"")
+        return "\n".join(headers) + "\n\n" + text + "\n"
+
+    boundary = "boundary123"
+    parts = [f"--{boundary}\nContent-Type: text/plain; charset=\"UTF-8\"\n\n{text}\n"]
+    if kind < 0.7:
+        headers.append(f"Content-Type: multipart/alternative; boundary=\"{boundary}\"")
+        parts.append(f"--{boundary}\nContent-Type: text/html; charset=\"UTF-8\"\n\n<html><body><p>{text}</p></body></html>\n")
+    else:
+        headers.append(f"Content-Type: multipart/mixed; boundary=\"{boundary}\"")
+        for _ in range(rng.randint(1, 3)):
+            payload = base64.b64encode(rng.randbytes(rng.randint(200, 4000))).decode("ascii")
+            parts.append(
+                f"--{boundary}\nContent-Type: application/octet-stream\n"
+                f"Content-Disposition: attachment; filename=\"{rng.choice(ATTACHMENTS)}\"\n"
+                f"Content-Transfer-Encoding: base64\n\n{payload}\n"
+            )
+    return "\n".join(headers) + "\n\n" + "".join(parts) + f"--{boundary}--\n"
+
+
+def generate_corpus(size=5000, seed=42):
+    """Returns a reproducible list of `size` synthetic raw emails."""
+    rng = random.Random(seed)
+    return [make_email(rng) for _ in range(size)]
@@ -1,51 +1,15 @@
-from all_functions import (
-    extract_headers, count_words, count_links_and_domains, has_html,
-    count_attachments, count_suspicious_attachments, spam_score, count_suspicious_links,
-    is_fake_domain, is_missing_to, count_recipients, count_subject_words,
-    load_model
-)
-from uuid import uuid4
+from api.all_functions import extract_headers, load_model
+from api.features import feature_frame
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import FunctionTransformer
-import pandas as pd
-import re
-from email import message_from_string
-# from data_for_testing import spam_dict, non_spam_dict
-from data_for_testing import fetch_and_format_emails
+from testing.data_for_testing import fetch_and_format_emails
 
+# Run from the repository root: python -m testing.testing_logistic_regression_model
 
 
 def transform_email(message_text):
-    """Transforms an email message into a DataFrame of features"""
-
-    features = [
-    "num_words", "num_links", "num_attachments", "num_suspicious_attachments",
-    "has_html", "spam_score", "num_suspicious_links", "is_fake_domain",
-    "is_missing_to", "num_recipients", "num_subject_words"
-]
-    email_text = message_text[0].strip()
-    headers = extract_headers(email_text)
-    
-    data = {
-        "email_id": str(uuid4()),  # Generate a unique ID
-        "from": headers["from"],
-        "to": headers["to"],
-        "subject": headers["subject"],
-        "date": headers["date"],
-        "body": headers["body"],
-        "num_words": count_words(email_text),
-        "num_links": count_links_and_domains(email_text),
-        "num_attachments": count_attachments(email_text),
-        "num_suspicious_attachments": count_suspicious_attachments(email_text),
-        "has_html": has_html(email_text),
-        "spam_score": spam_score(email_text),
-        "num_suspicious_links": count_suspicious_links(email_text),
-        "is_fake_domain": is_fake_domain(email_text),
-        "is_missing_to": is_missing_to(email_text),
-        "num_recipients": count_recipients(email_text),
-        "num_subject_words": count_subject_words(email_text),
-    }
-    return pd.DataFrame([data])[features].astype(int)
+    """Transforms email messages into a DataFrame of features, with the same extractors as serving"""
+    return feature_frame(message_text)
 
 
 # Define a pipeline to process emails